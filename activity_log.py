@@ -0,0 +1,595 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Reading of activity logs for the evaluator, including a binary cache of already parsed logs.
+
+The cache is a sidecar file LOG.evcache holding everything the evaluator needs from the log:
+events serialized for contestants (ids included, anomaly information removed) and packed
+columns of users, unix timestamps and anomaly labels. It is keyed by the size and modification
+time of the log, and by a hash of the log content, which is computed only when the size or time
+differ (or with --verify), so that opening an up-to-date cache doesn't read the log at all.
+A stale or missing cache is ignored and the log is parsed as usual.
+
+Logs can be gzipped (LOG.gz), the cache is the same as for the uncompressed log.
+
+The index is a much smaller sidecar file LOG.evindex with the byte offset, user and unix timestamp of every line,
+keyed the same way. Evaluation of some users or of a time range (see `select_records`) reads only the matching
+lines of the log (or of its cache) and keeps their original line numbers as event ids.
+
+Compile the cache and the index for all logs:
+    ./activity_log.py data/*.log
+
+Compile only the index (of logs too large to be cached):
+    ./activity_log.py --index-only huge.log
+
+Check the caches and indexes of all logs by the content hash, compile only the stale or missing ones:
+    ./activity_log.py --verify data/*.log
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import logging
+import bisect
+import hashlib
+import gzip
+import json
+import mmap
+import struct
+import shutil
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_SUFFIX = '.evcache'
+CACHE_MAGIC = b'RBEVC002'
+# magic, SHA-1, size and modification time of the log, number of events, length of JSON list of users
+CACHE_HEADER = struct.Struct('<8s20sQdQQ')
+# columns following the list of users (8-byte aligned), one value per event
+# (json_offsets has one more value: the end of the last event)
+EPOCH = struct.Struct('<q')
+JSON_OFFSET = struct.Struct('<Q')
+USER_CODE = struct.Struct('<I')
+LABEL = struct.Struct('<B')
+
+INDEX_SUFFIX = '.evindex'
+INDEX_MAGIC = b'RBEVI002'
+# magic, SHA-1, size and modification time of the log, number of events, length of JSON list of users, flags;
+# followed by the list of users (8-byte aligned) and columns: epochs, line offsets (one more value:
+# the end of the last line) and user codes
+INDEX_HEADER = struct.Struct('<8s20sQdQQQ')
+LOG_STAMP = struct.Struct('<Qd')  # size and modification time of the log, at the same offset in both headers
+LOG_STAMP_OFFSET = 28
+CHRONOLOGICAL = 1  # flag of logs with non-decreasing timestamps, time ranges are found by bisection
+COLUMN_BATCH = 65536  # values of a column packed at once while compiling
+
+
+def parse_lines(lines):
+    """
+    Generator of parsed activity logs, the part of event processing independent of contestants.
+
+    Args:
+        lines: iterable of activity logs as serialized JSON strings
+
+    Returns: (event_id, unix_timestamp, user, is_anomaly, event_JSON_serialized_as_string)
+
+    """
+    for line_num, line in enumerate(lines):
+        if not line:
+            break
+        yield parse_line(line_num, line)
+
+
+def parse_line(line_num, line):
+    """
+    Returns: (event_id, unix_timestamp, user, is_anomaly, event_JSON_serialized_as_string) of line `line_num`
+    """
+    # process line input to dictionary
+    data = json.loads(line)
+    # add id information
+    data['id'] = line_num
+    is_anomaly = data.pop('is_anomaly', 0)  # remove anomaly information from data for contestants
+    # serialized JSON as string representing one event
+    return line_num, int(data['unix_timestamp']), data['user'], is_anomaly, json.dumps(data)
+
+
+def open_log(log_path):
+    """
+    Returns:
+        file of the log for reading lines, decompressed if its name ends with .gz
+    """
+    if log_path.endswith('.gz'):
+        return gzip.open(log_path, 'rb')
+    return open(log_path)
+
+
+def content_hash(path):
+    """
+    Returns:
+        SHA-1 digest of the content of file `path`
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def log_stamp(log_path):
+    """
+    Returns:
+        (size, modification time) of the log, stored in its cache and index
+    """
+    stat = os.stat(log_path)
+    return stat.st_size, stat.st_mtime
+
+
+def is_current(sidecar, path, log_path, digest=None, verify=False):
+    """
+    A sidecar of a log with the same content but a different size or modification time (touched or copied)
+    is stamped with the current ones, so that the log isn't hashed again next time.
+
+    Args:
+        sidecar: EventCache or LogIndex
+        path: path of the sidecar file
+        log_path: path of the log
+        digest: SHA-1 of the log, if it is already known
+        verify (bool): compare the content hash even if the size and modification time of the log are the same
+
+    Returns:
+        True if `sidecar` was compiled from the current content of the log
+
+    """
+    stamp = log_stamp(log_path)
+    if not verify and (sidecar.log_size, sidecar.log_mtime) == stamp:
+        return True
+    if (digest or content_hash(log_path)) != sidecar.log_digest:
+        return False
+    if (sidecar.log_size, sidecar.log_mtime) != stamp:
+        try:
+            with open(path, 'r+b') as f:
+                f.seek(LOG_STAMP_OFFSET)
+                f.write(LOG_STAMP.pack(*stamp))
+        except EnvironmentError as e:
+            logger.info('keeping the old stamp of %s: %s', path, e)
+    return True
+
+
+def cache_path(log_path):
+    return log_path + CACHE_SUFFIX
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+class _ColumnWriter(object):
+    """Column of packed values written to a temporary file in batches, so that compiling keeps no list per event."""
+
+    def __init__(self, packing, directory):
+        self.format = '<%%i%s' % packing.format[-1]
+        self.size = packing.size
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.batch = []
+        self.count = 0  # number of values
+
+    def append(self, value):
+        self.batch.append(value)
+        if len(self.batch) >= COLUMN_BATCH:
+            self._write_batch()
+
+    def _write_batch(self):
+        self.file.write(struct.pack(self.format % len(self.batch), *self.batch))
+        self.count += len(self.batch)
+        del self.batch[:]
+
+    def copy_to(self, output):
+        """Write the column to `output`, padded to 8 bytes."""
+        self._write_batch()
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, output)
+        self.file.close()
+        output.write(_padding(self.size * self.count))
+
+
+def compile_cache(log_path, digest=None):
+    """
+    Parse the log once and store it to the sidecar cache file (written atomically). Columns and events
+    are streamed through temporary files, memory doesn't grow with the log (except for its users).
+
+    Args:
+        log_path: path of the log
+        digest: SHA-1 of the log, if it is already known
+
+    Returns:
+        path of the cache
+
+    """
+    stamp = log_stamp(log_path)
+    digest = digest or content_hash(log_path)
+    user_codes = {}
+    path = cache_path(log_path)
+    directory = os.path.dirname(os.path.abspath(path))
+    epochs, json_offsets = _ColumnWriter(EPOCH, directory), _ColumnWriter(JSON_OFFSET, directory)
+    codes, labels = _ColumnWriter(USER_CODE, directory), _ColumnWriter(LABEL, directory)
+    size, json_offset = 0, 0
+    json_offsets.append(json_offset)
+    with tempfile.TemporaryFile(dir=directory) as dumps:
+        with open_log(log_path) as log_file:
+            for _, epoch, user, is_anomaly, str_dump in parse_lines(log_file):
+                size += 1
+                epochs.append(epoch)
+                codes.append(user_codes.setdefault(user, len(user_codes)))
+                labels.append(1 if is_anomaly else 0)
+                dumps.write(str_dump)
+                json_offset += len(str_dump)
+                json_offsets.append(json_offset)
+        users = sorted(user_codes, key=user_codes.get)
+        users_json = json.dumps(users).encode('utf-8')
+
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(CACHE_HEADER.pack(CACHE_MAGIC, digest, stamp[0], stamp[1], size, len(users_json)))
+            f.write(users_json + _padding(len(users_json)))
+            for column in (epochs, json_offsets, codes, labels):
+                column.copy_to(f)
+            dumps.seek(0)
+            shutil.copyfileobj(dumps, f)
+    os.rename(tmp_path, path)
+    logger.info('compiled %i events of %s to %s', size, log_path, path)
+    return path
+
+
+class EventCache(object):
+    """Memory-mapped cache of a parsed log, see `compile_cache`."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: path of the cache file (see `is_current` for its validation against the log)
+
+        """
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < CACHE_HEADER.size:
+            raise ValueError('%s is not an event cache' % path)
+        magic, self.log_digest, self.log_size, self.log_mtime, self.size, users_length = CACHE_HEADER.unpack_from(
+            self.mmap)
+        if magic != CACHE_MAGIC:
+            raise ValueError('%s is not an event cache of this version' % path)
+
+        offset = CACHE_HEADER.size
+        self.users = json.loads(self.mmap[offset:offset + users_length].decode('utf-8'))
+        offset += users_length + len(_padding(users_length))
+        self.epochs_offset = offset
+        offset += EPOCH.size * self.size
+        self.json_offsets_offset = offset
+        offset += JSON_OFFSET.size * (self.size + 1)
+        self.codes_offset = offset
+        offset += USER_CODE.size * self.size + len(_padding(USER_CODE.size * self.size))
+        self.labels_offset = offset
+        offset += LABEL.size * self.size + len(_padding(self.size))
+        self.json_offset = offset
+        if self.json_offset + self._json_offset(self.size) != len(self.mmap):
+            raise ValueError('%s is truncated' % path)
+
+    def _json_offset(self, num):
+        return JSON_OFFSET.unpack_from(self.mmap, self.json_offsets_offset + JSON_OFFSET.size * num)[0]
+
+    def record(self, num):
+        """
+        Returns: event `num` in the same format as `parse_lines`
+        """
+        data = self.mmap
+        start = self.json_offset + self._json_offset(num)
+        end = self.json_offset + self._json_offset(num + 1)
+        epoch = EPOCH.unpack_from(data, self.epochs_offset + EPOCH.size * num)[0]
+        code = USER_CODE.unpack_from(data, self.codes_offset + USER_CODE.size * num)[0]
+        is_anomaly = LABEL.unpack_from(data, self.labels_offset + num)[0]
+        return num, epoch, self.users[code], is_anomaly, data[start:end]
+
+    def records(self):
+        """
+        Generator of events in the same format as `parse_lines`, read from the mapped file without parsing
+        (each event string is a copy of its bytes in the file).
+
+        Returns: (event_id, unix_timestamp, user, is_anomaly, event_JSON_serialized_as_string)
+
+        """
+        data, users = self.mmap, self.users
+        start = self.json_offset
+        for num in xrange(self.size):
+            end = self.json_offset + self._json_offset(num + 1)
+            epoch = EPOCH.unpack_from(data, self.epochs_offset + EPOCH.size * num)[0]
+            code = USER_CODE.unpack_from(data, self.codes_offset + USER_CODE.size * num)[0]
+            is_anomaly = LABEL.unpack_from(data, self.labels_offset + num)[0]
+            yield num, epoch, users[code], is_anomaly, data[start:end]
+            start = end
+
+    def close(self):
+        self.mmap.close()
+
+
+def open_cache(log_path, digest=None, verify=False):
+    """
+    Args:
+        log_path: path of the log
+        digest: SHA-1 of the log, if it is already known
+        verify (bool): check the cache by the content hash of the log (see `is_current`)
+
+    Returns:
+        EventCache of the log, None if the cache is missing or doesn't match content of the log
+
+    """
+    path = cache_path(log_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        cache = EventCache(path)
+        if is_current(cache, path, log_path, digest, verify):
+            return cache
+        cache.close()
+        raise ValueError('%s is stale' % path)
+    except (ValueError, struct.error, EnvironmentError) as e:
+        logger.warning('ignoring event cache: %s', e)
+        return None
+
+
+def read_records(log_path):
+    """
+    Generator of parsed events of the log (see `parse_lines`), from its cache if it is up to date.
+
+    Returns: (event_id, unix_timestamp, user, is_anomaly, event_JSON_serialized_as_string)
+
+    """
+    cache = open_cache(log_path)
+    if cache is None:
+        with open_log(log_path) as log_file:
+            for record in parse_lines(log_file):
+                yield record
+        return
+    try:
+        for record in cache.records():
+            yield record
+    finally:
+        cache.close()
+
+
+def index_path(log_path):
+    return log_path + INDEX_SUFFIX
+
+
+def compile_index(log_path, digest=None):
+    """
+    Read the log once and store offsets, users and timestamps of its lines to the sidecar index file
+    (written atomically, columns are streamed through temporary files). Offsets of gzipped logs are offsets
+    in the decompressed log.
+
+    Args:
+        log_path: path of the log
+        digest: SHA-1 of the log, if it is already known
+
+    Returns:
+        path of the index
+
+    """
+    stamp = log_stamp(log_path)
+    digest = digest or content_hash(log_path)
+    user_codes = {}
+    path = index_path(log_path)
+    directory = os.path.dirname(os.path.abspath(path))
+    epochs, line_offsets = _ColumnWriter(EPOCH, directory), _ColumnWriter(JSON_OFFSET, directory)
+    codes = _ColumnWriter(USER_CODE, directory)
+    chronological = True
+    size, last_epoch, line_offset = 0, None, 0
+    line_offsets.append(line_offset)
+    with open_log(log_path) as log_file:
+        for line in log_file:
+            data = json.loads(line)
+            epoch = int(data['unix_timestamp'])
+            if last_epoch is not None and epoch < last_epoch:
+                chronological = False
+            last_epoch = epoch
+            size += 1
+            epochs.append(epoch)
+            codes.append(user_codes.setdefault(data['user'], len(user_codes)))
+            line_offset += len(line)
+            line_offsets.append(line_offset)
+    users = sorted(user_codes, key=user_codes.get)
+    users_json = json.dumps(users).encode('utf-8')
+
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_HEADER.pack(
+            INDEX_MAGIC, digest, stamp[0], stamp[1], size, len(users_json), CHRONOLOGICAL if chronological else 0))
+        f.write(users_json + _padding(len(users_json)))
+        for column in (epochs, line_offsets, codes):
+            column.copy_to(f)
+    os.rename(tmp_path, path)
+    logger.info('indexed %i events of %s to %s', size, log_path, path)
+    return path
+
+
+class _Column(object):
+    """Read-only sequence of packed values in a mapped file (e.g. for `bisect`)."""
+
+    def __init__(self, data, packing, offset, size):
+        self.data = data
+        self.packing = packing
+        self.offset = offset
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, num):
+        if not 0 <= num < self.size:
+            raise IndexError(num)
+        return self.packing.unpack_from(self.data, self.offset + self.packing.size * num)[0]
+
+    def values(self, start, end):
+        """Returns: tuple of values from `start` to `end` (exclusive)"""
+        return struct.unpack_from(
+            '<%i%s' % (end - start, self.packing.format[-1]), self.data, self.offset + self.packing.size * start)
+
+
+class LogIndex(object):
+    """Memory-mapped index of a log, see `compile_index`."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path: path of the index file (see `is_current` for its validation against the log)
+
+        """
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mmap) < INDEX_HEADER.size:
+            raise ValueError('%s is not a log index' % path)
+        (magic, self.log_digest, self.log_size, self.log_mtime, self.size, users_length,
+         flags) = INDEX_HEADER.unpack_from(self.mmap)
+        if magic != INDEX_MAGIC:
+            raise ValueError('%s is not a log index of this version' % path)
+        self.chronological = bool(flags & CHRONOLOGICAL)
+
+        offset = INDEX_HEADER.size
+        self.users = json.loads(self.mmap[offset:offset + users_length].decode('utf-8'))
+        offset += users_length + len(_padding(users_length))
+        self.epochs = _Column(self.mmap, EPOCH, offset, self.size)
+        offset += EPOCH.size * self.size
+        self.line_offsets = _Column(self.mmap, JSON_OFFSET, offset, self.size + 1)
+        offset += JSON_OFFSET.size * (self.size + 1)
+        self.codes = _Column(self.mmap, USER_CODE, offset, self.size)
+        offset += USER_CODE.size * self.size + len(_padding(USER_CODE.size * self.size))
+        if offset != len(self.mmap):
+            raise ValueError('%s is truncated' % path)
+
+    def select(self, users=None, start=None, end=None):
+        """
+        Args:
+            users: collection of users to select (default: all users)
+            start (int): unix timestamp of the first selected second (default: the beginning of the log)
+            end (int): unix timestamp of the first second after the selection (default: the end of the log)
+
+        Returns:
+            sequence of ids (line numbers) of the selected events, in the order of the log
+
+        """
+        first, last = 0, self.size
+        if self.chronological:
+            # bisection reads only a few timestamps from the index
+            if start is not None:
+                first = bisect.bisect_left(self.epochs, start, first, last)
+            if end is not None:
+                last = bisect.bisect_left(self.epochs, end, first, last)
+            selected = xrange(first, last)
+        else:
+            selected = [
+                num for num, epoch in enumerate(self.epochs.values(first, last))
+                if (start is None or epoch >= start) and (end is None or epoch < end)]
+        if users is not None:
+            wanted = set(code for code, user in enumerate(self.users) if user in users)
+            if self.chronological:
+                codes = self.codes.values(first, last)
+                selected = [num for num, code in enumerate(codes, first) if code in wanted]
+            else:
+                selected = [num for num in selected if self.codes[num] in wanted]
+        return selected
+
+    def close(self):
+        self.mmap.close()
+
+
+def open_index(log_path, digest=None, verify=False):
+    """
+    Args:
+        log_path: path of the log
+        digest: SHA-1 of the log, if it is already known
+        verify (bool): check the index by the content hash of the log (see `is_current`)
+
+    Returns:
+        LogIndex of the log, None if the index is missing or doesn't match content of the log
+
+    """
+    path = index_path(log_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        index = LogIndex(path)
+        if is_current(index, path, log_path, digest, verify):
+            return index
+        index.close()
+        raise ValueError('%s is stale' % path)
+    except (ValueError, struct.error, EnvironmentError) as e:
+        logger.warning('ignoring log index: %s', e)
+        return None
+
+
+def select_records(log_path, users=None, start=None, end=None):
+    """
+    Generator of parsed events of some users and/or of a time range (see `LogIndex.select`), read from the cache
+    if it is up to date, otherwise from the matching lines of the log. Events keep their line numbers as ids.
+    A missing or stale index is compiled first.
+
+    Returns: (event_id, unix_timestamp, user, is_anomaly, event_JSON_serialized_as_string)
+
+    """
+    index = open_index(log_path)
+    if index is None:
+        index = LogIndex(compile_index(log_path))
+    try:
+        selected = index.select(users, start, end)
+        logger.info('selected %i of %i events of %s', len(selected), index.size, log_path)
+        cache = open_cache(log_path)
+        if cache is not None:
+            try:
+                for num in selected:
+                    yield cache.record(num)
+            finally:
+                cache.close()
+            return
+        with open_log(log_path) as log_file:
+            line_offsets = index.line_offsets
+            for num in selected:
+                offset = line_offsets[num]
+                log_file.seek(offset)
+                yield parse_line(num, log_file.read(line_offsets[num + 1] - offset))
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('logs', nargs='+', help="paths to files with activity logs")
+    parser.add_argument('--index-only', action='store_true', help="compile only the index, not the cache")
+    parser.add_argument(
+        '--verify', action='store_true',
+        help="check existing caches and indexes by the content hash of the logs, compile only stale or missing ones")
+
+    args = parser.parse_args()
+    for log_path in args.logs:
+        digest = content_hash(log_path)
+        sidecars = [(open_index, compile_index, index_path)]
+        if not args.index_only:
+            sidecars.insert(0, (open_cache, compile_cache, cache_path))
+        for open_sidecar, compile_sidecar, sidecar_path in sidecars:
+            sidecar = open_sidecar(log_path, digest, verify=True) if args.verify else None
+            if sidecar is None:
+                compile_sidecar(log_path, digest)
+            else:
+                sidecar.close()
+                logger.info('%s is up to date', sidecar_path(log_path))
@@ -0,0 +1,335 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Measure the throughput of the evaluator itself: simulations of calibrated stub contestants (see stub_contestant.py)
+on synthetic logs of increasing size (see generate_log.py). Every simulation runs in its own process, which
+reports wall time and CPU time of the evaluator (the harness) separately from the resources of the contestant:
+
+    events              events sent to the contestant (all events of the log, unless the simulation aborted)
+    events_per_second   events / wall time of the simulation
+    harness_cpu_time    CPU seconds of the evaluator process (reading the log, pipes, checks, trace)
+    harness_peak_rss    peak resident memory of the evaluator process in bytes
+    overhead_per_event  harness_cpu_time / events
+    aborted             why the stub stopped before the end of the log (None if it processed the whole log)
+
+Aborted simulations measure only a part of the log, they are reported and never compared with the baseline.
+
+Besides the stubs, `replay` evaluates the log without any contestant (`Evaluator.replay_reports`), the cost
+of `Evaluator.events`, `process_msg` and `_anomaly_check` alone. Times of the simulation and of `finish`
+are stored as phases of each result.
+
+Run the benchmark and store the results:
+    ./benchmark.py --sizes 10000 100000 1000000 --output benchmark.json
+
+Run it again after a change, compare against the stored results and fail on a slowdown by more than 20 %:
+    ./benchmark.py --sizes 10000 100000 1000000 --output new.json --baseline benchmark.json --tolerance 0.2
+
+Measure the evaluator with the full file trace, keeping the fastest of 3 runs of the null contestant:
+    ./benchmark.py --stubs ok --trace-file debug --repeat 3
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import time
+
+import evaluator
+from evaluator import Evaluator
+from activity_log import compile_cache
+from generate_log import LogProfile, generate
+from instrumentation import SimulationStats
+import trace_log
+
+
+logger = logging.getLogger(__name__)
+
+STUB_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_contestant.py')
+STUBS = ('replay', 'ok', 'report-all', 'delay', 'burst')
+DEFAULT_LEARN_LOGS = ['data/competition_train_v1.log', 'data/competition_test_v1.log']
+# metrics compared against the baseline: name=>True if higher is better
+COMPARED_METRICS = {
+    'events_per_second': True,
+    'harness_cpu_time': False,
+    'overhead_per_event': False,
+}
+
+
+def stub_command(stub, delay=0.001, burst=100):
+    """
+    Returns:
+        command of stub contestant `stub` (None for `replay`, evaluated without a contestant)
+    """
+    if stub == 'replay':
+        return None
+    command = [sys.executable, STUB_SCRIPT, stub]
+    if stub == 'delay':
+        command += ['--delay', repr(delay)]
+    elif stub == 'burst':
+        command += ['--burst', str(burst)]
+    return command
+
+
+def prepare_log(profile, work_dir, events, seed=0):
+    """
+    Generate a log of about `events` events (or reuse it from a previous run) and compile its cache,
+    so that all simulations read the log the same way.
+
+    Returns:
+        path of the log
+    """
+    log_path = os.path.join(work_dir, 'events-%i-seed-%s.log' % (events, seed))
+    if not os.path.exists(log_path):
+        logger.info('generating %s', log_path)
+        generate(profile, log_path, events, seed=seed, processes=1)
+    compile_cache(log_path)
+    return log_path
+
+
+def _harness_usage():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_case(
+        stub, log_path, window=1, delay=0.001, burst=100, trace_level='off', trace_path=None, wire='json',
+        transport='pipe'):
+    """
+    Evaluate one stub contestant on one log in the current process.
+
+    Returns:
+        dict of measured metrics
+    """
+    trace = trace_log.configure(evaluator.logger, 'off', trace_level, trace_path)
+    cpu_start = _harness_usage()
+    start = time.time()
+    ev = Evaluator(log_path, window=window)
+    command = stub_command(stub, delay, burst)
+    stats = SimulationStats() if command else None
+    if command:
+        evaluator.simulate(command, ev, stats, wire, transport)
+    else:
+        ev.replay_reports(set())
+    simulated = time.time()
+    with open(os.devnull, 'w') as devnull:
+        ev.finish(output_file=devnull)
+    finished = time.time()
+    trace.close()
+    harness_cpu_time = _harness_usage() - cpu_start
+
+    # events left in the log after an abort never went through the harness
+    events = sum(ev.user_event_counts) - ev.not_sent
+    result = {
+        'stub': stub,
+        'log': os.path.basename(log_path),
+        'events': events,
+        'window': window,
+        'wire': wire,
+        'transport': transport,
+        'wall_time': finished - start,
+        'events_per_second': events / (simulated - start) if simulated > start else None,
+        'harness_cpu_time': harness_cpu_time,
+        'harness_peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,  # kilobytes on Linux
+        'overhead_per_event': harness_cpu_time / events if events else None,
+        'phases': {'simulate': simulated - start, 'finish': finished - simulated},
+        'aborted': ev.exit_report[0] if ev.exit_report else None,
+        'contestant': None,
+        'latency': None,
+    }
+    if stats is not None:
+        summary = stats.summary()
+        result['contestant'] = summary['contestant']
+        result['latency'] = summary['latency']
+    return result
+
+
+def _run_case(connection, args, kwargs):
+    try:
+        connection.send(run_case(*args, **kwargs))
+    except Exception as err:
+        connection.send(err)
+    finally:
+        connection.close()
+
+
+def run_isolated(*args, **kwargs):
+    """
+    `run_case` in a new process, so that CPU time and peak memory of the harness belong to one simulation.
+
+    Returns:
+        dict of measured metrics
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_run_case, args=(sender, args, kwargs))
+    process.start()
+    sender.close()
+    result = receiver.recv()
+    process.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare `results` with `baseline` results of the same stubs on logs of the same size. Aborted simulations
+    (in `results` or in `baseline`) are skipped.
+
+    Args:
+        results (list): results of `run_case`
+        baseline (list): stored results of `run_case`
+        tolerance (float): allowed relative slowdown (0.2 = 20 %)
+
+    Returns:
+        list of (stub, events, metric, baseline value, new value, relative change, is regression)
+
+    """
+    def key(result):
+        return (
+            result['stub'], result['events'], result['window'], result.get('wire', 'json'),
+            result.get('transport', 'pipe'))
+
+    stored = dict((key(result), result) for result in baseline)
+    rows = []
+    for result in results:
+        old = stored.get(key(result))
+        if old is None or result.get('aborted') or old.get('aborted'):
+            continue
+        for metric, higher_is_better in sorted(COMPARED_METRICS.items()):
+            old_value, new_value = old.get(metric), result.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = 1.0 * (new_value - old_value) / old_value
+            regression = -change > tolerance if higher_is_better else change > tolerance
+            rows.append((result['stub'], result['events'], metric, old_value, new_value, change, regression))
+    return rows
+
+
+def environment():
+    """Returns: description of the machine the benchmark runs on (results are comparable only on the same one)"""
+    return {
+        'date': datetime.datetime.now().isoformat(),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'python': sys.version.split()[0],
+        'cpus': multiprocessing.cpu_count(),
+    }
+
+
+def print_results(results, output=sys.stdout):
+    print('\t'.join(['stub', 'events', 'events/s', 'harness_cpu', 'peak_rss_mb', 'us/event']), file=output)
+    for result in results:
+        print('\t'.join([
+            result['stub'], '%i' % result['events'], '%0.0f' % (result['events_per_second'] or 0),
+            '%0.3f' % result['harness_cpu_time'], '%0.1f' % (result['harness_peak_rss'] / 1048576.0),
+            '%0.2f' % ((result['overhead_per_event'] or 0) * 1e6)]), file=output)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10000, 100000],
+        help="expected numbers of events of the synthetic logs (default: 10000 100000)")
+    parser.add_argument(
+        '--logs', nargs='+',
+        help="benchmark these logs instead of synthetic ones (--sizes are ignored)")
+    parser.add_argument(
+        '--learn', nargs='+', default=DEFAULT_LEARN_LOGS,
+        help="logs the synthetic logs are learned from (default: %s)" % ' '.join(DEFAULT_LEARN_LOGS))
+    parser.add_argument('--seed', default='0', help="seed of the synthetic logs (default: 0)")
+    parser.add_argument(
+        '--stubs', nargs='+', choices=STUBS, default=list(STUBS),
+        help="stub contestants to run (default: all)")
+    parser.add_argument(
+        '--delay', type=float, default=0.001, help="seconds before acknowledging an event by `delay` (default: 0.001)")
+    parser.add_argument(
+        '--burst', type=int, default=100, help="number of events reported at once by `burst` (default: 100)")
+    parser.add_argument(
+        '-w', '--window', type=int, default=1,
+        help="max number of events sent to the stub and not acknowledged yet (default: 1)")
+    parser.add_argument(
+        '--wire', choices=evaluator.WIRE_FORMATS, default='json',
+        help="format of events sent to the stubs (default: json)")
+    parser.add_argument(
+        '--transport', choices=evaluator.TRANSPORTS, default='pipe',
+        help="channel to the stubs (default: pipe)")
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help="run each simulation REPEAT times and keep the fastest one, to reduce noise (default: 1)")
+    parser.add_argument(
+        '--trace-file', choices=sorted(trace_log.TRACE_LEVELS), default='off',
+        help="trace level of WORK_DIR/benchmark.log, to include the cost of the trace (default: off)")
+    parser.add_argument(
+        '--work-dir', default='benchmark_logs', help="directory of synthetic logs (default: benchmark_logs)")
+    parser.add_argument('-o', '--output', default='benchmark.json', help="JSON with results (default: benchmark.json)")
+    parser.add_argument('--baseline', help="JSON with results of a previous run to compare with")
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help="relative slowdown against the baseline reported as a regression (default: 0.2)")
+
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be a positive number")
+    if args.logs:
+        log_paths = args.logs
+    else:
+        if not os.path.isdir(args.work_dir):
+            os.makedirs(args.work_dir)
+        profile = LogProfile(args.learn)
+        log_paths = [prepare_log(profile, args.work_dir, events, args.seed) for events in sorted(args.sizes)]
+
+    results = []
+    for log_path in log_paths:
+        for stub in args.stubs:
+            logger.info('running %s on %s', stub, log_path)
+            runs = [
+                run_isolated(
+                    stub, log_path, window=args.window, delay=args.delay, burst=args.burst,
+                    trace_level=args.trace_file, trace_path=os.path.join(args.work_dir, 'benchmark.log'),
+                    wire=args.wire, transport=args.transport)
+                for _ in range(args.repeat)]
+            results.append(min(runs, key=lambda result: result['wall_time']))
+    print_results(results)
+    aborted = [result for result in results if result['aborted']]
+    for result in aborted:
+        logger.error(
+            '%s on %s aborted after %i events: %s', result['stub'], result['log'], result['events'], result['aborted'])
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline['results'], args.tolerance)
+        print()
+        print('\t'.join(['stub', 'events', 'metric', 'baseline', 'new', 'change']))
+        for stub, events, metric, old_value, new_value, change, regression in rows:
+            print('\t'.join([
+                stub, '%i' % events, metric, '%g' % old_value, '%g' % new_value,
+                '%+0.1f %%%s' % (change * 100, ' REGRESSION' if regression else '')]))
+        if baseline['environment'].get('host') != platform.node():
+            logger.warning(
+                'the baseline was measured on %s, results are not comparable', baseline['environment'].get('host'))
+        if any(row[-1] for row in rows):
+            sys.exit(1)
+    if aborted:
+        sys.exit(1)
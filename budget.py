@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Limits of contestants' scripts which don't depend on how busy the host is (./evaluator.py --budget cpu).
+
+By default, `evaluator.TIME_LIMIT` (per event) is in wall-clock seconds, so scripts evaluated in parallel on one
+host time out just because they wait for a core. With the `cpu` budget, the script is charged only CPU time it used
+itself (user and system time of all its threads and reaped children, from /proc/PID/stat), so timeouts and scores
+are the same no matter how many evaluations share the host. A script which doesn't use CPU while the evaluator waits
+for it (sleeping, blocked) still times out after `WALL_LIMIT_FACTOR` times the limit in wall-clock seconds.
+The `cpu` budget also enforces `evaluator.PROGRAM_TIME_LIMIT` CPU seconds per log: a script over it is stopped and
+the rest of the log is not reported.
+
+Besides, scripts can be pinned to a set of cores (--cpus, in the format of `taskset -c`, e.g. `0-3,8`) and get
+resource limits (--rlimit NAME=VALUE, see `man setrlimit`, e.g. `as=4G` or `nofile=256`), both applied in the
+process of the script before it starts.
+"""
+
+import os
+import ctypes
+import ctypes.util
+import resource
+
+
+BUDGETS = ('wall', 'cpu')
+WALL_LIMIT_FACTOR = 10  # wall-clock limit of the `cpu` budget, in multiples of the CPU time limit
+SIZE_SUFFIXES = {'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30}
+
+
+def parse_cpus(value):
+    """
+    Args:
+        value (str): cores in the format of `taskset -c`, e.g. `0-3,8`
+
+    Returns:
+        sorted list of core numbers
+
+    """
+    cpus = set()
+    for part in value.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not first.isdigit() or (sep and not last.isdigit()):
+            raise ValueError('`%s` is not a set of cores, e.g. 0-3,8' % value)
+        cpus.update(range(int(first), int(last if sep else first) + 1))
+    return sorted(cpus)
+
+
+def parse_rlimit(value):
+    """
+    Args:
+        value (str): `NAME=VALUE`, name of `resource.RLIMIT_NAME` in lower case, value with an optional
+            K, M or G suffix (powers of 1024)
+
+    Returns:
+        (resource.RLIMIT_NAME, value)
+
+    """
+    name, sep, limit = value.partition('=')
+    limit = limit.strip().lower()
+    resource_id = getattr(resource, 'RLIMIT_' + name.strip().upper(), None)
+    multiplier = SIZE_SUFFIXES.get(limit[-1:], 1)
+    if multiplier != 1:
+        limit = limit[:-1]
+    if not sep or resource_id is None or not limit.isdigit():
+        raise ValueError('`%s` is not a resource limit NAME=VALUE, e.g. as=4G' % value)
+    return resource_id, int(limit) * multiplier
+
+
+def affinity_setter(cpus):
+    """
+    Returns:
+        function pinning the current process to cores `cpus`, which only makes the system call (libc and
+        the mask of cores are prepared here, see `ContestantLimits.preexec`)
+
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        return lambda: os.sched_setaffinity(0, cpus)
+    # Python 2 has no binding of sched_setaffinity, call it from libc
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    bits = 8 * ctypes.sizeof(ctypes.c_ulong)
+    mask = (ctypes.c_ulong * (max(cpus) // bits + 1))()
+    for cpu in cpus:
+        mask[cpu // bits] |= 1 << (cpu % bits)
+
+    def set_affinity():
+        if libc.sched_setaffinity(0, ctypes.sizeof(mask), ctypes.byref(mask)) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, 'sched_setaffinity: %s' % os.strerror(error))
+    return set_affinity
+
+
+class ContestantLimits(object):
+    """How the time of contestants' script is charged, cores it runs on and its resource limits."""
+
+    def __init__(self, budget='wall', cpus=None, rlimits=None):
+        """
+        Args:
+            budget (str): `wall` for wall-clock time limits, `cpu` for CPU time limits (see the module documentation)
+            cpus (list): cores the script is pinned to (default: all)
+            rlimits (list): (resource.RLIMIT_NAME, value) pairs, limits of the script (see `parse_rlimit`)
+
+        """
+        self.budget = budget
+        self.cpus = cpus
+        self.rlimits = rlimits or []
+
+    def pinned(self, cpus):
+        """Returns: the same limits with the script pinned to `cpus`"""
+        return ContestantLimits(self.budget, cpus, self.rlimits)
+
+    def preexec(self):
+        """
+        Prepare the limits in the evaluator process, before the script is started.
+
+        Returns:
+            function applying the limits in the process of the script before it starts (`preexec_fn`), None if
+            there is nothing to apply; it runs after `fork` in a copy of the evaluator, which has threads (trace,
+            checkpoints), so it makes only system calls
+
+        """
+        if not self.cpus and not self.rlimits:
+            return None
+        set_affinity = affinity_setter(self.cpus) if self.cpus else None
+        rlimits = []
+        for resource_id, limit in self.rlimits:
+            # hard limits of the script are the same as of the evaluator
+            _, hard = resource.getrlimit(resource_id)
+            if hard != resource.RLIM_INFINITY:
+                limit = min(limit, hard)
+            rlimits.append((resource_id, (limit, limit)))
+
+        def apply_limits():
+            if set_affinity is not None:
+                set_affinity()
+            for resource_id, limits in rlimits:
+                resource.setrlimit(resource_id, limits)
+        return apply_limits
+
+
+class CpuClock(object):
+    """CPU time of a running process and its reaped children in seconds, from /proc/PID/stat (Linux)."""
+
+    def __init__(self, pid):
+        self.fd = os.open('/proc/%i/stat' % pid, os.O_RDONLY)
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.last = 0.0
+
+    def __call__(self):
+        try:
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            # fields after the parenthesized command name, utime, stime, cutime and cstime are fields 14 to 17
+            fields = os.read(self.fd, 1024).rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            # the process is gone, its time doesn't grow anymore
+            return self.last
+        self.last = float(int(fields[11]) + int(fields[12]) + int(fields[13]) + int(fields[14])) / self.clock_ticks
+        return self.last
+
+    def close(self):
+        os.close(self.fd)
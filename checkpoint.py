@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Checkpoints of a simulation, so that a long run interrupted by a crash of the evaluator or of the host can
+continue where it stopped (./evaluator.py --resume) instead of starting again from event 0.
+
+A checkpoint is a JSON file with a header describing the simulation (command, log, window, ...) and the state
+of `Evaluator` when no event was waiting for acknowledgement: number of events read from the log, accepted
+alarms, confusion matrix counts, last two timestamps, events which can still be reported, the last acknowledged
+event and the position in the transcript. The state is copied in the event loop, but serialized and written
+(atomically, replacing the previous checkpoint) in a background thread, so that the loop doesn't wait for the disk.
+With --window > 1, no new events are sent at a checkpoint until the events in flight are acknowledged.
+
+On resume, contestants' script has to get to the same state as well. Scripts which store their own state
+understand the handshake line `resume EVENT_ID` sent before any event: the script answers `ok` when it continues
+after event EVENT_ID (the last acknowledged one), or `replay` when it needs to see the previous events again.
+Other scripts (and scripts answering `replay`) get all events up to the checkpoint again, as fast as they
+acknowledge them, with no time limits and their reports ignored.
+"""
+
+import os
+import base64
+import json
+import threading
+import time
+
+
+CHECKPOINT_VERSION = 4
+RESUME_MODES = ('replay', 'handshake')
+# items of the state which are bytes (arrays of events), stored in base64
+BINARY_STATE = ('sent', 'alarms')
+
+
+class CheckpointWriter(object):
+    """Periodically store `Evaluator.checkpoint_state` to a file (see the module documentation)."""
+
+    def __init__(self, path, interval, **header):
+        """
+        Args:
+            path: path of the checkpoint
+            interval (float): seconds between checkpoints
+            header: information about the simulation stored in the checkpoint (log, window, command, ...)
+
+        """
+        self.path = path
+        self.interval = interval
+        header['version'] = CHECKPOINT_VERSION
+        self.header = header
+        self.next_at = time.time() + interval
+        self.thread = None  # thread writing the last checkpoint
+        self.saved = 0  # number of written checkpoints
+
+    def due(self):
+        """Returns: True if it is time for the next checkpoint"""
+        return time.time() >= self.next_at
+
+    def save(self, ev):
+        """Copy the state of `ev` and write it in the background (skipped while the previous one is written)."""
+        self.next_at = time.time() + self.interval
+        if self.thread is not None and self.thread.is_alive():
+            return
+        state = ev.checkpoint_state()
+        self.thread = threading.Thread(target=self._write, args=(state,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _write(self, state):
+        for key in BINARY_STATE:
+            state[key] = base64.b64encode(state[key])
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'header': self.header, 'state': state}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, self.path)
+        self.saved += 1
+
+    def close(self, remove=True):
+        """Wait for the last checkpoint; remove the checkpoint of a finished simulation."""
+        if self.thread is not None:
+            self.thread.join()
+        if remove and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_checkpoint(path):
+    """
+    Args:
+        path: path of a checkpoint written by `CheckpointWriter`
+
+    Returns:
+        (header, state for `Evaluator.restore`)
+
+    """
+    with open(path) as f:
+        checkpoint = json.load(f)
+    header, state = checkpoint['header'], checkpoint['state']
+    if header.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('%s: unsupported checkpoint version %s' % (path, header.get('version')))
+    for key in BINARY_STATE:
+        state[key] = base64.b64decode(state[key])
+    return header, state
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Conformance of transports and wire formats (see transport.py and wire.py): evaluate the same script over every
+combination of --transport and --wire and check that all results are byte-identical to the result of
+the default `pipe` and `json`. An in-process detector (--module, see plugin.py) doing the same detection must
+give the same result as well. Prints the score of each combination, the exit status is 1 on any difference.
+
+Check example.py and example:Detector on the test log:
+    ./conformance.py
+
+Check another script (it must support --transport and --wire compact like example.py) and its in-process
+detector, with 8 events in flight:
+    ./conformance.py --logs data/competition_test_v1.log --script "./your_script.py --par1 val1" --window 8 \\
+        --module your_script:Detector
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import difflib
+from StringIO import StringIO
+
+import evaluator
+from evaluator import Evaluator
+from plugin import load_detector
+from transport import TRANSPORTS
+from wire import WIRE_FORMATS
+import trace_log
+
+
+EVALUATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG = os.path.join(EVALUATOR_DIR, 'data', 'competition_test_v1.log')
+DEFAULT_SCRIPT = '%s %s' % (sys.executable, os.path.join(EVALUATOR_DIR, 'example.py'))
+DEFAULT_MODULE = 'example:Detector'  # the detection of DEFAULT_SCRIPT in the evaluator process
+
+
+def evaluate(command, log_path, window=1, wire='json', transport='pipe', module=None):
+    """
+    Args:
+        module (str): `module:Class` of an in-process detector evaluated instead of `command` (see plugin.py)
+
+    Returns:
+        (score, result as written by `Evaluator.finish`)
+    """
+    ev = Evaluator(log_path, window=window)
+    if module:
+        evaluator.simulate_module(load_detector(module), ev)
+    else:
+        evaluator.simulate(command, ev, wire=wire, transport=transport)
+    output = StringIO()
+    score = ev.finish(output_file=output)
+    return score, output.getvalue()
+
+
+def check(command, log_path, window=1, module=None):
+    """
+    Args:
+        module (str): `module:Class` of an in-process detector which must give the same result as `command`
+
+    Returns:
+        True if results of all transports and wire formats (and of `module`) are the same
+    """
+    combinations = [(transport, wire) for transport in TRANSPORTS for wire in WIRE_FORMATS]
+    if module:
+        combinations.append(('module', module))
+    reference = None
+    passed = True
+    for transport, wire in combinations:
+        if transport == 'module':
+            score, result = evaluate(None, log_path, window, module=module)
+        else:
+            score, result = evaluate(command, log_path, window, wire, transport)
+        if reference is None:
+            reference = result
+        same = result == reference
+        print('%s\t%s\t%0.6f\t%s' % (transport, wire, score, 'ok' if same else 'DIFFERENT'))
+        if not same:
+            sys.stdout.writelines(difflib.unified_diff(
+                reference.splitlines(True), result.splitlines(True), '%s/%s' % combinations[0], '%s/%s' % (
+                    transport, wire)))
+        passed = passed and same
+    return passed
+
+
+if __name__ == '__main__':
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument(
+        '-l', '--logs', default=DEFAULT_LOG, help="path to a file with labelled activity logs (default: test log)")
+    parser.add_argument(
+        '-s', '--script', default=DEFAULT_SCRIPT,
+        help="script to evaluate, to include parameters, wrap parameters into quotes (default: example.py)")
+    parser.add_argument(
+        '-w', '--window', type=int, default=1,
+        help="max number of events sent to the script and not acknowledged yet (default: 1)")
+    parser.add_argument(
+        '-m', '--module', metavar='MODULE:CLASS',
+        help="in-process detector which must give the same result as the script (default: %s with the default\n"
+        "script, otherwise none)" % DEFAULT_MODULE)
+
+    args = parser.parse_args()
+    trace = trace_log.configure(evaluator.logger, 'off', 'off')
+    try:
+        module = args.module or (DEFAULT_MODULE if args.script == DEFAULT_SCRIPT else None)
+        passed = check(args.script.split(), args.logs, args.window, module)
+    finally:
+        trace.close()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+Encoding of activity logs to feature rows shared by train.py and test.py.
+
+A row has N_FEATURES numbers: category, behaviour, connection, weekday (Monday is 0), seconds of day
+(both in local time) and safe_connection. Categorical values are numbered in the order of their first
+appearance in the training data, values unknown in training are encoded as -1.
+"""
+
+import json
+import time
+import calendar
+from collections import OrderedDict
+
+import numpy as np
+
+
+SECONDS_PER_DAY = 86400
+EPOCH_WEEKDAY = 3  # 1970-01-01 was Thursday
+CATEGORICAL_FIELDS = ('category', 'behaviour', 'connection', 'safe_connection')
+N_FEATURES = 6
+UNKNOWN = -1
+
+
+def local_seconds(unix_timestamp):
+    """
+    Returns:
+        local time of `unix_timestamp` as seconds since epoch of a naive datetime (the same as the evaluator uses)
+    """
+    return calendar.timegm(time.localtime(unix_timestamp))
+
+
+class FeatureEncoder(object):
+    """Hash-based vocabularies of categorical fields, learned in training and fixed in testing."""
+
+    def __init__(self, mappings=None):
+        """
+        Args:
+            mappings: dict field=>list of values (index is the code of the value), as stored by train.py
+        """
+        mappings = mappings or {}
+        self.mappings = OrderedDict((field, list(mappings.get(field, []))) for field in CATEGORICAL_FIELDS)
+        self.codes = dict(
+            (field, dict((value, code) for code, value in enumerate(values)))
+            for field, values in self.mappings.items())
+
+    def _code(self, field, value, learn):
+        codes = self.codes[field]
+        code = codes.get(value)
+        if code is None:
+            if not learn:
+                return UNKNOWN
+            code = codes[value] = len(codes)
+            self.mappings[field].append(value)
+        return code
+
+    def encode(self, activity_log, out, learn=False):
+        """
+        Write features of one event to `out`.
+
+        Args:
+            activity_log (dict): event
+            out: float array of N_FEATURES numbers (e.g. a row of a preallocated buffer)
+            learn (bool): add unknown categorical values to the vocabularies (training)
+
+        Returns:
+            local time of the event (see `local_seconds`)
+
+        """
+        local = local_seconds(activity_log['unix_timestamp'])
+        days, seconds = divmod(local, SECONDS_PER_DAY)
+        out[0] = self._code('category', activity_log['category'], learn)
+        out[1] = self._code('behaviour', activity_log['behaviour'], learn)
+        out[2] = self._code('connection', activity_log['connection'], learn)
+        out[3] = (days + EPOCH_WEEKDAY) % 7
+        out[4] = seconds
+        out[5] = self._code('safe_connection', activity_log['safe_connection'], learn)
+        return local
+
+    def encode_lines(self, lines, learn=False):
+        """
+        Encode all events to one buffer (grown by doubling).
+
+        Args:
+            lines: iterable of events serialized as JSON
+
+        Returns:
+            (float64 array of rows of features, list of users of the rows)
+
+        """
+        features = np.empty((1024, N_FEATURES))
+        users = []
+        for line in lines:
+            if len(users) == len(features):
+                features = np.concatenate([features, np.empty_like(features)])
+            activity_log = json.loads(line)
+            self.encode(activity_log, features[len(users)], learn)
+            users.append(activity_log['user'])
+        return features[:len(users)], users
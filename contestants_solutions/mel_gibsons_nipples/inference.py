@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Micro-batched inference: events of each user are buffered and scored by the user model at once.
+
+The evaluator accepts a report of event E only while the penultimate event it sent is not older than
+E by more than REPORT_TIME_LIMIT. Reports written while processing event N are judged by the time
+of event N-1, so buffered event E must be scored and reported at the latest while processing the last
+event N with time(N) <= time(E) + REPORT_TIME_LIMIT. Times are local (see `encoder.local_seconds`),
+the same as in the evaluator, so they go back at the end of daylight saving time and a later event
+can have an earlier deadline.
+"""
+
+import heapq
+
+import numpy as np
+
+from encoder import N_FEATURES
+
+
+REPORT_TIME_LIMIT = 3600  # seconds, see `REPORT_TIME_LIMIT` of the evaluator
+
+
+class BatchPredictor(object):
+    """Buffer events per user, score them when the buffer is full or their reporting deadline comes."""
+
+    def __init__(self, bundle, batch_size=64, deadline_margin=60):
+        """
+        Args:
+            bundle (ModelBundle): models of users
+            batch_size (int): number of events of a user scored at once
+            deadline_margin (int): seconds of safety before the reporting deadline of an event
+
+        """
+        self.bundle = bundle
+        self.batch_size = batch_size
+        self.deadline_margin = deadline_margin
+        self.features = {}  # dict user=>preallocated buffer of features (batch_size x N_FEATURES)
+        self.pending = {}  # dict user=>list of ids of buffered events, in the order of the buffer
+        self.deadlines = []  # heap of (deadline, user, event_id) of buffered events
+
+    def add(self, event_id, user, features, local_time):
+        """
+        Buffer an event and score the events which can't wait anymore.
+
+        Args:
+            event_id (int): id of the event
+            user: user of the event
+            features: encoded event, see encoder.py
+            local_time (int): local time of the event (see `encoder.local_seconds`)
+
+        Returns:
+            ids of anomalous events to report now
+
+        """
+        reports = []
+        # buffered events which would be reported late while processing the next event
+        deadlines = self.deadlines
+        while deadlines and deadlines[0][0] <= local_time:
+            _, pending_user, pending_id = heapq.heappop(deadlines)
+            pending = self.pending.get(pending_user)
+            if pending and pending[0] <= pending_id:
+                reports.extend(self._score(pending_user))
+
+        pending = self.pending.setdefault(user, [])
+        buffer = self.features.get(user)
+        if buffer is None:
+            buffer = self.features[user] = np.empty((self.batch_size, N_FEATURES))
+        buffer[len(pending)] = features
+        pending.append(event_id)
+        heapq.heappush(deadlines, (local_time + REPORT_TIME_LIMIT - self.deadline_margin, user, event_id))
+        if len(pending) == self.batch_size:
+            reports.extend(self._score(user))
+        return reports
+
+    def flush(self):
+        """
+        Score all buffered events (before the end of a log).
+
+        Returns:
+            ids of anomalous events to report
+        """
+        reports = []
+        for user in list(self.pending):
+            reports.extend(self._score(user))
+        del self.deadlines[:]
+        return sorted(reports)
+
+    def _score(self, user):
+        pending = self.pending[user]
+        if not pending:
+            return []
+        predictions = self.bundle.model(user).predict(self.features[user][:len(pending)])
+        reports = [event_id for event_id, prediction in zip(pending, predictions) if prediction == -1]
+        del pending[:]
+        return reports
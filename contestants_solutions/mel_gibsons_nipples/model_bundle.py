@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""
+Single file with models of all users, memory-mapped by test.py and loaded lazily user by user.
+
+Layout of the bundle (all numbers little-endian):
+    magic           8 bytes `MGNBNDL1`
+    header length   uint64
+    header          JSON {"users": {user: [offset, number of support vectors]}, "mappings": ..., "n_features": ...}
+                    padded to 8 bytes
+    user records    float64 arrays of each user at its offset (from the end of the header):
+                    scaler mean (n_features), scaler scale (n_features), gamma, intercept,
+                    dual coefficients (n_sv), support vectors (n_sv x n_features, row by row)
+
+Prediction of a user model is the decision function of an RBF one-class SVM on the scaled features,
+the same as `StandardScaler.transform` followed by `OneClassSVM.predict`.
+"""
+
+import os
+import json
+import mmap
+import struct
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+BUNDLE_MAGIC = b'MGNBNDL1'
+HEADER_LENGTH = struct.Struct('<Q')
+FLOAT = np.dtype('<f8')
+
+
+def _padding(size):
+    return b'\0' * (-size % 8)
+
+
+def _record(scaler, clf):
+    """
+    Returns:
+        float64 array with the scaler and the one-class SVM of a user (see the layout of the bundle)
+    """
+    return np.concatenate([
+        np.asarray(scaler.mean_, dtype=FLOAT),
+        np.asarray(scaler.scale_, dtype=FLOAT),
+        np.array([getattr(clf, '_gamma', clf.gamma), clf.intercept_[0]], dtype=FLOAT),
+        np.asarray(clf.dual_coef_[0], dtype=FLOAT),
+        np.asarray(clf.support_vectors_, dtype=FLOAT).ravel(),
+    ])
+
+
+class BundleWriter(object):
+    """
+    Write models of users one by one as they are fitted. Records are kept in a temporary file, the bundle
+    is written at once by `close` (users sorted, so the bundle doesn't depend on the order of fitting).
+    """
+
+    def __init__(self, path, mappings):
+        """
+        Args:
+            path: path of the bundle
+            mappings: value mappings of the training data (see encoder.py)
+
+        """
+        self.path = path
+        self.mappings = mappings
+        self.records = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path)))
+        self.users = {}  # dict user=>(offset in `records`, length, number of support vectors)
+        self.n_features = None
+
+    def add(self, user, scaler, clf):
+        """
+        Args:
+            user: user of the model
+            scaler: fitted StandardScaler
+            clf: fitted OneClassSVM with RBF kernel
+
+        """
+        record = _record(scaler, clf)
+        n_sv, self.n_features = clf.support_vectors_.shape
+        self.users[user] = (self.records.tell(), record.nbytes, n_sv)
+        self.records.write(record.tobytes())
+
+    def close(self):
+        users = OrderedDict()
+        offset = 0
+        for user in sorted(self.users):
+            users[user] = [offset, self.users[user][2]]
+            offset += self.users[user][1]
+        header = json.dumps({'users': users, 'mappings': self.mappings, 'n_features': self.n_features})
+        header = header.encode('utf-8')
+
+        tmp_path = '%s.%i.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(BUNDLE_MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header + _padding(len(header)))
+            for user in users:
+                record_offset, length, _ = self.users[user]
+                self.records.seek(record_offset)
+                f.write(self.records.read(length))
+        self.records.close()
+        os.rename(tmp_path, self.path)
+
+
+class UserModel(object):
+    """Scaler and one-class SVM of one user, arrays are views of the mapped bundle."""
+
+    def __init__(self, data, offset, n_sv, n_features):
+        values = np.frombuffer(data, dtype=FLOAT, count=2 * n_features + 2 + n_sv * (n_features + 1), offset=offset)
+        self.mean = values[:n_features]
+        self.scale = values[n_features:2 * n_features]
+        self.gamma, self.intercept = values[2 * n_features:2 * n_features + 2]
+        start = 2 * n_features + 2
+        self.dual_coef = values[start:start + n_sv]
+        self.support_vectors = values[start + n_sv:].reshape(n_sv, n_features)
+
+    def decision_function(self, features):
+        """
+        Args:
+            features: encoded events (rows of numbers) or one encoded event, see encoder.py
+
+        Returns:
+            values of the decision function for the events (negative for anomalies)
+        """
+        scaled = (np.asarray(features, dtype=FLOAT) - self.mean) / self.scale
+        # squared distances of all events to all support vectors
+        diff = self.support_vectors - scaled[..., np.newaxis, :]
+        kernel = np.exp(-self.gamma * np.sum(diff * diff, axis=-1))
+        return np.dot(kernel, self.dual_coef) + self.intercept
+
+    def predict(self, features):
+        """
+        Returns:
+            -1 for anomalies, 1 otherwise for each event (the same as `OneClassSVM.predict`)
+        """
+        return np.where(self.decision_function(features) > 0, 1, -1)
+
+
+class ModelBundle(object):
+    """Memory-mapped bundle, models of users are created when they are needed (at most `max_models` at once)."""
+
+    def __init__(self, path, max_models=1024):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError('%s is not a model bundle' % path)
+        start = len(BUNDLE_MAGIC) + HEADER_LENGTH.size
+        header_length = HEADER_LENGTH.unpack_from(self.data, len(BUNDLE_MAGIC))[0]
+        header = json.loads(self.data[start:start + header_length].decode('utf-8'))
+        self.records_offset = start + header_length + len(_padding(header_length))
+        self.users = header['users']  # dict user=>[offset of the record, number of support vectors]
+        self.mappings = header['mappings']
+        self.n_features = header['n_features']
+        self.max_models = max_models
+        self.models = OrderedDict()  # dict user=>UserModel, the least recently used first
+
+    def model(self, user):
+        """
+        Returns:
+            UserModel of `user` (KeyError for a user unknown in training)
+        """
+        model = self.models.pop(user, None)
+        if model is None:
+            offset, n_sv = self.users[user]
+            model = UserModel(self.data, self.records_offset + offset, n_sv, self.n_features)
+            if len(self.models) >= self.max_models:
+                self.models.popitem(last=False)
+        self.models[user] = model
+        return model
@@ -0,0 +1,157 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+"""USAGE:
+
+Search parameters of OneClassSVM of train.py: fit models of all users for every candidate in parallel
+and score their predictions on a labelled log by the F-measure of the evaluator (without running test.py).
+Both logs are parsed once, all candidates share the feature matrices.
+
+Grid search (all combinations):
+    ./sweep.py competition_train.log short_test.log --nu 0.01 0.0225 0.05 --gamma 0.05 0.1 0.2
+
+Random search of 20 candidates, log-uniform between the min and max values:
+    ./sweep.py competition_train.log short_test.log --nu 0.005 0.1 --gamma 0.01 1 --random 20 --seed 1
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import math
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+
+import numpy as np
+
+from encoder import FeatureEncoder
+import train
+
+# the evaluator is in the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+import evaluator
+from activity_log import read_records
+import trace_log
+
+
+# shared by forked workers of the pool: rows of features of the labelled log and row indexes of each user
+testFeatures = None
+testRows = {}
+
+
+def candidates(nus, gammas, count=None, seed=None):
+    """
+    Returns:
+        list of (nu, gamma), all combinations or `count` random ones (log-uniform between min and max values)
+    """
+    if count is None:
+        return list(itertools.product(nus, gammas))
+    rng = random.Random(seed)
+
+    def sample(values):
+        low, high = math.log(min(values)), math.log(max(values))
+        return math.exp(rng.uniform(low, high))
+    return [(sample(nus), sample(gammas)) for _ in range(count)]
+
+
+def fitCandidate(task):
+    """
+    Fit the model of one user with parameters of one candidate and predict its events of the labelled log.
+
+    Returns: (candidate number, user, ids of events predicted as anomalies, fit time in seconds)
+    """
+    number, nu, gamma, user = task
+    start = time.time()
+    scaler, clf = train.fitModel(train.trainingData[user], nu, gamma)
+    fitTime = time.time() - start
+    rows = testRows.get(user)
+    if rows is None:
+        return number, user, [], fitTime
+    predictions = clf.predict(scaler.transform(testFeatures[rows]))
+    return number, user, rows[predictions == -1].tolist(), fitTime
+
+
+def score(records, reports):
+    """
+    Returns:
+        (avg. user F-measure, dict user=>F-measure) of `reports` (set of ids of events) on the labelled log
+    """
+    ev = evaluator.Evaluator(None, records=records)
+    ev.replay_reports(reports)
+    userScores = dict((scores[0], scores[-1]) for scores in ev.user_scores())
+    return 1.0 * sum(userScores.values()) / len(userScores), userScores
+
+
+def main(argv):
+    global testFeatures
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('train_log', help="path to training data file")
+    parser.add_argument('test_log', help="path to labelled activity logs")
+    parser.add_argument('--nu', type=float, nargs='+', default=[0.01, train.NU, 0.05], help="values of nu")
+    parser.add_argument('--gamma', type=float, nargs='+', default=[0.05, train.GAMMA, 0.2], help="values of gamma")
+    parser.add_argument('--random', type=int, metavar='COUNT', help="random search of COUNT candidates")
+    parser.add_argument('--seed', type=int, help="seed of the random search")
+    parser.add_argument(
+        '-j', '--workers', type=int, default=multiprocessing.cpu_count(),
+        help="number of processes fitting models (default: number of CPU cores)")
+    args = parser.parse_args(argv)
+
+    # the trace of scoring is not interesting, only the scores
+    trace = trace_log.configure(evaluator.logger, 'off', 'off')
+
+    print('Preparing data', file=sys.stderr)
+    dataByUser, mappings = train.prepDataByUser(args.train_log)
+    train.trainingData.update(dataByUser)
+    with open(args.test_log) as testFile:
+        testFeatures, users = FeatureEncoder(mappings).encode_lines(testFile)
+    for row, user in enumerate(users):
+        testRows.setdefault(user, []).append(row)
+    for user in testRows:
+        testRows[user] = np.array(testRows[user])
+    records = list(read_records(args.test_log))
+
+    params = candidates(args.nu, args.gamma, args.random, args.seed)
+    trainUsers = sorted(dataByUser)
+    tasks = [(number, nu, gamma, user) for number, (nu, gamma) in enumerate(params) for user in trainUsers]
+    print('Fitting %i candidates for %i users' % (len(params), len(trainUsers)), file=sys.stderr)
+
+    reports = [set() for _ in params]
+    remaining = [len(trainUsers)] * len(params)
+    fitTimes = [0.0] * len(params)
+    results = []  # (avg. F-measure, nu, gamma, dict user=>F-measure, fit time)
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    fitted = pool.imap_unordered(fitCandidate, tasks) if pool else itertools.imap(fitCandidate, tasks)
+    try:
+        for number, user, anomalies, fitTime in fitted:
+            reports[number].update(anomalies)
+            fitTimes[number] += fitTime
+            remaining[number] -= 1
+            if not remaining[number]:
+                # score each candidate as soon as all its models are fitted
+                avgFMeasure, userScores = score(records, reports[number])
+                results.append((avgFMeasure, params[number][0], params[number][1], userScores, fitTimes[number]))
+                reports[number] = None
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        trace.close()
+
+    results.sort(key=lambda result: (-result[0], result[1], result[2]))
+    scoredUsers = sorted(results[0][3]) if results else []
+    print('\t'.join(['rank', 'nu', 'gamma', 'score', 'fit_time'] + scoredUsers))
+    for rank, (avgFMeasure, nu, gamma, userScores, fitTime) in enumerate(results, 1):
+        print('\t'.join(
+            ['%i' % rank, '%g' % nu, '%g' % gamma, '%0.6f' % avgFMeasure, '%0.3f' % fitTime] +
+            ['%0.4f' % userScores[user] for user in scoredUsers]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -6,43 +6,20 @@ import os
 import sys
 import json
 import argparse
-import datetime
 import time
 
-import pickle
+import numpy as np
 
-date_format = "%Y-%m-%d %H:%M:%S"
+from encoder import FeatureEncoder, N_FEATURES
+from inference import BatchPredictor
+from model_bundle import ModelBundle
+
+# max number of user models kept in memory, the least recently used ones are dropped
+MAX_RESIDENT_MODELS = 1024
+# number of events of one user scored at once (events are reported at the latest before their deadline)
+BATCH_SIZE = 64
 
-# map activity_log values onto the same numbers as in training, split time, etc.
-def prepLine(lineDict, mappings):
-    result = []
-    if lineDict['category'] in mappings['category']:
-        result.append(mappings['category'].index(lineDict['category']))
-    else:
-        result.append(-1)
-        
-    if lineDict['behaviour'] in mappings['behaviour']:
-        result.append(mappings['behaviour'].index(lineDict['behaviour']))
-    else:
-        result.append(-1)
-        
-    if lineDict['connection'] in mappings['connection']:
-        result.append(mappings['connection'].index(lineDict['connection']))
-    else:
-        result.append(-1)
-        
-    day = datetime.datetime.fromtimestamp(lineDict['unix_timestamp']).weekday()
-    time = datetime.datetime.fromtimestamp(lineDict['unix_timestamp']).time()
-    seconds = time.hour*3600 + time.minute*60 + time.second
-    result.append(day)
-    result.append(seconds)
-    #result.append(time.hour)
-    
-    if lineDict['safe_connection'] in mappings['safe_connection']:
-        result.append(mappings['safe_connection'].index(lineDict['safe_connection']))
-    else:
-        result.append(-1)
-    return [result] # wrap result in a list to be directly usable in model.predict (todo: test if it is necessary)
+date_format = "%Y-%m-%d %H:%M:%S"
 
 
 def main(
@@ -60,38 +37,14 @@ def main(
 
     """
 
-    # get script directory
-    #dirName = os.path.dirname(os.path.realpath(__file__))
-
-    # load users
-    #filename = dirName + '/users.pkl'
-    filename = './users.pkl'
-    users = []
-    with open(filename, 'rb') as usersFile:
-        users = pickle.load(usersFile)
-
-    # load value mappings
-    #filename = dirName + '/mappings.pkl'
-    filename = './mappings.pkl'
-    mappings = {}
-    with open(filename, 'rb') as mappingsFile:
-        mappings = pickle.load(mappingsFile)
-
-
-    # load models and scalers (for each user)
-    models = {}
-    scalers = {}
-    for user in users:
-        #filename = dirName + '/' + user +  '.pkl'
-        filename = './' + user +  '.pkl'
-        with open(filename, 'rb') as modelFile:
-            models[user] = pickle.load(modelFile)
-
-        #filename = dirName + '/' + user +  '_scaler.pkl'
-        filename = './' + user +  '_scaler.pkl'
-        with open(filename, 'rb') as scalerFile:
-            scalers[user] = pickle.load(scalerFile)
-    
+    # map models of all users, each one is loaded when its user appears in the stream
+    bundle = ModelBundle('./models.bundle', MAX_RESIDENT_MODELS)
+    # map values to the same numbers as in training, see encoder.py
+    encoder = FeatureEncoder(bundle.mappings)
+    features = np.empty(N_FEATURES)  # features of the current event
+    # score events in batches per user, see inference.py
+    predictor = BatchPredictor(bundle, BATCH_SIZE)
+
     line_counter = -1
     while True:  # repeat until empty line
         line_counter += 1
@@ -99,7 +52,7 @@ def main(
         # count your time
         loop_start_time = time.time()
 
-        if not line or line.strip() == 'exit':  # if line is empty or exit string, break loop
+        if not line or line.strip() in ('exit', 'reset'):  # if line is empty or exit string, break loop
             # +----------------------------------------------------+
             # | before the end of script, you can report anomalies |
             # +----------------------------------------------------+
@@ -107,30 +60,34 @@ def main(
                 # report last line as anomaly to demonstrate functionality
                 #sys.stdout.write('%i\n' % (line_counter - 1))
                 #sys.stdout.flush()
+            # report anomalies among events still waiting in batches
+            for event_id in predictor.flush():
+                sys.stdout.write('%i\n' % event_id)
             # write `ok\n` for system not to wait for another output
             sys.stdout.write('ok\n')
             sys.stdout.flush()
             # +----------------------------------------------------+
+            if line.strip() == 'reset':
+                # another log follows, keep the loaded models
+                line_counter = -1
+                continue
             # break to end infinite loop
             break
 
         # convert JSON serialized string to object (Python dict)
         activity_log = json.loads(line)
 
-        # timestamp of event
-        timestamp = datetime.datetime.fromtimestamp(int(activity_log["unix_timestamp"]))
-
 
         user = activity_log['user']
 	# get day and time and map values to numbers according to learned mappings
-        mappedLog = prepLine(activity_log, mappings)
-	# scale (subtract mean and divide by variance or sthg like that)
-        mappedLogNorm = scalers[user].transform(mappedLog)
-	# predict if normal or anomaly
-        prediction = models[user].predict(mappedLogNorm)
+        local_time = encoder.encode(activity_log, features)
+	# scale (subtract mean and divide by variance or sthg like that) and predict if normal or anomaly,
+	# once a batch of events of the user is full or the oldest buffered events can't wait anymore
+        reports = predictor.add(activity_log['id'], user, features, local_time)
 	# if anomaly, print it's id
-        if prediction == -1:
-            sys.stdout.write(str(activity_log['id']) + '\n')
+        for event_id in reports:
+            sys.stdout.write('%i\n' % event_id)
+        if reports:
             sys.stdout.flush()
      
 
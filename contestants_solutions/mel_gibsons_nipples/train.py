@@ -2,16 +2,21 @@
 
 import sys
 import json
+import time
 import datetime
+import argparse
+import resource
+import multiprocessing
 from collections import OrderedDict
 
 from sklearn import preprocessing
 from sklearn import svm
 
-import pickle
-
 import os
 
+from encoder import FeatureEncoder
+from model_bundle import BundleWriter
+
 #import numpy as np
 
 #import matplotlib.pyplot as plt
@@ -22,83 +27,15 @@ import os
 # pripravi data do potrebneho formatu (multidimenzionalniho pole), z nehoz jde rovnou vytvorit napr. pandas.DataFrame nebo numpy.array, pripadne i rovnou pouzit v mnoha sklearn algoritmech
 # vraci dvojici: data (dict by user), dataValues (value -> number mappings)
 def prepDataByUser(logFile):
-    data = {}
-    # does it have to be ordered ???
-    #dataValues = OrderedDict( [ ('category', []), ('behaviour', []), ('connection', []), ('user', []), ('day', []), ('time', []), ('safe_connection', []) ] )
-    dataValues = OrderedDict( [ ('category', []), ('behaviour', []), ('connection', []), ('safe_connection', []) ] )
-    #dataValues = OrderedDict( [ ('category', []), ('behaviour', []), ('region', []), ('country', []), ('city', []), ('safe_connection', []) ] )
+    # kodovani hodnot je spolecne s test.py, viz encoder.py
+    encoder = FeatureEncoder()
     with open(logFile) as data_file:
-        for line in data_file:
-            lineDict = json.loads(line, object_pairs_hook=OrderedDict) # bez OrderedDict by to pokazde hazelo jine poradi atributu
-            templist = []
-
-            if lineDict['user'] not in data:
-                data[lineDict['user']] = []
-            
-            for key, value in lineDict.items():
-                if key == 'user':
-                    continue
-                if key == 'is_anomaly':
-                    continue
-
-                if key == 'unix_timestamp':
-                    day = datetime.datetime.fromtimestamp(value).weekday()
-                    time = datetime.datetime.fromtimestamp(value).time()
-                    seconds = time.hour*3600 + time.minute*60 + time.second
-                    templist.append(day)
-                    templist.append(seconds)
-                    #templist.append(time.hour)
-                    continue
-
-                '''
-                # pokus o rozdeleni connection na 3 atributy region, country, city. Po prvnim kratkem otestovani to prekvapive hazelo horsi vysledky
-                if key == 'connection':
-                    region, country, city = value.split('-', 2)
-
-                    valueInt = 0                    
-                    # pokud jsme jiz na danou hodnotu drive narazili, zapiseme to same cislo 
-                    if region in dataValues['region']:
-                        valueInt = dataValues['region'].index(region)
-                    # jinak zapiseme nejnizsi nepouzite cislo, resp. delku seznamu jiz najitych unikatnich hodnot
-                    else:
-                        valueInt = len(dataValues['region'])
-                        dataValues['region'].append(region)
-                    templist.append(valueInt)
-
-                    valueInt = 0                    
-                    # pokud jsme jiz na danou hodnotu drive narazili, zapiseme to same cislo 
-                    if country in dataValues['country']:
-                        valueInt = dataValues['country'].index(country)
-                    # jinak zapiseme nejnizsi nepouzite cislo, resp. delku seznamu jiz najitych unikatnich hodnot
-                    else:
-                        valueInt = len(dataValues['country'])
-                        dataValues['country'].append(country)
-                    templist.append(valueInt)
-
-                    valueInt = 0                    
-                    # pokud jsme jiz na danou hodnotu drive narazili, zapiseme to same cislo 
-                    if city in dataValues['city']:
-                        valueInt = dataValues['city'].index(city)
-                    # jinak zapiseme nejnizsi nepouzite cislo, resp. delku seznamu jiz najitych unikatnich hodnot
-                    else:
-                        valueInt = len(dataValues['city'])
-                        dataValues['city'].append(city)
-                    templist.append(valueInt)                    
-                    continue
-                '''
-                
-                # pokud jsme jiz na danou hodnotu drive narazili, zapiseme to same cislo
-                valueInt = 0
-                if value in dataValues[key]:
-                    valueInt = dataValues[key].index(value)
-                # jinak zapiseme nejnizsi nepouzite cislo, resp. delku seznamu jiz najitych unikatnich hodnot
-                else:
-                    valueInt = len(dataValues[key])
-                    dataValues[key].append(value)                    
-                templist.append(valueInt)
-                
-            data[lineDict['user']].append(templist)
-    return data, dataValues
+        features, users = encoder.encode_lines(data_file, learn=True)
+    rowsByUser = OrderedDict()
+    for row, user in enumerate(users):
+        rowsByUser.setdefault(user, []).append(row)
+    data = dict((user, features[rows]) for user, rows in rowsByUser.items())
+    return data, encoder.mappings
 
 # pomocna fce k pokusu o vyuziti one-hot kodovani (DictVectorizer) vyctovych atributu, prozatim nevyuzito (30.3.2016 23:00)
 def prepDataByUserForDictVect(logFile):
@@ -137,71 +74,112 @@ def prepDataByUserForDictVect(logFile):
             data[lineDict['user']].append(tempDict)
     return data
 
-def main(argv):
-    log_file = ""
+# parameters of OneClassSVM, F-measure = 0.266448 (see sweep.py for other values)
+NU = 0.0225
+GAMMA = 0.1
+
+# training data of users (dict user => rows of features), inherited by forked workers of the pool
+trainingData = {}
+
+
+def readStatus(field):
+    """Returns: value of `field` of /proc/self/status in bytes (Linux)"""
+    with open('/proc/self/status') as statusFile:
+        for line in statusFile:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+
+
+def resetPeakMemory():
+    """Reset peak RSS of this process (Linux), so that it covers only the following fit."""
     try:
-        log_file = argv[0]
-    except IndexError:
-        #log_file = './competition_train_round1.log'
-        print("Missing argument: path to training data file")
-        sys.exit(1)
-
-    print('Preparing data')            
-    dataByUser, mappings = prepDataByUser(log_file)
-    #testDataByUser, mappings2 = prepDataByUser(test_file)
+        with open('/proc/self/clear_refs', 'w') as clearFile:
+            clearFile.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def peakMemory():
+    """Returns: peak RSS of this process in bytes"""
+    try:
+        return readStatus('VmHWM')
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def fitModel(data, nu=NU, gamma=GAMMA):
+    """Returns: (scaler, model) fitted to rows of features of one user"""
+    scaler = preprocessing.StandardScaler().fit(data)
+    dataNorm = scaler.transform(data)
 
-    predictions = {}
-    models = {}   
-    users = []
-    for user, data in dataByUser.items():
-        print 'Training model and scaler for', user
-        users.append(user)
-        scaler = preprocessing.StandardScaler().fit(data)
-        dataNorm = scaler.transform(data)
-
-        clf = svm.OneClassSVM(nu=0.0225, kernel="rbf", gamma=0.1) # F-measure = 0.266448
-		
-        clf.fit(dataNorm)
-
-        models[user] = clf
-
-        # save scaler
-        filename = user +  "_scaler.pkl"
-        with open(filename, 'wb') as file:
-            pickle.dump(scaler, file, protocol = 2)
-           
-        # uncomment to view graphed plots (together with line #194 + add test_file)
-        """
-        testDataNorm = scaler.transform(testDataByUser[user])
-        trainReduced = PCA(n_components = 2).fit_transform(dataNorm)
-        testReduced = PCA(n_components = 2).fit_transform(testDataNorm)
-        #predictions[user] = clf.predict(testDataNorm)
-
-        plt.title(user)
-        plt.scatter(testReduced[:, 0], testReduced[:, 1], c='green')
-        plt.scatter(trainReduced[:, 0], trainReduced[:, 1], c='black')
-        plt.show()
-        """
-
-    print('Saving value mappings')
-    # save value mappings
-    filename = "mappings.pkl"
-    with open(filename, 'wb') as mapFile:
-        pickle.dump(mappings, mapFile, protocol = 2)
-
-    print('Saving list of users')
-    # save users
-    filename = "users.pkl"
-    with open(filename, 'wb') as usersFile:
-        pickle.dump(users, usersFile, protocol = 2)
+    clf = svm.OneClassSVM(nu=nu, kernel="rbf", gamma=gamma)
+
+    clf.fit(dataNorm)
+    return scaler, clf
+
+
+def fitUser(user):
+    """
+    Fit scaler and model of one user (in a worker process).
+
+    Returns: (user, scaler, model, fit time in seconds, peak memory of the worker during the fit in bytes)
+    """
+    resetPeakMemory()
+    start = time.time()
+    scaler, clf = fitModel(trainingData[user])
+    fitTime = time.time() - start
+
+    # uncomment to view graphed plots (together with line #194 + add test_file)
+    """
+    testDataNorm = scaler.transform(testDataByUser[user])
+    trainReduced = PCA(n_components = 2).fit_transform(dataNorm)
+    testReduced = PCA(n_components = 2).fit_transform(testDataNorm)
+    #predictions[user] = clf.predict(testDataNorm)
+
+    plt.title(user)
+    plt.scatter(testReduced[:, 0], testReduced[:, 1], c='green')
+    plt.scatter(trainReduced[:, 0], trainReduced[:, 1], c='black')
+    plt.show()
+    """
+    return user, scaler, clf, fitTime, peakMemory()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Train models of all users, write them to models.bundle")
+    parser.add_argument('log_file', help="path to training data file")
+    parser.add_argument(
+        '-j', '--workers', type=int, default=multiprocessing.cpu_count(),
+        help="number of processes fitting models of users (default: number of CPU cores)")
+    args = parser.parse_args(argv)
+
+    print('Preparing data')
+    dataByUser, mappings = prepDataByUser(args.log_file)
+    #testDataByUser, mappings2 = prepDataByUser(test_file)
+    trainingData.update(dataByUser)
+
+    # models are the same for any number of workers, each one is fitted independently
+    users = sorted(dataByUser)
+    bundle = BundleWriter("models.bundle", mappings)
+    pool = None
+    if args.workers > 1:
+        pool = multiprocessing.Pool(args.workers)
+        fitted = pool.imap_unordered(fitUser, users)
+    else:
+        fitted = (fitUser(user) for user in users)
+    try:
+        for user, scaler, clf, fitTime, peak in fitted:
+            print('Trained model and scaler for %s: %i events, %.3f s, peak memory %.1f MB' % (
+                user, len(dataByUser[user]), fitTime, peak / 1048576.0))
+            bundle.add(user, scaler, clf)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     print('Saving models')
-    # save models
-    for user, clf in models.items():
-        filename = user +  ".pkl"
-        with open(filename, 'wb') as file:
-            pickle.dump(clf, file, protocol = 2)
-        
+    # save models, scalers, users and value mappings to a single file, see model_bundle.py
+    bundle.close()
+
     print('Done')
 
 if __name__ == '__main__':
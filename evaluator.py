@@ -18,6 +18,44 @@ Run your script without parameters:
 
 Run your script with parameters:
     ./evaluator.py --logs competition.log --script "./your_script.extension --par1 val1 --par2 val2"
+
+Evaluate several scripts in parallel, writing results/NAME.txt for each of them:
+    ./evaluator.py --logs competition.log --scripts ./first_script.py "second=./second_script.py --par1 val1"
+
+Keep up to 16 events in flight (your script acknowledges each event with `ok <event_id>`):
+    ./evaluator.py --logs competition.log --script ./your_script.extension --window 16
+
+Keep only errors in the trace on stderr and store the file trace in binary (see trace_log.py):
+    ./evaluator.py --logs competition.log --script ./your_script.extension --trace-stderr errors --trace-format binary
+
+Start your script once and evaluate it on every log in a directory, writing results/NAME.txt for each log
+(your script gets `reset` line between logs, answer it like `exit` and continue with ids from 0):
+    ./evaluator.py --logs data/ --script ./your_script.extension
+
+Send events in the compact format, repeated values only once (see wire.py):
+    ./evaluator.py --logs competition.log --script ./your_script.extension --wire compact
+
+Talk to your script over a shared memory ring buffer instead of stdin/stdout (see transport.py):
+    ./evaluator.py --logs competition.log --script ./your_script.extension --transport ring
+
+Evaluate 8 scripts, 2 at once, each pinned to its own cores and charged only its CPU time (see budget.py):
+    ./evaluator.py --logs competition.log --scripts ./first_script.py ... --budget cpu --cpus 0-1 2-3
+
+Store a checkpoint every minute, and continue the simulation from the last one after a crash of the evaluator
+(see checkpoint.py):
+    ./evaluator.py --logs competition.log --script ./your_script.extension --checkpoint run.checkpoint
+    ./evaluator.py --logs competition.log --script ./your_script.extension --checkpoint run.checkpoint --resume
+
+Evaluate a Python detector in the evaluator process, in batches of 64 events (see plugin.py):
+    ./evaluator.py --logs competition.log --module example:Detector --window 64
+
+Parse the log once and reuse it in all following evaluations (see activity_log.py):
+    ./activity_log.py competition.log
+
+Evaluate only some users in one week, reading only their events through the index of the log (see activity_log.py);
+events keep their ids of the whole log:
+    ./evaluator.py --logs competition.log --script ./your_script.extension --users Beth Denny \
+        --from 2015-05-04 --to "2015-05-11 00:00:00"
 """
 
 from __future__ import print_function
@@ -26,32 +64,121 @@ import sys
 import os
 import argparse
 import logging
-from subprocess import PIPE, Popen
-from threading import Thread
-from Queue import Queue, Empty
 import time
-import json
 import datetime
+import calendar
+import json
+import traceback
+import multiprocessing
+from itertools import islice
+from collections import OrderedDict, deque
+
+from activity_log import read_records, select_records
+from transcript import TranscriptWriter
+from instrumentation import ProcessMonitor, SimulationStats
+from plugin import DeadlineExceeded, call_with_deadline, load_detector
+from wire import CompactEncoder, WIRE_FORMATS
+from transport import TRANSPORTS, start_contestant
+from checkpoint import CheckpointWriter, RESUME_MODES, read_checkpoint
+from budget import BUDGETS, WALL_LIMIT_FACTOR, ContestantLimits, CpuClock, parse_cpus, parse_rlimit
+import trace_log
 
 
 TIME_LIMIT = 2
 PROGRAM_TIME_LIMIT = 600
+CPU_POLL_INTERVAL = 0.05  # seconds between reads of CPU time of a script which doesn't answer (see budget.py)
+REPORT_TIME_LIMIT = 3600  # seconds, anomaly must be reported before reading an event older by more than this
+LOCAL_TIME_SETBACK = 7200  # seconds, the largest step back of local time (end of double summer time)
+
+logger = logging.getLogger(__name__)
+
+
+def local_seconds(unix_timestamp):
+    """
+    Args:
+        unix_timestamp (int): seconds since epoch
+
+    Returns:
+        local time of `unix_timestamp` as seconds since epoch of a naive datetime (comparable the same way
+        as `datetime.datetime.fromtimestamp`, including daylight saving time changes)
+
+    """
+    return calendar.timegm(time.localtime(unix_timestamp))
+
+
+def format_local_seconds(seconds):
+    """
+    Returns:
+        `local_seconds` as string, e.g. `2015-09-20 19:22:41`
+    """
+    return str(datetime.datetime.utcfromtimestamp(seconds))
+
+
+class BitArray(object):
+    """Growable array of bits indexed by event id, all bits are 0 until set."""
+
+    def __init__(self):
+        self.bytes = bytearray()
+
+    def __getitem__(self, num):
+        index = num >> 3
+        if num < 0 or index >= len(self.bytes):
+            return 0
+        return (self.bytes[index] >> (num & 7)) & 1
+
+    def __setitem__(self, num, value):
+        index = num >> 3
+        if index >= len(self.bytes):
+            self.bytes.extend(bytearray(max(index + 1 - len(self.bytes), len(self.bytes))))
+        if value:
+            self.bytes[index] |= 1 << (num & 7)
+        else:
+            self.bytes[index] &= ~(1 << (num & 7)) & 0xff
 
 
 class Evaluator(object):
 
-    def __init__(self, activity_access_log_path):
+    def __init__(self, activity_access_log_path, window=1, records=None, selection=None):
         """
         Args:
             activity_access_log_path: path to logs for testing
+            window (int): max number of events sent to contestants and not acknowledged yet
+            records: iterable of already parsed logs (see `activity_log.parse_lines`), used instead of the log file
+            selection (dict): evaluate only events of `users` from `start` to `end` (unix timestamps, `end`
+                excluded), see `activity_log.select_records`; ids of the events are their ids in the whole log
         """
-        self.file_handler = open(activity_access_log_path)
-        self.anomalies = []
-        self.users = []
-        self.alarms = []
+        if records is None and selection:
+            records = select_records(activity_access_log_path, **selection)
+        elif records is None:
+            # parsed log from its cache (if there is an up-to-date one) or from the log itself
+            records = read_records(activity_access_log_path)
+        self.records = iter(records)
+        self.window = window
+        self.sent = BitArray()  # events sent to contestants
+        self.alarms = BitArray()  # events with accepted alarm
+        # users are interned to codes, confusion matrices are counted per user code as events come
+        self.user_codes = {}  # dict user=>user code (index to `user_names`)
+        self.user_names = []  # users in the order of their first event
+        self.user_event_counts = []  # number of events per user code
+        self.user_anomaly_counts = []  # number of anomalies per user code
+        self.user_tp_counts = []  # number of accepted alarms of anomalies per user code
+        self.user_fp_counts = []  # number of accepted alarms of normal events per user code
         self.date_format = "%Y-%m-%d %H:%M:%S"
-        self.last_two_timestamps = [None, None]  # remember last two timestamps
-        self.event_timestamps = {}  # dict event_id=>timestamp
+        # remember last two timestamps (local time in seconds, see `local_seconds`); with window > 1,
+        # these are the timestamps of the last acknowledged event and of the last sent event
+        self.last_two_timestamps = [None, None]
+        self.inner_time = (None, None)  # last formatted inner time: (timestamp, string)
+        # events which can still be reported in time, older events are only in `sent` and `alarms`
+        self.recent_events = {}  # dict event_id=>(timestamp, user code, is_anomaly)
+        self.recent_ids = deque()  # ids of `recent_events` in the order of sending
+        self.latest_reference = None  # the latest reference time of reports so far (see `_forget_old_events`)
+        self.last_acked_id = None  # id of the last event acknowledged by contestants
+        self.exit_report = []  # lines about premature exit of contestants' script
+        self.not_sent = 0  # events of the log left without sending them after the script exited (see `abort`)
+        self.transcript = None  # TranscriptWriter recording answers of contestants' script (optional)
+        self.checkpoints = None  # CheckpointWriter storing the state periodically (optional)
+        self.skipped = 0  # events of the log before the checkpoint the simulation was resumed from
+        self.program_time = 0.0  # CPU seconds charged to the script for the log up to the last checkpoint
 
     def _get_inner_time(self):
         """
@@ -61,50 +188,176 @@ class Evaluator(object):
             timestamp string (zero time if 0 or 1 event was sent to contestants)
         """
         timestamp = self.last_two_timestamps[0]
-        if not timestamp:
+        if timestamp is None:
             return '0000-00-00 00:00:00'
-        return str(timestamp)
+        # it is a part of every trace message, format it only when it changes
+        if timestamp != self.inner_time[0]:
+            self.inner_time = (timestamp, format_local_seconds(timestamp))
+        return self.inner_time[1]
 
-    def events(self):
+    def _read_events(self):
         """
-        Generator of event activity logs as JSON serialized strings per line.
+        Generator of event activity logs, storing their bookkeeping (users, anomalies, timestamps).
+        Continues where the previous call stopped.
 
         Returns: (event_id, event_JSON_serialized_as_string)
 
         """
-        for line_num, line in enumerate(self.file_handler):
-            if not line:
-                break
-            # process line input to dictionary
-            data = json.loads(line)
-            # add id information
-            data['id'] = line_num
+        for line_num, unix_timestamp, user, is_anomaly, str_dump in self.records:
             # update timestamp history
-            timestamp = self._get_timestamp(data)
-            self.last_two_timestamps = [self.last_two_timestamps[-1], timestamp]
-            self.event_timestamps[line_num] = timestamp
+            timestamp = local_seconds(unix_timestamp)
+            if self.window == 1:
+                self.last_two_timestamps = [self.last_two_timestamps[-1], timestamp]
+            else:
+                # the older timestamp moves only when contestants acknowledge events
+                self.last_two_timestamps[1] = timestamp
 
-            self.alarms.append(0)  # add field for alarms
-            self.users.append(data['user'])  # add field for user
-            self.anomalies.append(data.get('is_anomaly', 0))  # add field for anomalies
-            if 'is_anomaly' in data:
-                del data['is_anomaly']  # remove anomaly information from data for contestants
+            code = self.user_codes.get(user)
+            if code is None:
+                code = self.user_codes[user] = len(self.user_names)
+                self.user_names.append(user)
+                for counts in (
+                        self.user_event_counts, self.user_anomaly_counts, self.user_tp_counts, self.user_fp_counts):
+                    counts.append(0)
+            self.user_event_counts[code] += 1
+            if is_anomaly:
+                self.user_anomaly_counts[code] += 1
 
-            # return line id and serialized JSON as string representing one event
-            str_dump = json.dumps(data)
-            logger.info(self._get_inner_time() + ' > ' + str_dump)
+            self.sent[line_num] = 1
+            if self.transcript is not None:
+                self.transcript.sent += 1
+            self.recent_events[line_num] = (timestamp, code, is_anomaly)
+            self.recent_ids.append(line_num)
+            self._forget_old_events()
             yield line_num, str_dump
 
-    def _get_timestamp(self, event_dict):
+    def event_user(self, num):
         """
-        Args:
-            event_dict: dict containing field `event_dict`
+        Returns:
+            user of a recently sent event `num` (None if the event is too old)
+        """
+        event = self.recent_events.get(num)
+        return None if event is None else self.user_names[event[1]]
+
+    def _forget_old_events(self):
+        """
+        Drop events which are too old to be reported from `recent_events`.
+
+        Reference time (the penultimate or last acknowledged event) goes back only when local time does (end
+        of daylight saving time, at most by LOCAL_TIME_SETBACK in a log which is chronological in unix time).
+        Events are kept until they are too old even after such a step back, so forgotten events stay too old:
+        alarm for them is rejected as late without their timestamp, and the memory is bounded by the events
+        of the last few hours.
+        """
+        reference = self.last_two_timestamps[0]
+        if reference is None:
+            return
+        if self.latest_reference is None or reference > self.latest_reference:
+            self.latest_reference = reference
+        oldest = self.latest_reference - LOCAL_TIME_SETBACK - REPORT_TIME_LIMIT
+        while self.recent_ids and self.recent_events[self.recent_ids[0]][0] < oldest:
+            del self.recent_events[self.recent_ids.popleft()]
+
+    def checkpoint_state(self):
+        """
+        Copy of the state of the simulation, when no event waits for acknowledgement (see checkpoint.py).
 
         Returns:
-            datetime extracted from dict field `unix_timestamp`
+            dict, `sent` and `alarms` are bytes of their bit arrays
+        """
+        return {
+            'position': sum(self.user_event_counts),
+            'sent': bytes(self.sent.bytes),
+            'alarms': bytes(self.alarms.bytes),
+            'user_names': list(self.user_names),
+            'user_event_counts': list(self.user_event_counts),
+            'user_anomaly_counts': list(self.user_anomaly_counts),
+            'user_tp_counts': list(self.user_tp_counts),
+            'user_fp_counts': list(self.user_fp_counts),
+            'last_two_timestamps': list(self.last_two_timestamps),
+            'recent_events': [[num] + list(self.recent_events[num]) for num in self.recent_ids],
+            'latest_reference': self.latest_reference,
+            'last_acked_id': self.last_acked_id,
+            'program_time': self.program_time,
+            'transcript': self.transcript.checkpoint() if self.transcript is not None else None,
+        }
 
+    def restore(self, state):
         """
-        return datetime.datetime.fromtimestamp(int(event_dict["unix_timestamp"]))  # timestamp of event
+        Continue the simulation from a checkpoint: events of the log up to the checkpoint are not evaluated again,
+        they are only passed by `skipped_events`.
+
+        Args:
+            state (dict): result of `checkpoint_state` (see `checkpoint.read_checkpoint`)
+
+        """
+        self.skipped = state['position']
+        self.sent.bytes = bytearray(state['sent'])
+        self.alarms.bytes = bytearray(state['alarms'])
+        self.user_names = state['user_names']
+        self.user_codes = dict((user, code) for code, user in enumerate(self.user_names))
+        self.user_event_counts = state['user_event_counts']
+        self.user_anomaly_counts = state['user_anomaly_counts']
+        self.user_tp_counts = state['user_tp_counts']
+        self.user_fp_counts = state['user_fp_counts']
+        self.last_two_timestamps = state['last_two_timestamps']
+        self.recent_ids = deque(num for num, _, _, _ in state['recent_events'])
+        self.recent_events = dict((num, (timestamp, code, is_anomaly)) for num, timestamp, code, is_anomaly in state[
+            'recent_events'])
+        self.latest_reference = state['latest_reference']
+        self.last_acked_id = state['last_acked_id']
+        self.program_time = state['program_time']
+
+    def skipped_events(self):
+        """
+        Generator of events before the checkpoint of `restore`, without any bookkeeping. Must be consumed
+        before `events`.
+
+        Returns: (event_id, event_JSON_serialized_as_string)
+
+        """
+        for line_num, _, _, _, str_dump in islice(self.records, self.skipped):
+            yield line_num, str_dump
+        self.skipped = 0
+
+    def events(self):
+        """
+        Generator of event activity logs as JSON serialized strings per line.
+
+        Returns: (event_id, event_JSON_serialized_as_string)
+
+        """
+        for line_num, str_dump in self._read_events():
+            # return line id and serialized JSON as string representing one event
+            logger.info('%s > %s', self._get_inner_time(), str_dump)
+            yield line_num, str_dump
+
+    def abort(self, returncode, stderr_tail):
+        """
+        Contestants' script exited before the end of simulation: store all remaining events
+        as not reported without sending them and remember what happened for the final report.
+
+        Args:
+            returncode (int): exit code of contestants' script
+            stderr_tail (list): last lines written by contestants' script to stderr
+
+        """
+        if self.transcript is not None:
+            self.transcript.exited(returncode, stderr_tail, self.last_two_timestamps)
+        inner_time = self._get_inner_time()
+        logger.error(
+            '%s ! your script exited with code %s, last acknowledged event: %s',
+            inner_time, returncode, self.last_acked_id)
+        skipped = self.not_sent = sum(1 for _ in self._read_events())
+        logger.error('%s ! %i events left in the log are not reported', inner_time, skipped)
+        self.exit_report = [
+            'Script exited with code: %s' % returncode,
+            'Last acknowledged event: %s' % self.last_acked_id,
+            'Events not sent:         %i' % skipped,
+        ]
+        if stderr_tail:
+            self.exit_report.append('Last lines of stderr:')
+            self.exit_report.extend('    ' + line for line in stderr_tail)
 
     def _anomaly_check(self, line):
         """
@@ -115,189 +368,848 @@ class Evaluator(object):
             line (str): activity log as serialized JSON as string
 
         """
-        logger.info(self._get_inner_time() + ' < %s', line.strip())
+        logger.info('%s < %s', self._get_inner_time(), line.strip())
         if not line or not line.strip().isdigit():
             # format error
-            logger.error(self._get_inner_time() + ' ! `%s` can\'t be parsed, int is required', line)
+            logger.error('%s ! `%s` can\'t be parsed, int is required', self._get_inner_time(), line)
             return
 
         num = int(line.strip())
-        if num in self.event_timestamps:
+        if self.sent[num]:
             # check if not already reported
             if self.alarms[num]:
-                logger.error(self._get_inner_time() + ' ! you have already reported event n. %i', num)
+                logger.error('%s ! you have already reported event n. %i', self._get_inner_time(), num)
+            elif num not in self.recent_events:
+                logger.error(
+                    '%s ! late event %i reporting (event: older than %s, you already read events: %s and %s)',
+                    self._get_inner_time(), num,
+                    format_local_seconds(self.latest_reference - LOCAL_TIME_SETBACK - REPORT_TIME_LIMIT),
+                    self._get_inner_time(), format_local_seconds(self.last_two_timestamps[1]))
             else:
                 # check age of event
-                last_allowed_timestamp = self.event_timestamps[num] + datetime.timedelta(hours=1)
-                if self.last_two_timestamps[0] is None or self.last_two_timestamps[0] <= last_allowed_timestamp:
+                timestamp, code, is_anomaly = self.recent_events[num]
+                if self.last_two_timestamps[0] is None or self.last_two_timestamps[0] <= timestamp + REPORT_TIME_LIMIT:
                     self.alarms[num] = 1
+                    if is_anomaly:
+                        self.user_tp_counts[code] += 1
+                    else:
+                        self.user_fp_counts[code] += 1
                 else:
                     logger.error(
-                        self._get_inner_time() +
-                        ' ! late event %i reporting (event: %s, you already read events: %s and %s)',
-                        num, self.event_timestamps[num], self.last_two_timestamps[0], self.last_two_timestamps[1])
+                        '%s ! late event %i reporting (event: %s, you already read events: %s and %s)',
+                        self._get_inner_time(), num, format_local_seconds(timestamp),
+                        self._get_inner_time(), format_local_seconds(self.last_two_timestamps[1]))
         else:
             logger.error(
-                self._get_inner_time() + ' ! you are forbidden to predict event %i that you haven\'t seen yet', num)
+                '%s ! you are forbidden to predict event %i that you haven\'t seen yet', self._get_inner_time(), num)
+
+    def _parse_ack(self, msg, line_id):
+        """
+        Args:
+            msg (str): message from the stdout of the contestants' script
+            line_id (int): id of the oldest event waiting for acknowledgement
+
+        Returns:
+            id of the acknowledged event (`line_id` for plain `ok`), None if `msg` is not an acknowledgement
+
+        """
+        parts = msg.strip().lower().split()
+        if not parts or parts[0] != 'ok':
+            return None
+        if len(parts) == 1:
+            return line_id
+        if len(parts) == 2 and parts[1].isdigit():
+            return int(parts[1])
+        return None
+
+    def _acknowledge(self, num):
+        """
+        Remember that contestants have finished processing event `num` (and all events sent before it).
+
+        Args:
+            num (int): id of the acknowledged event
+
+        """
+        self.last_acked_id = num
+        if self.window != 1 and num in self.recent_events:
+            self.last_two_timestamps[0] = self.recent_events[num][0]
+            self._forget_old_events()
 
     def process_msg(self, msg, event_string, line_id):
         """
         Process output of contestants' script and inform about result to log output.
-        Two allowed inputs:
+        Three allowed inputs:
             `ok\n`: contestants' script is ready for next event log
+            `ok [0-9]+\n`: contestants' script is done with event id [0-9]+ and all events sent before it
             `[0-9]+\n`: contestants' script reports anomaly for event id [0-9]+
 
         Args:
             msg (str): message from the stdout of the contestants' script (or None for no answer)
             event_string (str): activity log sent to the contestants' script
-            line_id (int): id of activity log stored in `event_string`
+            line_id (int): id of activity log stored in `event_string` (the oldest event not acknowledged yet)
 
         Returns:
-            True to stop asking (ok was returned), otherwise False
+            True to stop asking (event `last_acked_id` was acknowledged), otherwise False
 
         """
+        if self.transcript is not None:
+            self.transcript.message(msg, line_id, self.last_two_timestamps)
         if msg is None:
             if line_id == -1:
                 # all events are known and we don't want to report anything else
-                logger.info(self._get_inner_time() + ' end of simulation')
+                logger.info('%s end of simulation', self._get_inner_time())
             else:
                 # failed to answer in time limit
-                logger.error(self._get_inner_time() + ' ! %i: no answer', line_id)
+                logger.error('%s ! %i: no answer', self._get_inner_time(), line_id)
             return True
-        if msg.strip().lower() == 'ok':
+        ack_id = self._parse_ack(msg, line_id)
+        if ack_id is not None:
             if line_id == -1:
                 # all events are known and we don't want to report anything else
-                logger.info(self._get_inner_time() + ' end of simulation')
+                logger.info('%s end of simulation', self._get_inner_time())
                 return True
+            elif ack_id < line_id or not self.sent[ack_id]:
+                logger.error(
+                    '%s ! `%s` doesn\'t acknowledge any event waiting for an answer',
+                    self._get_inner_time(), msg.strip())
+                return False
             else:
-                logger.info(self._get_inner_time() + ' < ok')
+                self._acknowledge(ack_id)
+                if self.window == 1:
+                    logger.info('%s < ok', self._get_inner_time())
+                else:
+                    logger.info('%s < ok %i', self._get_inner_time(), ack_id)
                 return True
         else:
             self._anomaly_check(msg)
             return False
 
-    def finish(self):
-        """Count F-measure and output script evaluation to stdout.
+    def replay_reports(self, reports):
+        """
+        Evaluate an offline detector: let all events pass as if contestants reported every event
+        of `reports` right after reading it and acknowledged each event with `ok`.
+
+        Args:
+            reports: set of ids of events reported as anomalies
+
+        """
+        for line_id, event_string in self.events():
+            if line_id in reports:
+                self.process_msg(str(line_id), event_string, line_id)
+            self.process_msg('ok', event_string, line_id)
+
+    def user_scores(self, users=None):
+        """
+        Args:
+            users: evaluate only these users (default: all users)
+
+        Returns:
+            list of (user, true positives, true negatives, false positives, false negatives, F-measure)
+
         """
-        distinct_users = set(self.users)
+        # keep the order of users of the set of all event users
+        distinct_users = set(self.user_names)
+        if users is not None:
+            distinct_users = [user for user in distinct_users if user in users]
 
+        scores = []
+        for user in distinct_users:
+            # confusion matrix from counts collected while reading events and accepting alarms
+            code = self.user_codes[user]
+            tp, fp = self.user_tp_counts[code], self.user_fp_counts[code]
+            fn = self.user_anomaly_counts[code] - tp
+            tn = self.user_event_counts[code] - tp - fp - fn
+            if tp == 0:
+                f_measure = 0
+            else:
+                f_measure = 2.0 * tp / (2 * tp + fn + fp)
+            scores.append((user, tp, tn, fp, fn, f_measure))
+        return scores
+
+    def finish(self, output_file=None, users=None):
+        """Count F-measure and output script evaluation to stdout.
+
+        Args:
+            output_file: file to write the evaluation to instead of stdout
+            users: evaluate only these users (default: all users)
+
+        Returns:
+            score (avg. user F-measure)
+        """
         output = []
         f_measures = []
-        for user in distinct_users:
+        for user, tp, tn, fp, fn, f_measure in self.user_scores(users):
             output.append(user)
-            tp, tn, fp, fn = 0.0, 0.0, 0.0, 0.0
-            for reported, present, event_user in zip(self.alarms, self.anomalies, self.users):
-                if event_user != user:
-                    continue
-                if present and reported:
-                    tp += 1
-                elif not present and not reported:
-                    tn += 1
-                elif not present and reported:
-                    fp += 1
-                elif present and not reported:
-                    fn += 1
             output.append('True positive:  %i' % tp)
             output.append('True negative:  %i' % tn)
             output.append('False positive: %i' % fp)
             output.append('False negative: %i' % fn)
-            if tp == 0:
-                f_measure = 0
-            else:
-                f_measure = 2.0 * tp / (2 * tp + fn + fp)
             f_measures.append(f_measure)
             output.append('F-measure:      %0.4f' % f_measure)
             output.append('-------------------------------------')
-        avg_f_measure = 1.0 * sum(f_measures) / len(f_measures)
+        # no users at all in an empty selection of the log
+        avg_f_measure = 1.0 * sum(f_measures) / len(f_measures) if f_measures else 0.0
         output.append('Score (avg. user F-measure): %0.6f' % avg_f_measure)
+        output.extend(self.exit_report)
         str_output = '\n'.join(output)
-        print(str_output)
+        print(str_output, file=output_file or sys.stdout)
         logger.debug(str_output)
+        return avg_f_measure
 
 
-def enqueue_output(out, queue):
-    for line in iter(out.readline, b''):
-        queue.put(line)
-    out.close()
-
-
-def main(command, log_path):
+def start_script(command, stats=None, wire='json', transport='pipe', limits=None):
     """
+    Start contestants' script.
 
     Args:
-        command:
-        log_path:
+        command (list): contestants' script with its parameters
+        stats (SimulationStats): collects resource usage of the script (optional)
+        wire (str): format of events sent to the script, `json` or `compact` (see wire.py)
+        transport (str): channel to the script, `pipe`, `socket` or `ring` (see transport.py)
+        limits (ContestantLimits): time budget, cores and resource limits of the script (see budget.py, optional)
 
     Returns:
+        ContestantChannel of the running script
 
     """
     logger.debug('PREPARING: %s', datetime.datetime.today())
     logger.info('preparing simulation')
-    program_timer = time.time()
-    ON_POSIX = 'posix' in sys.builtin_module_names
-    competition_process = Popen(command, stdin=PIPE, stdout=PIPE, stderr=PIPE, bufsize=1, close_fds=ON_POSIX)
-    queue = Queue()
-    thread = Thread(target=enqueue_output, args=(competition_process.stdout, queue))
-    thread.daemon = True # thread dies with the program
-    thread.start()
-
-    ev = Evaluator(log_path)
+    pipe = start_contestant(command, transport, limits.preexec() if limits is not None else None)
+    if limits is not None and limits.budget == 'cpu':
+        pipe.clock = CpuClock(pipe.process.pid)
+    if stats is not None:
+        stats.monitor = ProcessMonitor(pipe.process.pid)
+    if wire == 'compact':
+        pipe.encoder = CompactEncoder()
+        pipe.send(pipe.encoder.header())
+    return pipe
+
+
+def receive_answer(pipe, start, cpu_start, limit):
+    """
+    Wait for an answer of contestants' script for `limit` seconds: wall-clock seconds since `start`, or CPU seconds
+    of the script since `cpu_start` if they are measured by `pipe.clock` (at most `WALL_LIMIT_FACTOR` times
+    `limit` wall-clock seconds, see budget.py).
+
+    Returns:
+        the answer, None for no answer in time (or if the script exited)
+
+    """
+    clock = pipe.clock
+    if clock is None:
+        return pipe.receive(start + limit)
+    wall_deadline = start + limit * WALL_LIMIT_FACTOR
+    while True:
+        remaining = limit - (clock() - cpu_start)
+        now = time.time()
+        if remaining <= 0 or now >= wall_deadline:
+            return None
+        msg = pipe.receive(min(now + remaining, now + CPU_POLL_INTERVAL, wall_deadline))
+        if msg is not None or pipe.exited():
+            return msg
+
+
+def stream_log(pipe, ev, stats=None, control='exit'):
+    """
+    Let the running contestants' script process all events of `ev`. Afterwards, send it `control` line
+    (`exit`, or `reset` if another log follows) as the last opportunity to report anomalies.
+    With CPU time limits (`pipe.clock`, see budget.py), the script has PROGRAM_TIME_LIMIT CPU seconds for each log,
+    also when it processes several logs in one run; a resumed simulation continues with the time charged before
+    its checkpoint.
+
+    Args:
+        pipe (ContestantChannel): running contestants' script
+        ev (Evaluator): evaluator of the log
+        stats (SimulationStats): collects latencies of events and resource usage of the script (optional)
+        control (str): `exit` or `reset`
+
+    Returns:
+        True if the script is still running (otherwise the rest of the log is not reported, see `Evaluator.abort`)
+
+    """
+    window = ev.window
+    encoder = pipe.encoder
+    clock = pipe.clock
+    checkpoints = ev.checkpoints
+    exceeded = False  # the script used up PROGRAM_TIME_LIMIT
+    program_start = clock() - ev.program_time if clock is not None else None
     logger.debug('REAL START: %s', datetime.datetime.today())
-    logger.info(ev._get_inner_time() + ' start of simulation')
-    for line_id, event_string in ev.events():
-        if not event_string:
+    logger.info('%s start of simulation', ev._get_inner_time())
+    events = ev.events()
+    # dict event_id=>(event_string, time of sending), events waiting for acknowledgement
+    in_flight = OrderedDict()
+    while True:
+        if checkpoints is not None and checkpoints.due():
+            if in_flight:
+                # let the events in flight be acknowledged first, so that the checkpoint is consistent
+                window = len(in_flight)
+            else:
+                if clock is not None:
+                    ev.program_time = clock() - program_start
+                checkpoints.save(ev)
+                window = ev.window
+        while len(in_flight) < window:
+            line_id, event_string = next(events, (None, None))
+            if not event_string:
+                break
+            pipe.send(event_string + '\n' if encoder is None else encoder.encode(event_string))
+            sent_at = time.time()
+            if not in_flight:
+                start = sent_at
+                cpu_start = clock() if clock is not None else None
+            in_flight[line_id] = (event_string, sent_at)
+        if not in_flight:
             break
-        competition_process.stdin.write(event_string + '\n')
-        competition_process.stdin.flush()
-        start = time.time()
-        while True:
-            msg = None
-            while time.time() - start <= TIME_LIMIT:
-                try:
-                    msg = queue.get(timeout=0.2).strip()
+        # time limit of the oldest event runs from the moment the previous one was acknowledged
+        line_id, (event_string, _) = next(iter(in_flight.items()))
+        msg = receive_answer(pipe, start, cpu_start, TIME_LIMIT)
+        if msg is None and pipe.exited():
+            break
+        if msg is not None:
+            msg = msg.strip()
+        if ev.process_msg(msg, event_string, line_id):
+            acked_id = line_id if msg is None else ev.last_acked_id
+            now = time.time()
+            acked = []  # (event_id, time of sending) of acknowledged events
+            for pending_id in list(in_flight):
+                if pending_id > acked_id:
+                    break
+                acked.append((pending_id, in_flight.pop(pending_id)[1]))
+            if stats is not None:
+                if msg is None:
+                    stats.timed_out()
+                elif stats.startup is None:
+                    # the first answer includes the start of the script (loading of models etc.)
+                    stats.startup = now - stats.monitor.start
+                else:
+                    for pending_id, sent_at in acked:
+                        stats.acknowledged(ev.event_user(pending_id), now - sent_at)
+                stats.monitor.maybe_sample()
+            start = now
+            if clock is not None:
+                cpu_start = clock()
+                # CPU time of the script since the start of the log
+                if cpu_start - program_start > PROGRAM_TIME_LIMIT:
+                    exceeded = True
                     break
-                except Empty:
-                    pass
-            if ev.process_msg(msg, event_string, line_id):
-                break
 
-    logger.info(ev._get_inner_time() + ' last opportunity to report anomalies')
-    competition_process.stdin.write('exit\n')
-    competition_process.stdin.flush()
+    if stats is not None:
+        stats.monitor.sample()
+    if exceeded:
+        logger.error(
+            '%s ! your script exceeded the program time limit of %i s', ev._get_inner_time(), PROGRAM_TIME_LIMIT)
+        # stop the script, the rest of the log is not reported
+        ev.abort(pipe.wait_exit(0), pipe.stderr_tail())
+        ev.exit_report.insert(0, 'Program time limit exceeded: %i s' % PROGRAM_TIME_LIMIT)
+        return False
+    if pipe.exited():
+        # don't wait for answers of a dead script, count the rest of the log as not reported
+        ev.abort(pipe.wait_exit(TIME_LIMIT), pipe.stderr_tail())
+        return False
+    logger.info('%s last opportunity to report anomalies', ev._get_inner_time())
+    pipe.send(control + '\n')
     start = time.time()
+    cpu_start = clock() if clock is not None else None
+    while True:
+        msg = receive_answer(pipe, start, cpu_start, TIME_LIMIT * 2)
+        if ev.process_msg(msg, '', -1):
+            break
+    return True
+
+
+def replay_skipped(pipe, ev):
+    """
+    Let the running contestants' script process events before the checkpoint of a resumed simulation again,
+    as fast as it acknowledges them, ignoring its reports (the evaluation of these events is restored).
+
+    Args:
+        pipe (ContestantChannel): running contestants' script
+        ev (Evaluator): evaluator restored from a checkpoint
+
+    """
+    encoder = pipe.encoder
+    logger.info('%s replaying %i events before the checkpoint', ev._get_inner_time(), ev.skipped)
+    events = ev.skipped_events()
+    in_flight = deque()  # ids of events waiting for acknowledgement
     while True:
-        msg = None
-        while time.time() - start <= TIME_LIMIT * 2:
-            try:
-                msg = queue.get(timeout=0.2)
+        while len(in_flight) < ev.window:
+            line_id, event_string = next(events, (None, None))
+            if not event_string:
                 break
-            except Empty:
+            pipe.send(event_string + '\n' if encoder is None else encoder.encode(event_string))
+            in_flight.append(line_id)
+        if not in_flight:
+            break
+        msg = pipe.receive(time.time() + TIME_LIMIT)
+        if msg is None and pipe.exited():
+            break
+        acked_id = in_flight[0] if msg is None else ev._parse_ack(msg, in_flight[0])
+        while in_flight and acked_id is not None and in_flight[0] <= acked_id:
+            in_flight.popleft()
+    # the rest of skipped events if the script exited
+    for _ in events:
+        pass
+
+
+def resume_script(pipe, ev, mode):
+    """
+    Bring the running contestants' script to the state of the checkpoint `ev` was restored from
+    (see checkpoint.py).
+
+    Args:
+        pipe (ContestantChannel): running contestants' script
+        ev (Evaluator): evaluator restored from a checkpoint
+        mode (str): `handshake` to ask the script to restore its own state first, `replay` to replay the events
+
+    """
+    if mode == 'handshake':
+        logger.info('%s resuming after event %s', ev._get_inner_time(), ev.last_acked_id)
+        pipe.send('resume %s\n' % ev.last_acked_id)
+        msg = pipe.receive(time.time() + TIME_LIMIT * 2)
+        if msg is not None and msg.strip().lower() == 'ok':
+            for _ in ev.skipped_events():
                 pass
-        if ev.process_msg(msg, '', -1):
+            return
+        if msg is None or msg.strip().lower() != 'replay':
+            logger.error('%s ! `%s` doesn\'t answer the resume handshake', ev._get_inner_time(), msg and msg.strip())
+    replay_skipped(pipe, ev)
+
+
+def simulate(command, ev, stats=None, wire='json', transport='pipe', resume=None, limits=None):
+    """
+    Run contestants' script and let it process all events of `ev`.
+
+    Args:
+        command (list): contestants' script with its parameters
+        ev (Evaluator): evaluator of the simulation
+        stats (SimulationStats): collects latencies of events and resource usage of the script (optional)
+        wire (str): format of events sent to the script, `json` or `compact` (see wire.py)
+        transport (str): channel to the script, `pipe`, `socket` or `ring` (see transport.py)
+        resume (str): `ev` was restored from a checkpoint, bring the script to its state by `replay` or
+            `handshake` (see `resume_script`)
+        limits (ContestantLimits): time budget, cores and resource limits of the script (see budget.py, optional)
+
+    """
+    pipe = start_script(command, stats, wire, transport, limits)
+    if resume:
+        resume_script(pipe, ev, resume)
+    if stream_log(pipe, ev, stats):
+        pipe.wait_exit(TIME_LIMIT)
+    close_script(pipe, stats)
+    logger.debug('REAL END: %s', datetime.datetime.today())
+
+
+def close_script(pipe, stats=None):
+    """Release the channel to the exited contestants' script."""
+    pipe.close()
+    if pipe.clock is not None:
+        pipe.clock.close()
+    if stats is not None:
+        stats.monitor.stopped()
+
+
+def simulate_logs(command, evaluators, stats=None, wire='json', transport='pipe', limits=None):
+    """
+    Run contestants' script once and let it process several logs (warm server mode). Logs are separated
+    by `reset` line, the script answers it like `exit` and forgets the previous log (ids start from 0 again).
+
+    Args:
+        command (list): contestants' script with its parameters
+        evaluators: iterable of Evaluator, one for each log (created one by one as they are needed)
+        stats (SimulationStats): collects latencies of events and resource usage of the script (optional)
+        wire (str): format of events sent to the script, `json` or `compact` (see wire.py)
+        transport (str): channel to the script, `pipe`, `socket` or `ring` (see transport.py)
+        limits (ContestantLimits): time budget, cores and resource limits of the script (see budget.py, optional)
+
+    Returns:
+        generator of `evaluators`, each one after its log was processed
+
+    """
+    pipe = start_script(command, stats, wire, transport, limits)
+    evaluators = iter(evaluators)
+    ev = next(evaluators, None)
+    running = True
+    while ev is not None:
+        next_ev = next(evaluators, None)
+        if running:
+            running = stream_log(pipe, ev, stats, 'exit' if next_ev is None else 'reset')
+        else:
+            # the script exited during one of previous logs
+            ev.abort(pipe.wait_exit(TIME_LIMIT), pipe.stderr_tail())
+        yield ev
+        ev = next_ev
+    if running:
+        pipe.wait_exit(TIME_LIMIT)
+    close_script(pipe, stats)
+    logger.debug('REAL END: %s', datetime.datetime.today())
+
+
+def _call_detector(ev, method, args, timeout):
+    """
+    Call a method of an in-process detector within the time limit.
+
+    Returns:
+        list of reported ids, None for no answer in time, False if the detector raised an exception
+        (the simulation is aborted as if contestants' script exited)
+
+    """
+    try:
+        return list(call_with_deadline(method, args, timeout))
+    except DeadlineExceeded:
+        return None
+    except Exception:
+        ev.abort(1, traceback.format_exc().splitlines()[-10:])
+        return False
+
+
+def simulate_module(detector, ev, stats=None):
+    """
+    Let an in-process detector (see plugin.py) process all events of `ev` in batches of `ev.window` events.
+
+    Reports and acknowledgements are passed to `ev.process_msg` the same way as answers of scripts,
+    so the checks, the trace and the transcript are the same as for a script answering each batch
+    with its reports and `ok` (`ok LAST_ID` with window > 1).
+
+    Args:
+        detector: object with `process_batch(events) -> reported ids` and optionally `finish() -> reported ids`
+        ev (Evaluator): evaluator of the simulation
+        stats (SimulationStats): collects latencies of events (optional)
+
+    """
+    logger.debug('REAL START: %s', datetime.datetime.today())
+    logger.info('%s start of simulation', ev._get_inner_time())
+    events = ev.events()
+    while True:
+        batch = list(islice(events, ev.window))
+        if not batch:
             break
+        line_id, event_string = batch[0]
+        last_id = batch[-1][0]
+        activity_logs = [json.loads(str_dump) for _, str_dump in batch]
+        start = time.time()
+        # the same time as scripts get for acknowledging the events one by one
+        reported = _call_detector(ev, detector.process_batch, (activity_logs,), TIME_LIMIT * len(batch))
+        if reported is False:
+            return
+        latency = time.time() - start
+        if reported is None:
+            ev.process_msg(None, event_string, line_id)
+        else:
+            for num in reported:
+                ev.process_msg(str(num), event_string, line_id)
+            ev.process_msg('ok' if ev.window == 1 else 'ok %i' % last_id, event_string, line_id)
+        if stats is not None:
+            for num, _ in batch:
+                if reported is None:
+                    stats.timed_out()
+                else:
+                    stats.acknowledged(ev.event_user(num), latency)
 
+    logger.info('%s last opportunity to report anomalies', ev._get_inner_time())
+    reported = []
+    if hasattr(detector, 'finish'):
+        reported = _call_detector(ev, detector.finish, (), TIME_LIMIT * 2)
+        if reported is False:
+            return
+    for num in reported or []:
+        ev.process_msg(str(num), '', -1)
+    ev.process_msg(None if reported is None else 'ok', '', -1)
     logger.debug('REAL END: %s', datetime.datetime.today())
-    assert program_timer - time.time() <= PROGRAM_TIME_LIMIT
+
+
+def record_transcript(ev, path, command, log_path, selection=None, resume=None):
+    """
+    Let `ev` record answers of contestants' script to a transcript at `path` (see rescore.py),
+    continuing the transcript of checkpoint `resume` (optional).
+    """
+    header = {'log': log_path, 'window': ev.window, 'command': command}
+    if selection:
+        header['selection'] = selection
+    ev.transcript = TranscriptWriter(path, resume=resume, **header)
+
+
+def restore_checkpoint(ev, path, header):
+    """
+    Restore `ev` from the checkpoint at `path` (see checkpoint.py).
+
+    Args:
+        header (dict): header of checkpoints of the current simulation, must be the same as the stored one
+
+    Returns:
+        the restored state
+
+    """
+    stored_header, state = read_checkpoint(path)
+    header = json.loads(json.dumps(dict(header, version=stored_header['version'])))
+    for key in sorted(set(header) | set(stored_header)):
+        if header.get(key) != stored_header.get(key):
+            raise ValueError('%s is a checkpoint of another simulation, %s differs: %s (now %s)' % (
+                path, key, stored_header.get(key), header.get(key)))
+    ev.restore(state)
+    logger.info('resuming from %s after %i events', path, ev.skipped)
+    return state
+
+
+def main(
+        command, log_path, window=1, transcript_path=None, stats_path=None, module=None, selection=None,
+        wire='json', transport='pipe', checkpoint_path=None, checkpoint_interval=60, resume=None, limits=None):
+    """
+
+    Args:
+        command:
+        log_path:
+        window (int): max number of events sent to the contestants' script and not acknowledged yet
+            (size of batches of an in-process detector)
+        transcript_path: path of a transcript of the simulation to write (optional)
+        stats_path: path of JSON with latencies and resource usage of the script to write (optional)
+        module: `module:Class` of an in-process detector evaluated instead of `command` (see plugin.py)
+        selection (dict): evaluate only some users and/or a time range (see `Evaluator`)
+        wire (str): format of events sent to the script, `json` or `compact` (see wire.py)
+        transport (str): channel to the script, `pipe`, `socket` or `ring` (see transport.py)
+        checkpoint_path: path of checkpoints of the simulation of the script (optional, see checkpoint.py)
+        checkpoint_interval (float): seconds between checkpoints
+        resume (str): continue from the checkpoint, bringing the script to its state by `replay` or `handshake`
+        limits (ContestantLimits): time budget, cores and resource limits of the script (see budget.py, optional)
+
+    Returns:
+
+    """
+    ev = Evaluator(log_path, window=window, selection=selection)
+    state = None
+    if checkpoint_path and command:
+        log_stat = os.stat(log_path)
+        header = {
+            'log': log_path, 'log_size': log_stat.st_size, 'log_mtime': log_stat.st_mtime, 'command': command,
+            'window': window, 'selection': selection, 'wire': wire, 'transcript': transcript_path or None}
+        if resume:
+            state = restore_checkpoint(ev, checkpoint_path, header)
+        ev.checkpoints = CheckpointWriter(checkpoint_path, checkpoint_interval, **header)
+    if transcript_path:
+        record_transcript(
+            ev, transcript_path, command or ['--module', module], log_path, selection,
+            resume=state and state['transcript'])
+    stats = SimulationStats() if stats_path else None
+    if module:
+        start = time.time()
+        detector = load_detector(module)
+        if stats is not None:
+            stats.startup = time.time() - start
+        simulate_module(detector, ev, stats)
+    else:
+        simulate(command, ev, stats, wire, transport, resume, limits)
+    if ev.checkpoints is not None:
+        ev.checkpoints.close()
+    if ev.transcript is not None:
+        ev.transcript.close()
     ev.finish()
+    if stats is not None:
+        stats.save(stats_path)
 
 
-if __name__ == '__main__':
-    # logging
-    logger = logging.getLogger(__name__)
-    file_log = logging.FileHandler('evaluator.log')  # create file handler
-    file_log.setLevel(logging.DEBUG)
-    stderr_log = logging.StreamHandler()  # create console handler with a higher log level
-    stderr_log.setLevel(logging.INFO)
-    # create formatter and add it to the handlers
-    formatter = logging.Formatter('%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    stderr_log.setFormatter(formatter)
-    file_log.setFormatter(formatter)
-    # add the handlers to logger
-    logger.addHandler(stderr_log)
-    logger.addHandler(file_log)
-    logger.setLevel(logging.DEBUG)
-    logger.info("running %s", " ".join(sys.argv))
+def log_name(log_path):
+    """
+    Returns:
+        name of the results of a log, its file name without extension
+    """
+    name = os.path.basename(log_path)
+    if name.endswith('.gz'):
+        name = name[:-len('.gz')]
+    return os.path.splitext(name)[0]
+
 
+def expand_logs(paths):
+    """
+    Args:
+        paths (list): paths of logs and directories with logs (`*.log` and `*.log.gz` files)
+
+    Returns:
+        list of paths of logs
+
+    """
+    log_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            log_paths.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.endswith('.log') or name.endswith('.log.gz'))
+        else:
+            log_paths.append(path)
+    return log_paths
+
+
+def main_warm(
+        command, log_paths, results_dir, window=1, stats_path=None, selection=None, wire='json', transport='pipe',
+        limits=None):
+    """
+    Start the script once and evaluate it on several logs (see `simulate_logs`).
+    With CPU time limits, the script has PROGRAM_TIME_LIMIT for each of the logs, not for all of them together.
+
+    Args:
+        command (list): contestants' script with its parameters
+        log_paths (list): paths to logs for testing, result of log NAME.log goes to `results_dir`/NAME.txt
+        results_dir: directory for results and transcripts of logs
+        window (int): max number of events sent to the contestants' script and not acknowledged yet
+        stats_path: path of JSON with latencies and resource usage of the script to write (optional)
+        selection (dict): evaluate only some users and/or a time range of each log (see `Evaluator`)
+        wire (str): format of events sent to the script, `json` or `compact` (see wire.py)
+        transport (str): channel to the script, `pipe`, `socket` or `ring` (see transport.py)
+        limits (ContestantLimits): time budget, cores and resource limits of the script (see budget.py, optional)
+
+    """
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+
+    def evaluators():
+        for log_path in log_paths:
+            ev = Evaluator(log_path, window=window, selection=selection)
+            record_transcript(
+                ev, os.path.join(results_dir, log_name(log_path) + '.transcript.gz'), command, log_path, selection)
+            yield ev
+
+    stats = SimulationStats() if stats_path else None
+    # the generator is consumed to its end, so that the script is reaped after the last log
+    paths = iter(log_paths)
+    for ev in simulate_logs(command, evaluators(), stats, wire, transport, limits):
+        log_path = next(paths)
+        ev.transcript.close()
+        with open(os.path.join(results_dir, log_name(log_path) + '.txt'), 'w') as output_file:
+            score = ev.finish(output_file)
+        logger.info('%s: %0.6f', log_name(log_path), score)
+    if stats is not None:
+        stats.save(stats_path)
+
+
+shared_records = []  # parsed log shared by workers of `main_batch` (inherited by forked processes)
+worker_cpus = None  # cores the scripts evaluated by a worker of `main_batch` are pinned to
+
+
+def init_worker(cpu_sets):
+    """Take cores of a worker process of `main_batch` from queue `cpu_sets`."""
+    global worker_cpus
+    worker_cpus = cpu_sets.get()
+
+
+def evaluate_submission(submission):
+    """
+    Evaluate one script of `main_batch` in a worker process, against `shared_records`.
+
+    Args:
+        submission: (
+            name, command, log_path, window, results_dir, trace_level, binary_trace, selection, wire, transport,
+            limits)
+
+    Returns:
+        (name, score)
+
+    """
+    (name, command, log_path, window, results_dir, trace_level, binary_trace, selection, wire, transport,
+     limits) = submission
+    if worker_cpus is not None:
+        limits = (limits or ContestantLimits()).pinned(worker_cpus)
+    # trace of each submission goes to its own file instead of the shared stderr
+    trace_path = os.path.join(results_dir, name + ('.trace' if binary_trace else '.log'))
+    trace = trace_log.configure(logger, 'off', trace_level, trace_path, binary=binary_trace, append=False)
+    try:
+        ev = Evaluator(None, window=window, records=shared_records)
+        record_transcript(ev, os.path.join(results_dir, name + '.transcript.gz'), command, log_path, selection)
+        stats = SimulationStats()
+        simulate(command, ev, stats, wire, transport, limits=limits)
+        ev.transcript.close()
+        with open(os.path.join(results_dir, name + '.txt'), 'w') as output_file:
+            score = ev.finish(output_file)
+        stats.save(os.path.join(results_dir, name + '.stats.json'))
+    finally:
+        trace.close()
+    return name, score
+
+
+def main_batch(
+        submissions, log_path, results_dir, window=1, processes=None, trace_level='debug', binary_trace=False,
+        selection=None, wire='json', transport='pipe', limits=None, cpu_sets=None):
+    """
+    Parse the log once and evaluate several scripts against it in parallel worker processes.
+
+    Args:
+        submissions (list): (name, command) pairs, result of submission `name` goes to `results_dir`/`name`.txt
+        log_path: path to logs for testing
+        results_dir: directory for results and logs of submissions
+        window (int): max number of events sent to the contestants' script and not acknowledged yet
+        processes (int): number of worker processes (default: number of CPU cores)
+        trace_level (str): trace level of the trace of each submission (see `trace_log.TRACE_LEVELS`)
+        binary_trace (bool): store traces of submissions in the binary format
+        selection (dict): evaluate only some users and/or a time range (see `Evaluator`)
+        wire (str): format of events sent to the scripts, `json` or `compact` (see wire.py)
+        transport (str): channel to the scripts, `pipe`, `socket` or `ring` (see transport.py)
+        limits (ContestantLimits): time budget and resource limits of the scripts (see budget.py, optional)
+        cpu_sets (list): lists of cores, scripts evaluated by each worker process are pinned to its own one
+            (default: number of processes is the number of core sets)
+
+    """
+    logger.info('parsing %s', log_path)
+    shared_records[:] = select_records(log_path, **selection) if selection else read_records(log_path)
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    if cpu_sets:
+        processes = min(processes or len(cpu_sets), len(cpu_sets))
+    processes = min(processes or multiprocessing.cpu_count(), len(submissions))
+    logger.info('evaluating %i scripts in %i processes', len(submissions), processes)
+    if cpu_sets:
+        queue = multiprocessing.Queue()
+        for cpus in cpu_sets[:processes]:
+            queue.put(cpus)
+        pool = multiprocessing.Pool(processes, init_worker, (queue,))
+    else:
+        pool = multiprocessing.Pool(processes)
+    try:
+        jobs = [
+            (name, command, log_path, window, results_dir, trace_level, binary_trace, selection, wire, transport,
+             limits)
+            for name, command in submissions]
+        for name, score in pool.imap_unordered(evaluate_submission, jobs):
+            logger.info('%s: %0.6f', name, score)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def submission_name(script):
+    """
+    Args:
+        script (str): `name=command` or just `command`
+
+    Returns:
+        (name, command) where `name` defaults to the script file name without extension
+        (the first parameter with an extension, so that `python ./script.py` is named `script`)
+
+    """
+    name, sep, command = script.partition('=')
+    if sep and name and os.sep not in name and ' ' not in name:
+        return name, command
+    paths = [os.path.basename(par) for par in script.split()]
+    path = next((par for par in paths if os.path.splitext(par)[1]), paths[0])
+    return os.path.splitext(path)[0], script
+
+
+def unix_time(value):
+    """
+    Args:
+        value (str): unix timestamp, or local date `YYYY-MM-DD` or local time `YYYY-MM-DD HH:MM:SS`
+
+    Returns:
+        unix timestamp (int)
+
+    """
+    if value.isdigit():
+        return int(value)
+    for time_format in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return int(time.mktime(time.strptime(value, time_format)))
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError("`%s` is neither unix timestamp nor YYYY-MM-DD [HH:MM:SS]" % value)
+
+
+if __name__ == '__main__':
     # check and process cmdline input
     program = os.path.basename(sys.argv[0])
     parser = argparse.ArgumentParser(
@@ -305,12 +1217,150 @@ if __name__ == '__main__':
         formatter_class=argparse.RawTextHelpFormatter,
         description=globals()['__doc__'])
     parser.add_argument(
-        '-l', '--logs', required=True,
-        help="path to a file with activity logs for testing")
-    parser.add_argument(
-        '-s', '--script', required=True,
+        '-l', '--logs', required=True, nargs='+',
+        help="path to a file with activity logs for testing; with --script, several logs or directories\n"
+        "with *.log and *.log.gz files are streamed through one run of the script, separated by `reset` lines,\n"
+        "results of each log are written to RESULTS/NAME.txt")
+    scripts = parser.add_mutually_exclusive_group(required=True)
+    scripts.add_argument(
+        '-s', '--script',
         help="path to a script to evaluate logs, to include parameters, wrap parameters into quotes")
+    scripts.add_argument(
+        '--scripts', nargs='+', metavar='[NAME=]SCRIPT',
+        help="scripts to evaluate in parallel, results of each are written to RESULTS/NAME.txt")
+    scripts.add_argument(
+        '--module', metavar='MODULE:CLASS',
+        help="in-process Python detector to evaluate instead of a script, it gets batches of --window events\n"
+        "(see plugin.py), e.g. example:Detector")
+    parser.add_argument(
+        '--results', default='results',
+        help="directory for results of --scripts and of several --logs (default: results)")
+    parser.add_argument(
+        '-j', '--processes', type=int,
+        help="number of scripts evaluated at once by --scripts (default: number of CPU cores)")
+    parser.add_argument(
+        '-w', '--window', type=int, default=1,
+        help="max number of events sent to the script and not acknowledged yet (default: 1)")
+
+    parser.add_argument(
+        '--wire', choices=WIRE_FORMATS, default='json',
+        help="format of events sent to the script: a JSON object per line or the compact format\n"
+        "with repeated values sent only once (see wire.py, default: json)")
+    parser.add_argument(
+        '--transport', choices=TRANSPORTS, default='pipe',
+        help="channel to the script: stdin/stdout, a Unix domain socket or a shared memory ring buffer\n"
+        "(see transport.py, default: pipe)")
+    parser.add_argument(
+        '--budget', choices=BUDGETS, default='wall',
+        help="charge scripts wall-clock time, or only CPU time they used themselves, so that time limits\n"
+        "don't depend on other evaluations running on the host (see budget.py, default: wall)")
+    parser.add_argument(
+        '--cpus', nargs='+', type=parse_cpus, metavar='CORES',
+        help="pin the script to CORES, e.g. 0-3,8; with --scripts, scripts of each worker process are pinned\n"
+        "to its own CORES (default number of processes is the number of CORES)")
+    parser.add_argument(
+        '--rlimit', nargs='+', type=parse_rlimit, metavar='NAME=VALUE',
+        help="resource limits of the script, e.g. as=4G nofile=256 (see `man setrlimit`)")
+    parser.add_argument(
+        '-u', '--users', nargs='+',
+        help="evaluate only events of these users (read through the index of the log, see activity_log.py)")
+    parser.add_argument(
+        '--from', dest='start', type=unix_time, metavar='TIME',
+        help="evaluate only events from TIME: unix timestamp or local YYYY-MM-DD [HH:MM:SS]")
+    parser.add_argument(
+        '--to', dest='end', type=unix_time, metavar='TIME',
+        help="evaluate only events before TIME: unix timestamp or local YYYY-MM-DD [HH:MM:SS]")
+
+    parser.add_argument(
+        '--transcript', default='evaluator.transcript.gz',
+        help="path of a transcript of the simulation for rescore.py, empty to disable (default: %(default)s);\n"
+        "--scripts write it to RESULTS/NAME.transcript.gz")
+    parser.add_argument(
+        '--stats', default='evaluator.stats.json',
+        help="path of JSON with latencies of events and resource usage of the script, empty to disable\n"
+        "(default: %(default)s); --scripts write it to RESULTS/NAME.stats.json")
+    parser.add_argument(
+        '--checkpoint', default='',
+        help="path of checkpoints of the simulation of --script (default: no checkpoints);\n"
+        "it is removed when the simulation finishes (see checkpoint.py)")
+    parser.add_argument(
+        '--checkpoint-interval', type=float, default=60,
+        help="seconds between checkpoints (default: 60)")
+    parser.add_argument(
+        '--resume', nargs='?', choices=RESUME_MODES, const='replay',
+        help="continue an interrupted simulation of --script from --checkpoint: `replay` events before it\n"
+        "to the script (default), or ask the script to restore its own state by `handshake`")
+    parser.add_argument(
+        '--trace-stderr', choices=sorted(trace_log.TRACE_LEVELS), default='full',
+        help="trace level of stderr (default: full)")
+    parser.add_argument(
+        '--trace-file', choices=sorted(trace_log.TRACE_LEVELS), default='debug',
+        help="trace level of evaluator.log (default: debug)")
+    parser.add_argument(
+        '--trace-format', choices=['text', 'binary'], default='text',
+        help="format of the file trace, binary trace is written to evaluator.trace (default: text)")
 
     args = parser.parse_args()
-    main(args.script.split(), args.logs)
-    logger.info("finished running %s", program)
+    if args.window < 1:
+        parser.error("--window must be a positive number")
+    log_paths = expand_logs(args.logs)
+    warm = len(log_paths) != 1 or os.path.isdir(args.logs[0])
+    if warm and not args.script:
+        parser.error("several logs can be evaluated only with --script")
+    if not log_paths:
+        parser.error("no logs found in %s" % ' '.join(args.logs))
+    if args.resume and (warm or not args.script or not args.checkpoint):
+        parser.error("--resume continues a simulation of one --script on one log from --checkpoint")
+    if args.resume and not os.path.exists(args.checkpoint):
+        parser.error("no checkpoint %s to resume from" % args.checkpoint)
+    if args.checkpoint_interval <= 0:
+        parser.error("--checkpoint-interval must be a positive number")
+    if args.module and (args.budget != 'wall' or args.cpus or args.rlimit):
+        parser.error("--budget, --cpus and --rlimit apply only to scripts")
+    if args.cpus and len(args.cpus) > 1 and not args.scripts:
+        parser.error("several CORES can be given only with --scripts")
+    log_names = [log_name(log_path) for log_path in log_paths]
+    if len(set(log_names)) != len(log_names):
+        parser.error("logs must have unique file names, results of each are stored to RESULTS/NAME.txt")
+
+    selection = None
+    if args.users or args.start is not None or args.end is not None:
+        selection = {'users': args.users, 'start': args.start, 'end': args.end}
+
+    limits = None
+    if args.budget != 'wall' or args.cpus or args.rlimit:
+        limits = ContestantLimits(args.budget, args.cpus[0] if args.cpus and not args.scripts else None, args.rlimit)
+
+    if args.scripts:
+        submissions = [submission_name(script) for script in args.scripts]
+        submissions = [(name, command.split()) for name, command in submissions]
+        names = [name for name, _ in submissions]
+        if len(set(names)) != len(names):
+            parser.error("--scripts must have unique names, use NAME=SCRIPT to name them")
+
+    # logging
+    binary_trace = args.trace_format == 'binary'
+    trace = trace_log.configure(
+        logger, args.trace_stderr, args.trace_file, 'evaluator.trace' if binary_trace else 'evaluator.log',
+        binary=binary_trace)
+    try:
+        logger.info("running %s", " ".join(sys.argv))
+        if args.scripts:
+            main_batch(
+                submissions, log_paths[0], args.results, window=args.window, processes=args.processes,
+                trace_level=args.trace_file, binary_trace=binary_trace, selection=selection, wire=args.wire,
+                transport=args.transport, limits=limits, cpu_sets=args.cpus)
+        elif warm:
+            main_warm(
+                args.script.split(), log_paths, args.results, window=args.window, stats_path=args.stats,
+                selection=selection, wire=args.wire, transport=args.transport, limits=limits)
+        else:
+            main(
+                args.script.split() if args.script else None, log_paths[0], window=args.window,
+                transcript_path=args.transcript, stats_path=args.stats, module=args.module, selection=selection,
+                wire=args.wire, transport=args.transport, checkpoint_path=args.checkpoint,
+                checkpoint_interval=args.checkpoint_interval, resume=args.resume, limits=limits)
+        logger.info("finished running %s", program)
+    finally:
+        # write the queued trace also when the evaluation fails, its end tells what happened
+        trace.close()
@@ -16,6 +16,17 @@ Examples:
 
     # Simulate all errors:
     ./example.py -l -f -u -r -t
+
+    # Run the detection inside the evaluator process (see `Detector`):
+    ./evaluator.py --logs example.log --module example:Detector
+
+    # Read events in the compact wire format (needs wire.py of the evaluator):
+    ./evaluator.py --logs example.log --script ./example.py --wire compact
+
+    # Talk to the evaluator over a Unix domain socket (needs transport.py of the evaluator):
+    ./evaluator.py --logs example.log --script ./example.py --transport socket
+
+With the default wire format and transport, this file alone is a complete contestants' script.
 """
 import os
 import sys
@@ -28,11 +39,58 @@ import time
 date_format = "%Y-%m-%d %H:%M:%S"
 
 
+def is_alarm(activity_log):
+    """
+    Args:
+        activity_log (dict): one event
+
+    Returns:
+        True if the event is anomalous
+
+    """
+    # timestamp of event
+    timestamp = datetime.datetime.fromtimestamp(int(activity_log["unix_timestamp"]))
+    if timestamp.isoweekday() > 4:
+        # alarm for all events on Fri, Sat and Sun
+        return True
+    if timestamp.second == 0:
+        # alarm for all events occurring with 0 seconds timestamps
+        return True
+    return False
+
+
+class Detector(object):
+    """
+    The same detection run inside the evaluator process, without pipes:
+        ./evaluator.py --logs example.log --module example:Detector
+    """
+
+    def __init__(self):
+        self.events_count = 0
+
+    def process_batch(self, events):
+        """
+        Args:
+            events (list): events (dicts) in the order of the log
+
+        Returns:
+            ids of anomalous events
+        """
+        self.events_count += len(events)
+        return [activity_log['id'] for activity_log in events if is_alarm(activity_log)]
+
+    def finish(self):
+        """Report the last event as anomaly to demonstrate functionality, as `main` does before exit."""
+        if self.events_count > 1:
+            return [self.events_count - 1]
+        return []
+
+
 def main(
         simulate_late_report=True, simulate_format_error=True, simulate_unseen_error=True,
         simulate_repeted_error=True, simulate_timeout_error=True):
     """
-    Read from stdin and write to stdout.
+    Read from stdin and write to stdout (or another channel chosen by the evaluator with --transport).
 
     Args:
         simulate_late_report (bool): turn on/off
@@ -42,47 +100,56 @@ def main(
         simulate_timeout_error (bool): turn on/off
 
     """
+    stdin, stdout = sys.stdin, sys.stdout
+    if os.environ.get('RAREBOT_TRANSPORT', 'pipe') != 'pipe':
+        # the evaluator runs with --transport socket or ring, connect by transport.py of the evaluator
+        from transport import connect
+        stdin = stdout = connect()
     line_counter = -1
+    decoder = None  # CompactDecoder of the compact wire format, if the evaluator runs with --wire compact
     while True:  # repeat until empty line
         line_counter += 1
-        line = sys.stdin.readline()  # read line from stdin (including \n character)
+        line = stdin.readline()  # read line from stdin (including \n character)
         # count your time
         loop_start_time = time.time()
 
-        if not line or line.strip() == 'exit':  # if line is empty or exit string, break loop
+        # if line is empty or exit string, break loop (reset string: the end of a log, continue with another one)
+        if not line or line.strip() in ('exit', 'reset'):
             # +----------------------------------------------------+
             # | before the end of script, you can report anomalies |
             # +----------------------------------------------------+
             if line_counter > 1:
                 # report last line as anomaly to demonstrate functionality
-                sys.stdout.write('%i\n' % (line_counter - 1))
-                sys.stdout.flush()
+                stdout.write('%i\n' % (line_counter - 1))
+                stdout.flush()
             # write `ok\n` for system not to wait for another output
-            sys.stdout.write('ok\n')
-            sys.stdout.flush()
+            stdout.write('ok\n')
+            stdout.flush()
             # +----------------------------------------------------+
+            if line.strip() == 'reset':
+                # another log follows, its ids start from 0 again
+                line_counter = -1
+                continue
             # break to end infinite loop
             break
 
-        # convert JSON serialized string to object (Python dict)
-        activity_log = json.loads(line)
-
-        # timestamp of event
-        timestamp = datetime.datetime.fromtimestamp(int(activity_log["unix_timestamp"]))
+        if decoder is None and line.startswith('#wire'):
+            # the first line declares the compact format, decode events by wire.py of the evaluator
+            from wire import CompactDecoder
+            decoder = CompactDecoder()
+        # convert JSON serialized string (or compact line) to object (Python dict)
+        activity_log = json.loads(line) if decoder is None else decoder.decode(line)
+        if activity_log is None:
+            # definition of the compact format, not an event
+            line_counter -= 1
+            continue
 
         # +----------------------------------------------------+
         # | report this or older events before writing `ok\n`  |
         # +----------------------------------------------------+
-        is_alarm = False
-        if timestamp.isoweekday() > 4:
-            # alarm for all events on Fri, Sat and Sun
-            is_alarm = True
-        if timestamp.second == 0:
-            # alarm for all events occurring with 0 seconds timestamps
-            is_alarm = True
-        if is_alarm:
-            sys.stdout.write(str(activity_log['id']) + '\n')
-            sys.stdout.flush()
+        if is_alarm(activity_log):
+            stdout.write(str(activity_log['id']) + '\n')
+            stdout.flush()
 
         # +----------------------------------------------------+
         # | examples of bad code                               |
@@ -91,34 +158,34 @@ def main(
         # after acceptance of the first event E2 older than
         # E1 by at least 1 hour (time(E2) > time(E1) + 1 hour
         if simulate_late_report and line_counter == 13:
-            sys.stdout.write('4\n')
-            sys.stdout.flush()
+            stdout.write('4\n')
+            stdout.flush()
 
         # to report the event, output its id (int) and newline
         if simulate_format_error and line_counter == 7:
-            sys.stdout.write('EVENT 0\n')
-            sys.stdout.flush()
+            stdout.write('EVENT 0\n')
+            stdout.flush()
 
         # don't report ids which weren't sent to you yet
         if simulate_unseen_error and line_counter == 15:
-            sys.stdout.write('17\n')
-            sys.stdout.flush()
+            stdout.write('17\n')
+            stdout.flush()
 
         # reporting one event several times won't break
         # anything, but it will spam logs
         if simulate_repeted_error and line_counter == 3:
-            sys.stdout.write('3\n')
-            sys.stdout.flush()
-            sys.stdout.write('3\n')
-            sys.stdout.flush()
+            stdout.write('3\n')
+            stdout.flush()
+            stdout.write('3\n')
+            stdout.flush()
         if simulate_timeout_error and line_counter == 10:
             time.sleep(3)
         # +----------------------------------------------------+
         # write `ok\n` to continue loop (only if we didn't exceed time limit)
         if time.time() - loop_start_time < 2:
-            sys.stdout.write('ok\n')
+            stdout.write('ok\n')
             # don't forget to flush stdout
-            sys.stdout.flush()
+            stdout.flush()
 
 
 if __name__ == '__main__':
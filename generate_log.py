@@ -0,0 +1,326 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Generate large synthetic activity logs for load testing, statistically similar to real logs.
+
+Distributions of category, behaviour, connection, safe_connection and of times between events are learned
+for each user from the given logs, events of all users are merged chronologically. Events are labelled
+as anomalies (`"is_anomaly": 1`) as often as in the labelled logs, fields of anomalies are drawn from
+the distribution of labelled anomalies of all users instead of the distribution of their user.
+
+The log is generated in shards (consecutive time ranges) by parallel processes. Each shard has its own seed
+derived from --seed, so the output depends only on the seed, number of events and number of shards.
+
+Generate 10M events of 5000 users to one gzipped log (the evaluator reads it directly):
+    ./generate_log.py data/competition_train_v1.log data/competition_test_v1.log --events 10000000 \\
+        --users 5000 --output big.log.gz
+
+Generate 1B events of 100k users (copies of the learned ones, so that the log covers a realistic time range):
+    ./generate_log.py data/*.log --events 1000000000 --users 100000 --shards 256 --output huge.log.gz
+
+Keep 64 shards as separate logs, to be streamed through one run of a script by ./evaluator.py --logs shards/:
+    ./generate_log.py data/*.log --events 100000000 --users 50000 --shards 64 --output shards/
+
+The learned users make about 2 events per hour together, so logs of millions of events need --users to cover
+a realistic time range; a warning suggests their number when the log spans far more than the learned logs.
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import logging
+import bisect
+import gzip
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import random
+import shutil
+
+from activity_log import open_log
+
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('category', 'behaviour', 'connection', 'safe_connection')
+# the same format as the real logs, `is_anomaly` is present only for anomalies
+LINE_FORMAT = (
+    '{"category": %s, "behaviour": %s, "connection": %s, "user": %s, "unix_timestamp": %i, "safe_connection": %s')
+WRITE_BATCH = 10000  # lines written at once
+SPAN_WARNING_FACTOR = 10  # warn about logs spanning more times the time range of the learned logs
+
+
+class Distribution(object):
+    """Empirical distribution of values."""
+
+    def __init__(self, counts):
+        """
+        Args:
+            counts: dict value=>number of occurrences
+        """
+        # sort values so that sampling doesn't depend on the order of a dict
+        self.values = sorted(counts)
+        self.cumulative = []
+        total = 0
+        for value in self.values:
+            total += counts[value]
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self, rng):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.total)]
+
+    def mean(self):
+        return 1.0 * sum(value * (cumulative - previous) for value, cumulative, previous in zip(
+            self.values, self.cumulative, [0] + self.cumulative[:-1])) / self.total
+
+
+def _count(counts, value):
+    counts[value] = counts.get(value, 0) + 1
+
+
+class LogProfile(object):
+    """Distributions of fields and of times between events of each user, learned from logs."""
+
+    def __init__(self, log_paths):
+        """
+        Args:
+            log_paths (list): paths of activity logs (labelled or not)
+        """
+        user_fields = {}  # dict user=>dict field=>counts (fields of normal events)
+        user_gaps = {}  # dict user=>counts of seconds between events of the user
+        anomaly_fields = dict((field, {}) for field in FIELDS)
+        labelled_events, anomalies = 0, 0
+        self.start = None
+        self.end = None
+        for log_path in log_paths:
+            last_times = {}  # dict user=>time of the last event of the user in this log
+            labelled = False
+            events = 0
+            with open_log(log_path) as log_file:
+                for line in log_file:
+                    data = json.loads(line)
+                    user, timestamp = data['user'], int(data['unix_timestamp'])
+                    events += 1
+                    self.start = timestamp if self.start is None else min(self.start, timestamp)
+                    self.end = timestamp if self.end is None else max(self.end, timestamp)
+                    if user in last_times:
+                        _count(user_gaps.setdefault(user, {}), timestamp - last_times[user])
+                    last_times[user] = timestamp
+                    if data.get('is_anomaly'):
+                        labelled = True
+                        anomalies += 1
+                        fields = anomaly_fields
+                    else:
+                        fields = user_fields.setdefault(user, dict((field, {}) for field in FIELDS))
+                    # values are stored serialized, the same way as `json.dumps` serializes whole events
+                    for field in FIELDS:
+                        _count(fields[field], json.dumps(data[field]))
+            if labelled:
+                labelled_events += events
+
+        self.users = sorted(user_fields)
+        self.user_names = [json.dumps(user) for user in self.users]
+        self.fields = [dict((field, Distribution(user_fields[user][field])) for field in FIELDS) for user in self.users]
+        all_gaps = {}
+        for counts in user_gaps.values():
+            for gap, count in counts.items():
+                all_gaps[gap] = all_gaps.get(gap, 0) + count
+        self.gaps = []
+        for user in self.users:
+            gaps = Distribution(user_gaps.get(user) or all_gaps)
+            # users with a single event or only simultaneous events follow all users
+            self.gaps.append(gaps if gaps.mean() > 0 else Distribution(all_gaps))
+        self.anomaly_rate = 1.0 * anomalies / labelled_events if labelled_events else 0.0
+        if anomalies:
+            self.anomaly_fields = dict((field, Distribution(anomaly_fields[field])) for field in FIELDS)
+        else:
+            # no labelled anomalies to learn from, use events of all users
+            self.anomaly_fields = dict(
+                (field, Distribution(_merge(user_fields[user][field] for user in self.users))) for field in FIELDS)
+
+    def clone_users(self, count):
+        """
+        Generate `count` users instead of the learned ones, copies of the learned users named NAME, NAME-1, ...
+        (production volumes need more users, the time range of the log would be too long otherwise).
+        """
+        learned = len(self.users)
+        users, fields, gaps = self.users, self.fields, self.gaps
+        self.users = [
+            users[num % learned] if num < learned else '%s-%i' % (users[num % learned], num // learned)
+            for num in range(count)]
+        self.user_names = [json.dumps(user) for user in self.users]
+        self.fields = [fields[num % learned] for num in range(count)]
+        self.gaps = [gaps[num % learned] for num in range(count)]
+
+    def event_rate(self):
+        """Returns: expected number of events of all users per second"""
+        return sum(1.0 / gaps.mean() for gaps in self.gaps)
+
+
+def _merge(counts_list):
+    merged = {}
+    for counts in counts_list:
+        for value, count in counts.items():
+            merged[value] = merged.get(value, 0) + count
+    return merged
+
+
+def shard_seed(seed, shard):
+    """Returns: seed of `shard`, independent of the other shards"""
+    return int(hashlib.sha1(('%s:%i' % (seed, shard)).encode('ascii')).hexdigest(), 16)
+
+
+def open_output(path, compress):
+    return gzip.open(path, 'wb', compresslevel=6) if compress else open(path, 'wb')
+
+
+def generate_shard(profile, seed, shard, start, end, output_path, compress=False):
+    """
+    Write events of all users from time range [`start`, `end`) to `output_path`.
+
+    Returns:
+        number of written events
+
+    """
+    rng = random.Random(shard_seed(seed, shard))
+    # each user starts at a random moment of its typical gap between events
+    heap = [(start + int(rng.random() * gaps.sample(rng)), code) for code, gaps in enumerate(profile.gaps)]
+    heapq.heapify(heap)
+    anomaly_rate = profile.anomaly_rate
+    lines = []
+    events = 0
+    with open_output(output_path, compress) as output:
+        while heap and heap[0][0] < end:
+            timestamp, code = heap[0]
+            if rng.random() < anomaly_rate:
+                fields, suffix = profile.anomaly_fields, ', "is_anomaly": 1}\n'
+            else:
+                fields, suffix = profile.fields[code], '}\n'
+            lines.append(LINE_FORMAT % (
+                fields['category'].sample(rng), fields['behaviour'].sample(rng), fields['connection'].sample(rng),
+                profile.user_names[code], timestamp, fields['safe_connection'].sample(rng)) + suffix)
+            heapq.heapreplace(heap, (timestamp + profile.gaps[code].sample(rng), code))
+            if len(lines) >= WRITE_BATCH:
+                events += len(lines)
+                output.write(''.join(lines))
+                lines = []
+        events += len(lines)
+        output.write(''.join(lines))
+    return events
+
+
+profile_of_workers = None  # LogProfile shared by forked workers of `generate`
+
+
+def _generate_shard(args):
+    return generate_shard(profile_of_workers, *args)
+
+
+def generate(profile, output_path, events, shards=1, seed=0, start=None, compress=False, processes=None):
+    """
+    Generate about `events` events in `shards` shards in parallel.
+
+    Args:
+        profile (LogProfile): learned distributions
+        output_path: path of the log, or a directory for shards as separate logs (SHARD.log or SHARD.log.gz)
+        events (int): expected number of events
+        shards (int): number of shards (time ranges generated independently)
+        seed: seed of the generator
+        start (int): unix timestamp of the beginning of the log (default: the beginning of learned logs)
+        compress (bool): gzip the output
+        processes (int): number of worker processes (default: number of CPU cores)
+
+    Returns:
+        number of generated events
+
+    """
+    global profile_of_workers
+    profile_of_workers = profile
+    start = profile.start if start is None else start
+    span = int(round(1.0 * events / shards / profile.event_rate()))  # seconds of each shard
+    learned_span = profile.end - profile.start
+    if learned_span > 0 and span * shards > SPAN_WARNING_FACTOR * learned_span:
+        logger.warning(
+            'the log spans %.0f days, %.0f times the learned logs; '
+            'about %i users (--users) give a realistic time range',
+            span * shards / 86400.0, 1.0 * span * shards / learned_span,
+            math.ceil(1.0 * len(profile.users) * span * shards / learned_span))
+    split = output_path.endswith(os.sep) or os.path.isdir(output_path)
+    suffix = '.log.gz' if compress else '.log'
+    if split:
+        if not os.path.isdir(output_path):
+            os.makedirs(output_path)
+        paths = [os.path.join(output_path, 'shard-%05i%s' % (shard, suffix)) for shard in range(shards)]
+    else:
+        # concatenated in the order of time ranges (also gzip members can be concatenated)
+        paths = ['%s.%05i.part' % (output_path, shard) for shard in range(shards)]
+    jobs = [
+        (seed, shard, start + shard * span, start + (shard + 1) * span, path, compress)
+        for shard, path in enumerate(paths)]
+
+    pool = multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), shards))
+    total = 0
+    try:
+        if split:
+            for count in pool.imap(_generate_shard, jobs):
+                total += count
+        else:
+            with open(output_path, 'wb') as output:
+                for count, path in zip(pool.imap(_generate_shard, jobs), paths):
+                    total += count
+                    with open(path, 'rb') as part:
+                        shutil.copyfileobj(part, output)
+                    os.remove(path)
+    finally:
+        pool.close()
+        pool.join()
+    return total
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('logs', nargs='+', help="paths to activity logs to learn from")
+    parser.add_argument('-n', '--events', type=int, required=True, help="expected number of events")
+    parser.add_argument(
+        '-o', '--output', required=True,
+        help="path of the generated log, or a directory (ending with %s) for shards as separate logs" % os.sep)
+    parser.add_argument('--shards', type=int, default=1, help="number of shards (default: 1)")
+    parser.add_argument(
+        '--users', type=int,
+        help="number of generated users, copies of the learned ones (default: the learned users)")
+    parser.add_argument('--seed', default='0', help="seed of the generator (default: 0)")
+    parser.add_argument('--start', type=int, help="unix timestamp of the first event (default: the first learned)")
+    parser.add_argument('--gzip', action='store_true', help="gzip the output (default for OUTPUT ending with .gz)")
+    parser.add_argument(
+        '-j', '--processes', type=int,
+        help="number of shards generated at once (default: number of CPU cores)")
+
+    args = parser.parse_args()
+    if args.shards < 1 or args.events < 1:
+        parser.error("--events and --shards must be positive numbers")
+    profile = LogProfile(args.logs)
+    if args.users:
+        profile.clone_users(args.users)
+    logger.info(
+        'generating %i users, %.1f events per hour, %.2f %% anomalies',
+        len(profile.users), profile.event_rate() * 3600, profile.anomaly_rate * 100)
+    total = generate(
+        profile, args.output, args.events, shards=args.shards, seed=args.seed, start=args.start,
+        compress=args.gzip or args.output.endswith('.gz'), processes=args.processes)
+    logger.info('generated %i events to %s', total, args.output)
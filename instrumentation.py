@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Latency and resource usage of contestants' scripts measured during the simulation.
+
+Latency of an event is the wall-clock time from writing the event to stdin of contestants' script to
+reading its acknowledgement. The first answer of the script also includes its start (loading of models
+etc.), it is reported separately as startup time instead of latency of events. Latencies are kept in
+histograms with exponentially growing buckets (each 10 % wider than the previous one), so percentiles are
+exact within 10 % at any number of events.
+"""
+
+import os
+import math
+import json
+import time
+import resource
+
+
+BUCKET_BASE = 1e-6  # seconds, upper bound of the first bucket
+BUCKET_GROWTH = 1.1
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram(object):
+    """Histogram of latencies in seconds."""
+
+    def __init__(self):
+        self.buckets = {}  # dict bucket index=>number of latencies
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, latency):
+        index = 0 if latency <= BUCKET_BASE else int(math.ceil(math.log(latency / BUCKET_BASE, BUCKET_GROWTH)))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def percentile(self, percent):
+        """
+        Returns:
+            upper bound of latency of `percent` % of events (None for empty histogram)
+        """
+        if not self.count:
+            return None
+        rank = int(math.ceil(self.count * percent / 100.0))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(BUCKET_BASE * BUCKET_GROWTH ** index, self.max)
+        return self.max
+
+    def summary(self):
+        summary = {'count': self.count, 'max': self.max, 'mean': self.total / self.count if self.count else None}
+        for percent in PERCENTILES:
+            summary['p%i' % percent] = self.percentile(percent)
+        return summary
+
+    def histogram(self):
+        """
+        Returns:
+            list of [upper bound of bucket in seconds, number of latencies]
+        """
+        return [[BUCKET_BASE * BUCKET_GROWTH ** index, self.buckets[index]] for index in sorted(self.buckets)]
+
+
+class ProcessMonitor(object):
+    """
+    CPU time and peak memory of a running process, sampled from /proc (Linux). After the process is
+    reaped, resource usage of reaped children (`resource.getrusage`) is used where /proc isn't available.
+    """
+
+    sample_interval = 1.0  # seconds between samples taken by `maybe_sample`
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.start = time.time()
+        self.children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self.user_time = 0.0
+        self.system_time = 0.0
+        self.peak_rss = 0  # bytes
+        self.last_sample = 0.0
+        self.sampled = False
+        self.wall_time = None
+
+    def sample(self):
+        """Read current CPU times and peak RSS of the process (ignored if the process is gone)."""
+        self.last_sample = time.time()
+        try:
+            with open('/proc/%i/stat' % self.pid) as f:
+                # fields after the parenthesized command name, utime and stime are fields 14 and 15
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open('/proc/%i/status' % self.pid) as f:
+                status = f.read()
+        except (IOError, OSError, IndexError):
+            return
+        self.user_time = float(fields[11]) / self.clock_ticks
+        self.system_time = float(fields[12]) / self.clock_ticks
+        for line in status.splitlines():
+            if line.startswith('VmHWM:'):
+                self.peak_rss = max(self.peak_rss, int(line.split()[1]) * 1024)
+        self.sampled = True
+
+    def maybe_sample(self):
+        if time.time() - self.last_sample >= self.sample_interval:
+            self.sample()
+
+    def stopped(self):
+        """The process was reaped, add resources of reaped children since the start."""
+        self.wall_time = time.time() - self.start
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.user_time = max(self.user_time, usage.ru_utime - self.children_start.ru_utime)
+        self.system_time = max(self.system_time, usage.ru_stime - self.children_start.ru_stime)
+        if not self.sampled:
+            self.peak_rss = usage.ru_maxrss * 1024  # max of all reaped children (kilobytes on Linux)
+
+    def summary(self):
+        return {
+            'cpu_time': self.user_time + self.system_time,
+            'user_time': self.user_time,
+            'system_time': self.system_time,
+            'peak_rss': self.peak_rss,
+            'wall_time': self.wall_time if self.wall_time is not None else time.time() - self.start,
+        }
+
+
+class SimulationStats(object):
+    """Latencies of events (overall and per user) and resource usage of contestants' script."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.user_latency = {}  # dict user=>LatencyHistogram
+        self.timeouts = 0
+        self.startup = None  # seconds from the start of the script to its first answer
+        self.monitor = None  # ProcessMonitor of contestants' script
+
+    def acknowledged(self, user, latency):
+        self.latency.add(latency)
+        histogram = self.user_latency.get(user)
+        if histogram is None:
+            histogram = self.user_latency[user] = LatencyHistogram()
+        histogram.add(latency)
+
+    def timed_out(self):
+        self.timeouts += 1
+
+    def summary(self):
+        return {
+            'latency': self.latency.summary(),
+            'latency_histogram': self.latency.histogram(),
+            'timeouts': self.timeouts,
+            'startup': self.startup,
+            'users': dict((user, histogram.summary()) for user, histogram in self.user_latency.items()),
+            'contestant': self.monitor.summary() if self.monitor is not None else None,
+        }
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,331 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Rank submissions by their scores, evaluating only those which changed since their last evaluation.
+
+Every evaluation is cached in CACHE/KEY/, the key is a hash of everything the result depends on:
+files of the submission (the directory of its script; only the script itself for scripts next to
+the evaluator), its command line, content of the log, sources of the evaluator and its parameters.
+Submissions with a cached result are not run again, the others are evaluated in parallel
+(see ./evaluator.py --scripts). Results of all submissions are written to RESULTS/NAME.txt as well.
+
+Rank two submissions (listed in ./evaluator.py --scripts format):
+    ./leaderboard.py --logs competition.log --scripts ./example.py \\
+        "svm=python contestants_solutions/mel_gibsons_nipples/test.py"
+
+Rank submissions listed in a file, one [NAME=]SCRIPT per line, in 4 processes:
+    ./leaderboard.py --logs competition.log --submissions submissions.txt -j 4
+
+Pack 8 evaluations on 8 cores without timeouts caused by their contention (see budget.py):
+    ./leaderboard.py --logs competition.log --submissions submissions.txt --budget cpu --cpus 0 1 2 3 4 5 6 7
+
+Rank all cached evaluations of the log (also of older versions of submissions):
+    ./leaderboard.py --logs competition.log --all
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import shutil
+import tempfile
+
+import evaluator
+from activity_log import content_hash
+from transport import TRANSPORTS
+from wire import WIRE_FORMATS
+from budget import BUDGETS, ContestantLimits, parse_cpus
+import trace_log
+
+
+logger = logging.getLogger(__name__)
+
+EVALUATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+# modules the results depend on, a change of any of them invalidates all cached results
+EVALUATOR_SOURCES = (
+    'evaluator.py', 'activity_log.py', 'budget.py', 'checkpoint.py', 'instrumentation.py', 'plugin.py',
+    'trace_log.py', 'transcript.py', 'transport.py', 'wire.py')
+# files of submissions which don't influence their results
+IGNORED_SUFFIXES = ('.pyc', '.pyo', '.evcache', '.evindex', '.tmp')
+# files of a cached result: file name in the cache=>suffix of the file in the results directory
+RESULT_FILES = {'result.txt': '.txt', 'stats.json': '.stats.json', 'transcript.gz': '.transcript.gz'}
+
+
+def evaluator_version():
+    """Returns: SHA-1 (hex) of sources of the evaluator"""
+    digest = hashlib.sha1()
+    for name in EVALUATOR_SOURCES:
+        digest.update(name.encode('utf-8') + b'\0' + content_hash(os.path.join(EVALUATOR_DIR, name)))
+    return digest.hexdigest()
+
+
+def script_path(command):
+    """
+    Returns:
+        path of the script of `command` (the first existing file of the command line, e.g. `test.py`
+        in `python test.py --par1 val1`), None if there is none
+    """
+    paths = [par for par in command if os.path.isfile(par)]
+    return next((par for par in paths if os.path.splitext(par)[1]), paths[0] if paths else None)
+
+
+def tree_hash(path):
+    """
+    Returns:
+        SHA-1 (hex) of names and contents of files under directory `path` (hidden files, compiled Python
+        and caches of logs excepted), or of file `path`
+    """
+    digest = hashlib.sha1()
+    if os.path.isfile(path):
+        digest.update(content_hash(path))
+        return digest.hexdigest()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(name for name in dirs if not name.startswith('.') and name != '__pycache__')
+        for name in sorted(files):
+            if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+                continue
+            file_path = os.path.join(root, name)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0' + content_hash(file_path))
+    return digest.hexdigest()
+
+
+def submission_tree(command):
+    """
+    Returns:
+        path of the files of a submission: the directory of its script, or only the script itself
+        if it is next to the evaluator (the directory is the evaluator then); None if there is no script file
+    """
+    script = script_path(command)
+    if script is None:
+        return None
+    directory = os.path.dirname(os.path.abspath(script))
+    return script if directory == EVALUATOR_DIR else directory
+
+
+def cache_key(command, log_digest, version, parameters):
+    """
+    Returns:
+        (key of the result of `command` (hex), dict of its components)
+    """
+    tree = submission_tree(command)
+    components = {
+        'tree': tree_hash(tree) if tree else None,
+        'command': ' '.join(command),
+        'log': log_digest,
+        'evaluator': version,
+        'parameters': parameters,
+    }
+    key = hashlib.sha1(json.dumps(components, sort_keys=True).encode('utf-8')).hexdigest()
+    return key, components
+
+
+class ResultCache(object):
+    """Directory with results of evaluations, CACHE/KEY/ with `RESULT_FILES` and meta.json."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def entry(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        """
+        Returns:
+            meta data of a cached result (dict), None for a miss
+        """
+        try:
+            with open(os.path.join(self.entry(key), 'meta.json')) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, key, meta, results_dir, name):
+        """Store the result of submission `name` written to `results_dir` by the evaluator (atomically)."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        tmp_dir = tempfile.mkdtemp(dir=self.path, prefix='.%s.' % key)
+        for cache_name, suffix in RESULT_FILES.items():
+            source = os.path.join(results_dir, name + suffix)
+            if os.path.exists(source):
+                shutil.copy(source, os.path.join(tmp_dir, cache_name))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+            f.write('\n')
+        if os.path.isdir(self.entry(key)):
+            # evaluated by someone else meanwhile, results are the same
+            shutil.rmtree(tmp_dir)
+        else:
+            os.rename(tmp_dir, self.entry(key))
+
+    def restore(self, key, results_dir, name):
+        """Copy a cached result to `results_dir` as the result of submission `name`."""
+        for cache_name, suffix in RESULT_FILES.items():
+            source = os.path.join(self.entry(key), cache_name)
+            if os.path.exists(source):
+                shutil.copy(source, os.path.join(results_dir, name + suffix))
+
+    def entries(self):
+        """Returns: meta data of all cached results"""
+        if not os.path.isdir(self.path):
+            return []
+        metas = (self.get(key) for key in sorted(os.listdir(self.path)) if not key.startswith('.'))
+        return [meta for meta in metas if meta is not None]
+
+
+def parse_result(lines):
+    """
+    Args:
+        lines: lines of a result written by `Evaluator.finish`
+
+    Returns:
+        (avg. user F-measure, dict user=>F-measure)
+
+    """
+    user_scores = {}
+    user = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('Score (avg. user F-measure):'):
+            return float(line.split(':', 1)[1]), user_scores
+        if line.startswith('F-measure:'):
+            user_scores[user] = float(line.split(':', 1)[1])
+        elif user is None or line.startswith('-----'):
+            user = None if line.startswith('-----') else line
+        elif not line.startswith(('True ', 'False ')):
+            user = line
+    raise ValueError('no score in the result')
+
+
+def evaluate(submissions, log_path, cache, results_dir, parameters, processes=None, cpu_sets=None):
+    """
+    Evaluate submissions without a cached result (in parallel), take the others from the cache.
+
+    Args:
+        submissions (list): (name, command) pairs
+        log_path: path to the labelled log
+        cache (ResultCache): cached results
+        results_dir: directory for results of submissions (NAME.txt)
+        parameters (dict): parameters of the evaluator (window, wire, transport, budget)
+        processes (int): number of submissions evaluated at once (default: number of CPU cores)
+        cpu_sets (list): lists of cores, each process evaluates submissions pinned to its own one (optional)
+
+    Returns:
+        list of meta data of results of `submissions`
+
+    """
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    log_digest = content_hash(log_path).encode('hex')
+    version = evaluator_version()
+    keys = [cache_key(command, log_digest, version, parameters) for _, command in submissions]
+    missing = [
+        (submission, key, components) for submission, (key, components) in zip(submissions, keys)
+        if cache.get(key) is None]
+    logger.info('%i of %i submissions changed', len(missing), len(submissions))
+    if missing:
+        evaluator.main_batch(
+            [submission for submission, _, _ in missing], log_path, results_dir, window=parameters['window'],
+            processes=processes, wire=parameters['wire'], transport=parameters['transport'],
+            limits=ContestantLimits(parameters['budget']) if parameters['budget'] != 'wall' else None,
+            cpu_sets=cpu_sets)
+        for (name, command), key, components in missing:
+            with open(os.path.join(results_dir, name + '.txt')) as f:
+                score, user_scores = parse_result(f)
+            meta = {
+                'key': key,
+                'name': name,
+                'log': log_path,
+                'components': components,
+                'score': score,
+                'users': user_scores,
+                'date': datetime.datetime.now().isoformat(),
+            }
+            cache.put(key, meta, results_dir, name)
+
+    metas = []
+    for (name, _), (key, _) in zip(submissions, keys):
+        meta = cache.get(key)
+        cache.restore(key, results_dir, name)
+        meta['name'] = name  # the same submission may have been cached under another name
+        metas.append(meta)
+    return metas
+
+
+def print_leaderboard(metas, output=sys.stdout):
+    """Print a table of results ranked by their score, with F-measures of all users."""
+    users = sorted(set(user for meta in metas for user in meta['users']))
+    ranked = sorted(metas, key=lambda meta: (-meta['score'], meta['name']))
+    print('\t'.join(['rank', 'name', 'score', 'key'] + users), file=output)
+    for rank, meta in enumerate(ranked, 1):
+        print('\t'.join(
+            ['%i' % rank, meta['name'], '%0.6f' % meta['score'], meta['key'][:12]] +
+            ['%0.4f' % meta['users'][user] if user in meta['users'] else '-' for user in users]), file=output)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.INFO)
+
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('-l', '--logs', required=True, help="path to a file with labelled activity logs")
+    submissions = parser.add_mutually_exclusive_group(required=True)
+    submissions.add_argument(
+        '--scripts', nargs='+', metavar='[NAME=]SCRIPT',
+        help="submissions to rank, the same as ./evaluator.py --scripts")
+    submissions.add_argument('--submissions', help="file with one [NAME=]SCRIPT per line")
+    submissions.add_argument('--all', action='store_true', help="rank all cached results of the log")
+    parser.add_argument('--cache', default='results/cache', help="directory of cached results (default: %(default)s)")
+    parser.add_argument('--results', default='results', help="directory for results (default: %(default)s)")
+    parser.add_argument(
+        '-j', '--processes', type=int,
+        help="number of submissions evaluated at once (default: number of CPU cores)")
+    parser.add_argument(
+        '-w', '--window', type=int, default=1,
+        help="max number of events sent to a script and not acknowledged yet (default: 1)")
+    parser.add_argument('--wire', choices=WIRE_FORMATS, default='json', help="see ./evaluator.py (default: json)")
+    parser.add_argument('--transport', choices=TRANSPORTS, default='pipe', help="see ./evaluator.py (default: pipe)")
+    parser.add_argument('--budget', choices=BUDGETS, default='wall', help="see ./evaluator.py (default: wall)")
+    parser.add_argument(
+        '--cpus', nargs='+', type=parse_cpus, metavar='CORES',
+        help="pin submissions of each process to its own CORES, see ./evaluator.py")
+
+    args = parser.parse_args()
+    cache = ResultCache(args.cache)
+    if args.all:
+        log_digest = content_hash(args.logs).encode('hex')
+        print_leaderboard([meta for meta in cache.entries() if meta['components']['log'] == log_digest])
+        sys.exit(0)
+
+    if args.submissions:
+        with open(args.submissions) as f:
+            scripts = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    else:
+        scripts = args.scripts
+    submissions = [evaluator.submission_name(script) for script in scripts]
+    submissions = [(name, command.split()) for name, command in submissions]
+    names = [name for name, _ in submissions]
+    if len(set(names)) != len(names):
+        parser.error("submissions must have unique names, use NAME=SCRIPT to name them")
+
+    trace = trace_log.configure(evaluator.logger, 'errors', 'off')
+    try:
+        metas = evaluate(
+            submissions, args.logs, cache, args.results,
+            {'window': args.window, 'wire': args.wire, 'transport': args.transport, 'budget': args.budget},
+            processes=args.processes, cpu_sets=args.cpus)
+    finally:
+        trace.close()
+    print_leaderboard(metas)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+In-process contestants: a Python detector imported by the evaluator instead of a script behind pipes.
+
+A detector is a class with no-argument constructor (`--module package.module:Detector`) and methods:
+    process_batch(events)  events is a list of events (dicts, the same as the JSON sent to scripts),
+                           returns ids of anomalous events (of this batch or older ones)
+    finish()               optional, the last opportunity to report anomalies, returns ids of anomalous events
+
+Every call has a time limit, a call which doesn't return in time is interrupted (SIGALRM) and counts
+as no answer. Reported ids are checked the same way as ids written by scripts.
+"""
+
+import importlib
+import signal
+import sys
+import os
+import time
+
+
+class DeadlineExceeded(Exception):
+    """The detector didn't return in time."""
+
+
+def load_detector(spec):
+    """
+    Args:
+        spec (str): `module:Class`, module is imported from the working directory or sys.path
+
+    Returns:
+        instance of the detector class
+
+    """
+    module_name, sep, class_name = spec.partition(':')
+    if not sep or not module_name or not class_name:
+        raise ValueError('detector must be given as module:Class, got %r' % spec)
+    if os.getcwd() not in sys.path and '' not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+
+def _deadline_exceeded(signum, frame):
+    raise DeadlineExceeded()
+
+
+def call_with_deadline(function, args, timeout):
+    """
+    Call `function(*args)` and interrupt it after `timeout` seconds (main thread only).
+
+    Returns:
+        result of the function
+
+    Raises:
+        DeadlineExceeded: the function didn't return in time (even if it caught the interruption)
+
+    """
+    previous = signal.signal(signal.SIGALRM, _deadline_exceeded)
+    start = time.time()
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = function(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    if time.time() - start > timeout:
+        raise DeadlineExceeded()
+    return result
@@ -0,0 +1,172 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE: %(program)s [CASE ...]
+
+Regression cases of decisions of the evaluator which once went wrong. Each case prints `ok` or `FAILED`
+with the difference, the exit status is 1 if any case failed.
+
+Run all cases:
+    ./regression.py
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+import evaluator
+from evaluator import Evaluator
+from activity_log import parse_lines
+
+
+SOLUTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contestants_solutions')
+
+
+def set_timezone(name):
+    """Switch local time of the process (and of `evaluator.local_seconds`) to time zone `name`."""
+    os.environ['TZ'] = name
+    time.tzset()
+
+
+def make_log(events):
+    """
+    Args:
+        events: (unix timestamp, user, is_anomaly) triples
+
+    Returns:
+        lines of the log
+    """
+    return [
+        json.dumps({
+            'category': 'gamma', 'behaviour': 'brown', 'connection': 'Canada-Ontario-Iiseaazcr', 'user': user,
+            'unix_timestamp': unix_timestamp, 'safe_connection': 0, 'is_anomaly': is_anomaly})
+        for unix_timestamp, user, is_anomaly in events]
+
+
+def simulate_reports(lines, reports, window=1):
+    """
+    Let the evaluator judge a script which reports events `reports[N]` while processing event N.
+
+    Returns:
+        Evaluator after the simulation
+    """
+    ev = Evaluator(None, window=window, records=list(parse_lines(lines)))
+    for line_id, event_string in ev.events():
+        for num in reports.get(line_id, []):
+            ev.process_msg(str(num), event_string, line_id)
+        ev.process_msg('ok' if window == 1 else 'ok %i' % line_id, event_string, line_id)
+    ev.process_msg('ok', '', -1)
+    return ev
+
+
+def case_dst_fall_back():
+    """
+    Local time goes back by an hour at the end of daylight saving time: event 0 is older than the reporting
+    limit while processing event 2 (02:45 CEST), but in time again while processing event 3 (02:10 CET).
+    """
+    set_timezone('Europe/Prague')
+    lines = make_log([
+        (1445730000, 'Beth', 1), (1445733900, 'Beth', 0), (1445735400, 'Beth', 0), (1445736000, 'Beth', 0)])
+    ev = simulate_reports(lines, {3: [0]})
+    with open(os.devnull, 'w') as devnull:
+        score = ev.finish(output_file=devnull)
+    return [('accepted alarm of event 0', 1, ev.alarms[0]), ('score', 1.0, score)]
+
+
+def case_late_report_of_forgotten_event():
+    """
+    An event a day older than the reference time is forgotten: its report is rejected as late, and the evaluator
+    keeps only events of the last hours.
+    """
+    set_timezone('Europe/Prague')
+    lines = make_log([(1445000000 + hour * 3600, 'Beth', 1) for hour in range(30)])
+    ev = simulate_reports(lines, {29: [0, 27]})
+    with open(os.devnull, 'w') as devnull:
+        ev.finish(output_file=devnull)
+    return [
+        ('rejected alarm of event 0', 0, ev.alarms[0]), ('accepted alarm of event 27', 1, ev.alarms[27]),
+        ('events kept for reports', 5, len(ev.recent_events))]
+
+
+class _AnomalousModels(object):
+    """Models of a `ModelBundle` which find every event anomalous."""
+
+    def model(self, user):
+        return self
+
+    def predict(self, features):
+        return [-1] * len(features)
+
+
+def case_batch_predictor_dst_fall_back():
+    """
+    Micro-batches of the SVM solution (contestants_solutions/mel_gibsons_nipples/inference.py): the event of `b`
+    arrives after the first event of `a`, but its deadline is earlier, because local time went back meanwhile.
+    It must be reported at the latest while processing the next event (03:10 CET).
+    """
+    sys.path.insert(0, os.path.join(SOLUTIONS_DIR, 'mel_gibsons_nipples'))
+    from encoder import N_FEATURES, local_seconds
+    from inference import BatchPredictor
+
+    set_timezone('Europe/Prague')
+    predictor = BatchPredictor(_AnomalousModels(), batch_size=64)
+    reported = {}  # dict event_id=>id of the event being processed when it was reported
+    for event_id, (unix_timestamp, user) in enumerate([
+            (1445734200, 'a'), (1445735100, 'b'), (1445739000, 'a'), (1445739600, 'a')]):
+        for num in predictor.add(event_id, user, [0.0] * N_FEATURES, local_seconds(unix_timestamp)):
+            reported[num] = event_id
+    return [('event of `b` reported while processing event', 2, reported.get(1))]
+
+
+CASES = dict((name[len('case_'):], function) for name, function in globals().items() if name.startswith('case_'))
+
+
+def run(names):
+    """
+    Returns:
+        True if all cases `names` passed
+    """
+    passed = True
+    for name in names:
+        timezone = os.environ.get('TZ')
+        try:
+            differences = [
+                (what, expected, value) for what, expected, value in CASES[name]() if value != expected]
+        finally:
+            if timezone is None:
+                os.environ.pop('TZ', None)
+            else:
+                os.environ['TZ'] = timezone
+            time.tzset()
+        print('%s\t%s' % (name, 'FAILED' if differences else 'ok'))
+        for what, expected, value in differences:
+            print('    %s: expected %r, got %r' % (what, expected, value))
+        passed = passed and not differences
+    return passed
+
+
+if __name__ == '__main__':
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'] % {'program': program})
+    parser.add_argument(
+        'cases', nargs='*', metavar='CASE', help="cases to run: %s (default: all)" % ' '.join(sorted(CASES)))
+
+    args = parser.parse_args()
+    unknown = sorted(set(args.cases) - set(CASES))
+    if unknown:
+        parser.error("unknown cases: %s" % ' '.join(unknown))
+    # judgements go to the trace as errors, keep only the results on stdout
+    evaluator.logger.addHandler(logging.NullHandler())
+    evaluator.logger.propagate = False
+    sys.exit(0 if run(args.cases or sorted(CASES)) else 1)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Score recorded simulations again without running contestants' scripts, e.g. after fixing labels of the log.
+Every evaluation writes a transcript (evaluator.transcript.gz or RESULTS/NAME.transcript.gz), see transcript.py.
+
+Rescore a transcript against the log it was recorded with:
+    ./rescore.py evaluator.transcript.gz
+
+Rescore all results against a fixed log, rewriting results/NAME.txt:
+    ./rescore.py --logs competition_fixed.log --output-dir results results/*.transcript.gz
+
+Score only some users:
+    ./rescore.py --users Beth Denny evaluator.transcript.gz
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import logging
+
+import evaluator
+from evaluator import Evaluator
+from transcript import read_transcript
+import trace_log
+
+
+logger = logging.getLogger(__name__)
+
+
+def rescore(transcript_path, log_path=None, output_file=None, users=None):
+    """
+    Replay answers of contestants' script recorded in a transcript and evaluate them.
+
+    Reports are judged in the inner-time context recorded with them, so the log must contain
+    the same events in the same order as the recorded one (labels and users may differ).
+
+    Args:
+        transcript_path: path of a transcript written by the evaluator
+        log_path: path to labelled logs (default: the log of the recorded simulation)
+        output_file: file to write the evaluation to instead of stdout
+        users: evaluate only these users (default: all users)
+
+    Returns:
+        score (avg. user F-measure)
+
+    """
+    header, records = read_transcript(transcript_path)
+    # a simulation of some users or of a time range is replayed on the same selection of the log
+    ev = Evaluator(log_path or header['log'], window=header['window'], selection=header.get('selection'))
+    events = ev._read_events()
+    for kind, sent, line_id, timestamps, data in records:
+        for _ in xrange(sent):
+            next(events)
+        ev.last_two_timestamps = timestamps
+        if kind == 'x':
+            ev.abort(*data)
+        else:
+            ev.process_msg(data, '', line_id)
+    for _ in events:
+        pass
+    return ev.finish(output_file, users)
+
+
+def transcript_name(transcript_path):
+    """
+    Returns:
+        name of the submission of `transcript_path`, e.g. `baseline` for `results/baseline.transcript.gz`
+    """
+    name = os.path.basename(transcript_path)
+    for suffix in ('.gz', '.transcript'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    return name
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('transcripts', nargs='+', help="paths to transcripts")
+    parser.add_argument(
+        '-l', '--logs',
+        help="path to a file with labelled activity logs (default: the log of each transcript)")
+    parser.add_argument(
+        '-o', '--output-dir',
+        help="write results to OUTPUT_DIR/NAME.txt instead of stdout")
+    parser.add_argument('-u', '--users', nargs='+', help="evaluate only these users")
+    parser.add_argument(
+        '--trace-stderr', choices=sorted(trace_log.TRACE_LEVELS), default='off',
+        help="trace level of the replayed simulation on stderr (default: off)")
+
+    args = parser.parse_args()
+    trace = trace_log.configure(evaluator.logger, args.trace_stderr, 'off')
+    users = set(args.users) if args.users else None
+    try:
+        for transcript_path in args.transcripts:
+            if args.output_dir:
+                name = transcript_name(transcript_path)
+                with open(os.path.join(args.output_dir, name + '.txt'), 'w') as output_file:
+                    score = rescore(transcript_path, args.logs, output_file, users)
+                logger.info('%s: %0.6f', name, score)
+            else:
+                rescore(transcript_path, args.logs, users=users)
+    finally:
+        trace.close()
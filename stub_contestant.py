@@ -0,0 +1,91 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE: %(program)s MODE
+
+Calibrated contestants for benchmarking the evaluator (see benchmark.py). They don't parse events,
+so the time of a simulation is spent in the evaluator, the pipes and the chosen behaviour:
+
+    ok          acknowledge every event immediately (null contestant)
+    report-all  report every event as anomaly, then acknowledge it
+    delay       acknowledge every event after --delay seconds
+    burst       report every event as anomaly in bursts of --burst events (older events of a burst are late)
+
+Examples:
+    ./evaluator.py --logs competition.log --script "./stub_contestant.py ok"
+    ./evaluator.py --logs competition.log --script "./stub_contestant.py delay --delay 0.01"
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from transport import connect
+
+
+MODES = ('ok', 'report-all', 'delay', 'burst')
+
+
+def main(mode, delay=0.001, burst=100):
+    """
+    Read events from stdin and answer them according to `mode`.
+
+    Args:
+        mode (str): one of MODES
+        delay (float): seconds before acknowledging an event (mode `delay`)
+        burst (int): number of events reported at once (mode `burst`)
+
+    """
+    channel = connect()
+    readline, write, flush = channel.readline, channel.write, channel.flush
+    event_id = 0
+    buffered = []  # ids of events not reported yet (mode `burst`)
+    while True:
+        line = readline()
+        control = line.strip()
+        if not line or control in ('exit', 'reset'):
+            if buffered:
+                write(''.join('%i\n' % num for num in buffered))
+                buffered = []
+            write('ok\n')
+            flush()
+            if control == 'reset':
+                event_id = 0
+                continue
+            break
+        if line[0] in '#=':
+            # definitions of the compact wire format (see wire.py), not events
+            continue
+
+        if mode == 'report-all':
+            write('%i\n' % event_id)
+        elif mode == 'delay':
+            time.sleep(delay)
+        elif mode == 'burst':
+            buffered.append(event_id)
+            if len(buffered) >= burst:
+                write(''.join('%i\n' % num for num in buffered))
+                buffered = []
+        # acknowledge by id, so that the stubs work with any --window of the evaluator
+        write('ok %i\n' % event_id)
+        flush()
+        event_id += 1
+
+
+if __name__ == '__main__':
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'] % {'program': program})
+    parser.add_argument('mode', choices=MODES, help="behaviour of the contestant")
+    parser.add_argument(
+        '--delay', type=float, default=0.001, help="seconds before acknowledging an event (default: 0.001)")
+    parser.add_argument('--burst', type=int, default=100, help="number of events reported at once (default: 100)")
+
+    args = parser.parse_args()
+    main(args.mode, delay=args.delay, burst=args.burst)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""USAGE:
+
+Logging of the per-event trace of the evaluator without slowing down the simulation.
+
+Log records are only queued by the evaluator, a background thread formats them and writes them
+in batches. Each output has its own trace level:
+    debug   everything including timing of the simulation
+    full    every event and every answer of the contestants' script
+    errors  only errors of the contestants' script
+    off     nothing
+
+The file trace can be stored in a compact binary format (see `BinaryTraceHandler`). Render it
+to the usual text trace:
+    ./trace_log.py evaluator.trace > evaluator.log
+"""
+
+from __future__ import print_function
+
+import sys
+import os
+import argparse
+import logging
+import struct
+import threading
+import time
+from collections import deque
+
+
+TRACE_LEVELS = {
+    'debug': logging.DEBUG,
+    'full': logging.INFO,
+    'errors': logging.ERROR,
+    'off': logging.CRITICAL + 1,
+}
+
+BINARY_MAGIC = b'RBTRACE2'
+# binary trace record: number of the message template, number of arguments and arguments (each starts with a tag)
+TAG_TEMPLATE = 0  # definition of a new template (utf-8 string), numbered in the order of appearance
+TAG_INT = 1  # zigzag varint
+TAG_FLOAT = 2  # double
+TAG_STRING = 3  # byte string (varint length and bytes)
+TAG_UNICODE = 4  # unicode string (varint length and utf-8 bytes)
+TAG_RECENT = 5  # varint index of a recently used short string, see `RecentStrings`
+TAG_NONE = 6
+RECENT_SIZE = 256  # number of recently used short strings which can be referred to
+RECENT_MAX_LENGTH = 64  # max length of strings referred to (inner times, users, ...)
+DOUBLE = struct.Struct('<d')
+
+
+def write_varint(stream, value):
+    """Write non-negative int `value` as a little-endian base-128 varint."""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    stream.write(out)
+
+
+def read_varint(stream):
+    value, shift = 0, 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            raise EOFError
+        byte = ord(byte)
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value
+        shift += 7
+
+
+class RecentStrings(object):
+    """
+    Ring of recently used short strings, maintained the same way by the writer and the reader of a binary trace.
+    Inner time of the simulation is repeated by all records of one event, so it is stored only once.
+    """
+
+    def __init__(self):
+        self.slots = [None] * RECENT_SIZE
+        self.indexes = {}  # dict string=>slot index
+        self.next_slot = 0
+
+    def find(self, value):
+        return self.indexes.get(value)
+
+    def get(self, index):
+        return self.slots[index]
+
+    def add(self, value):
+        old = self.slots[self.next_slot]
+        if old is not None:
+            del self.indexes[old]
+        self.slots[self.next_slot] = value
+        self.indexes[value] = self.next_slot
+        self.next_slot = (self.next_slot + 1) % RECENT_SIZE
+
+
+class TextTraceHandler(logging.Handler):
+    """Write formatted messages to a stream, flushed by `QueueWriter` once per batch."""
+
+    def __init__(self, stream, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.stream = stream
+        self.setFormatter(logging.Formatter('%(message)s'))
+
+    def emit(self, record):
+        msg = self.format(record)
+        if isinstance(msg, unicode):
+            msg = msg.encode('utf-8')
+        self.stream.write(msg + '\n')
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.stream not in (sys.stdout, sys.stderr):
+            self.stream.close()
+        logging.Handler.close(self)
+
+
+class BinaryTraceHandler(logging.Handler):
+    """
+    Write records as numbers of message templates and tagged arguments, without formatting them.
+
+    Every template is stored once, short strings are stored once while they are used repeatedly.
+    Arguments other than numbers and strings are stored as strings (all of them are formatted by `%s`).
+    `read_binary_trace` formats the records the same way as `TextTraceHandler` does.
+    """
+
+    def __init__(self, path, level=logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.stream = open(path, 'wb')
+        self.stream.write(BINARY_MAGIC)
+        self.templates = {}  # dict template=>number
+        self.recent = RecentStrings()
+
+    def _write_arg(self, arg):
+        stream = self.stream
+        if isinstance(arg, bool) or not isinstance(arg, (int, long, float, str, unicode, type(None))):
+            arg = str(arg)
+        if arg is None:
+            stream.write(chr(TAG_NONE))
+        elif isinstance(arg, (int, long)):
+            stream.write(chr(TAG_INT))
+            write_varint(stream, arg * 2 if arg >= 0 else -arg * 2 - 1)
+        elif isinstance(arg, float):
+            stream.write(chr(TAG_FLOAT))
+            stream.write(DOUBLE.pack(arg))
+        else:
+            index = self.recent.find(arg)
+            if index is not None:
+                stream.write(chr(TAG_RECENT))
+                write_varint(stream, index)
+                return
+            if len(arg) <= RECENT_MAX_LENGTH:
+                self.recent.add(arg)
+            if isinstance(arg, unicode):
+                stream.write(chr(TAG_UNICODE))
+                arg = arg.encode('utf-8')
+            else:
+                stream.write(chr(TAG_STRING))
+            write_varint(stream, len(arg))
+            stream.write(arg)
+
+    def emit(self, record):
+        template, args = record.msg, record.args or ()
+        if isinstance(args, dict):
+            template, args = '%s', (record.getMessage(),)
+        number = self.templates.get(template)
+        if number is None:
+            number = self.templates[template] = len(self.templates)
+            self.stream.write(chr(TAG_TEMPLATE))
+            self._write_arg(template)
+        write_varint(self.stream, number + 1)  # 0 is the tag of template definition
+        write_varint(self.stream, len(args))
+        for arg in args:
+            self._write_arg(arg)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+        logging.Handler.close(self)
+
+
+def _read_arg(stream, recent):
+    tag = ord(stream.read(1))
+    if tag == TAG_NONE:
+        return None
+    if tag == TAG_INT:
+        value = read_varint(stream)
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+    if tag == TAG_FLOAT:
+        return DOUBLE.unpack(stream.read(DOUBLE.size))[0]
+    if tag == TAG_RECENT:
+        return recent.get(read_varint(stream))
+    value = stream.read(read_varint(stream))
+    if tag == TAG_UNICODE:
+        value = value.decode('utf-8')
+    if len(value) <= RECENT_MAX_LENGTH:
+        recent.add(value)
+    return value
+
+
+def read_binary_trace(stream):
+    """
+    Generator of messages stored by `BinaryTraceHandler`.
+
+    Returns: formatted message (without newline)
+
+    """
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError('not a binary trace')
+    templates = []
+    recent = RecentStrings()
+    while True:
+        try:
+            number = read_varint(stream)
+        except EOFError:
+            break
+        if number == TAG_TEMPLATE:
+            templates.append(_read_arg(stream, recent))
+            continue
+        template = templates[number - 1]
+        args = tuple(_read_arg(stream, recent) for _ in range(read_varint(stream)))
+        yield template % args if args else template
+
+
+def render_binary_trace(stream, output):
+    """Write text trace of binary trace `stream` to `output`."""
+    for msg in read_binary_trace(stream):
+        if isinstance(msg, unicode):
+            msg = msg.encode('utf-8')
+        output.write(msg + '\n')
+
+
+class QueueWriter(logging.Handler):
+    """
+    Queue log records and pass them to `handlers` in batches from a background thread.
+
+    Queueing a record is a single `deque.append`, messages are formatted later (only if some
+    of `handlers` accepts them). Arguments of queued records must not change after logging.
+    When the queue reaches `max_records` (the background thread can't keep up), the logging thread
+    writes the queue itself.
+    """
+
+    def __init__(self, handlers, flush_interval=0.1, max_records=100000):
+        """
+        Args:
+            handlers (list): handlers writing the records (each with its own level)
+            flush_interval (float): seconds between batches
+            max_records (int): max number of queued records
+
+        """
+        logging.Handler.__init__(self, min(handler.level for handler in handlers))
+        self.handlers = handlers
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.records = deque()
+        self.flush_lock = threading.Lock()  # one batch at a time, to keep the order of records
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def handle(self, record):
+        # no lock needed, deque.append is atomic
+        if record.levelno >= self.level:
+            self.records.append(record)
+            if len(self.records) >= self.max_records:
+                self.flush()
+
+    def _run(self):
+        while not self.stopped:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Pass all queued records to the handlers and flush them."""
+        records = self.records
+        if not records:
+            return
+        with self.flush_lock:
+            while True:
+                try:
+                    record = records.popleft()
+                except IndexError:
+                    break
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                handler.flush()
+
+    def close(self):
+        if not self.stopped:
+            self.stopped = True
+            if self.thread is not threading.current_thread() and self.thread.is_alive():
+                self.thread.join()
+            self.flush()
+            for handler in self.handlers:
+                handler.close()
+        logging.Handler.close(self)
+
+
+def configure(logger, stderr_level='full', file_level='debug', file_path='evaluator.log', binary=False, append=True):
+    """
+    Send trace of `logger` through a `QueueWriter` to stderr and to a file.
+
+    Args:
+        logger (logging.Logger): logger to configure (its previous handlers are removed)
+        stderr_level (str): trace level of stderr (key of `TRACE_LEVELS`)
+        file_level (str): trace level of the file (key of `TRACE_LEVELS`)
+        file_path (str): path of the file trace
+        binary (bool): store the file trace in the binary format
+        append (bool): append the text trace to the file instead of overwriting it
+
+    Returns:
+        QueueWriter (close it at the end to write all records)
+
+    """
+    # don't collect information never shown in the trace
+    logging._srcfile = None
+    logging.logThreads = 0
+    logging.logProcesses = 0
+
+    handlers = [TextTraceHandler(sys.stderr, TRACE_LEVELS[stderr_level])]
+    if file_level != 'off':
+        if binary:
+            handlers.append(BinaryTraceHandler(file_path, TRACE_LEVELS[file_level]))
+        else:
+            handlers.append(TextTraceHandler(open(file_path, 'a' if append else 'w'), TRACE_LEVELS[file_level]))
+    writer = QueueWriter(handlers)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(writer)
+    logger.setLevel(writer.level)  # records nobody wants are not even created
+    # the trace goes only to its own outputs, not to handlers of the root logger (e.g. of `logging.basicConfig`)
+    logger.propagate = False
+    return writer
+
+
+if __name__ == '__main__':
+    program = os.path.basename(sys.argv[0])
+    parser = argparse.ArgumentParser(
+        prog=program,
+        formatter_class=argparse.RawTextHelpFormatter,
+        description=globals()['__doc__'])
+    parser.add_argument('trace', help="path to a binary trace")
+
+    args = parser.parse_args()
+    with open(args.trace, 'rb') as trace:
+        render_binary_trace(trace, sys.stdout)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Transcript of a simulation: everything the contestants' script answered, in order, with the context
+the evaluator used to judge it. Replaying it with rescore.py gives the same results as the simulation.
+
+The transcript is a gzipped text file (of several gzip members when the simulation made checkpoints,
+see checkpoint.py). The first line is a JSON header, every other line is a record
+of tab separated fields:
+    kind    `m` message of contestants' script, `n` no answer, `x` contestants' script exited
+    sent    number of events sent to contestants' script since the previous record
+    line_id id of the oldest event waiting for acknowledgement (-1 after the last event)
+    inner   timestamps of the penultimate (or last acknowledged) and last sent event (`-` for none)
+    data    the message (kind `m`) or JSON [exit code, stderr tail] (kind `x`)
+"""
+
+import gzip
+import json
+
+
+TRANSCRIPT_VERSION = 1
+
+
+def _timestamp(value):
+    return '-' if value is None else str(value)
+
+
+def _parse_timestamp(value):
+    return None if value == '-' else int(value)
+
+
+class TranscriptWriter(object):
+    """Record answers of contestants' script passed to `Evaluator.process_msg`."""
+
+    def __init__(self, path, resume=None, **header):
+        """
+        Args:
+            path: path of the transcript (gzipped)
+            resume: continue the transcript from a checkpoint, result of `checkpoint` (see checkpoint.py)
+            header: information about the simulation stored in the header (log, window, command, ...)
+
+        """
+        if resume is None:
+            self.raw = open(path, 'wb')
+            self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=1)
+            header['version'] = TRANSCRIPT_VERSION
+            self.file.write(json.dumps(header) + '\n')
+            self.sent = 0  # events sent since the last record
+        else:
+            # drop records written after the checkpoint, continue with a new gzip member
+            offset, self.sent = resume
+            self.raw = open(path, 'r+b')
+            self.raw.truncate(offset)
+            self.raw.seek(offset)
+            self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=1)
+
+    def _record(self, kind, line_id, timestamps, data):
+        self.file.write('%s\t%i\t%i\t%s\t%s\t%s\n' % (
+            kind, self.sent, line_id, _timestamp(timestamps[0]), _timestamp(timestamps[1]), data))
+        self.sent = 0
+
+    def message(self, msg, line_id, timestamps):
+        """
+        Args:
+            msg (str): message of contestants' script (None for no answer)
+            line_id (int): id of the oldest event waiting for acknowledgement
+            timestamps (list): `Evaluator.last_two_timestamps` when the message came
+
+        """
+        if msg is None:
+            self._record('n', line_id, timestamps, '')
+        else:
+            self._record('m', line_id, timestamps, msg.rstrip('\r\n'))
+
+    def exited(self, returncode, stderr_tail, timestamps):
+        """Contestants' script exited, all remaining events are not reported."""
+        self._record('x', -1, timestamps, json.dumps([returncode, stderr_tail]))
+
+    def checkpoint(self):
+        """
+        Finish the current gzip member, so that the transcript can be cut here and continued by another writer.
+
+        Returns:
+            (length of the transcript file, events sent since the last record)
+
+        """
+        self.file.close()
+        self.raw.flush()
+        position = (self.raw.tell(), self.sent)
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=1)
+        return position
+
+    def close(self):
+        self.file.close()
+        self.raw.close()
+
+
+def read_transcript(path):
+    """
+    Args:
+        path: path of a transcript written by `TranscriptWriter`
+
+    Returns:
+        (header, generator of records (kind, sent, line_id, [timestamp, timestamp], data))
+
+    """
+    transcript = gzip.open(path, 'rb')
+    header = json.loads(transcript.readline())
+    if header.get('version') != TRANSCRIPT_VERSION:
+        raise ValueError('%s: unsupported transcript version %s' % (path, header.get('version')))
+
+    def records():
+        with transcript:
+            for line in transcript:
+                kind, sent, line_id, older, newer, data = line.rstrip('\n').split('\t', 5)
+                if kind == 'n':
+                    data = None
+                elif kind == 'x':
+                    data = json.loads(data)
+                yield kind, int(sent), int(line_id), [_parse_timestamp(older), _parse_timestamp(newer)], data
+
+    return header, records()
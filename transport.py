@@ -0,0 +1,727 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Channels between the evaluator and contestants' scripts (./evaluator.py --transport). Messages are the same lines
+in all of them (events, reports, `ok`, `exit`, ...), only the way they travel differs:
+
+    pipe    stdin and stdout of the script (default)
+    socket  Unix domain socket at $RAREBOT_SOCKET, every message is a frame: its length (4 bytes, big-endian)
+            followed by its lines; the evaluator sends one frame per event, the script one frame per flush
+    ring    two ring buffers in a shared memory file at $RAREBOT_RING, for scripts on the same host; stdin
+            and stdout of the script only carry 1-byte wake-ups, sent only when the other side sleeps
+
+Scripts get the transport in $RAREBOT_TRANSPORT, `connect` opens the channel of any of them:
+
+    channel = transport.connect()
+    line = channel.readline()  # '' when the evaluator is gone
+    channel.write('ok\\n')
+    channel.flush()
+
+With `socket`, stdin of the script is empty and its stdout is merged with stderr. With `ring`, stdin and stdout
+of the script belong to the channel, write messages for humans to stderr.
+
+Layout of the ring file (all numbers little-endian):
+    magic               8 bytes `RBRING01`
+    capacity            uint64, bytes of each ring
+    ring 0 (to the script) and ring 1 (from the script), 64 bytes each at offsets 64 and 128:
+        head            uint64, bytes written since the start
+        tail            uint64, bytes read since the start
+        reader waiting  uint32, the reader sleeps until a wake-up
+        writer waiting  uint32, the writer sleeps until a wake-up (the ring is full)
+    data of ring 0 at offset 256, data of ring 1 right after it
+"""
+
+import os
+import sys
+import time
+import mmap
+import errno
+import fcntl
+import select
+import shutil
+import socket
+import struct
+import tempfile
+import multiprocessing
+from collections import deque
+from subprocess import PIPE, STDOUT, Popen
+
+
+TRANSPORTS = ('pipe', 'socket', 'ring')
+TRANSPORT_ENV = 'RAREBOT_TRANSPORT'
+SOCKET_ENV = 'RAREBOT_SOCKET'
+RING_ENV = 'RAREBOT_RING'
+
+FRAME_LENGTH = struct.Struct('>I')
+RING_MAGIC = b'RBRING01'
+RING_CAPACITY = 1 << 20
+RING_DATA_OFFSET = 256
+COUNTER = struct.Struct('<Q')
+FLAG = struct.Struct('<I')
+WAKE_UP = b'\0'
+
+
+def _set_non_blocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+
+def _read_chunk(fd, size):
+    try:
+        return os.read(fd, size)
+    except OSError as e:
+        if e.errno == errno.EAGAIN:
+            return None
+        raise
+
+
+def _wake_up(fd):
+    """
+    Returns:
+        False if the other side closed `fd`
+    """
+    try:
+        os.write(fd, WAKE_UP)
+    except OSError as e:
+        if e.errno == errno.EPIPE:
+            return False
+        # EAGAIN: the pipe is full of wake-ups already
+        if e.errno != errno.EAGAIN:
+            raise
+    return True
+
+
+def _select(rlist, wlist, timeout):
+    try:
+        readable, writable, _ = select.select(rlist, wlist, [], timeout)
+    except select.error as e:
+        if e.args[0] == errno.EINTR:
+            return [], []
+        raise
+    return readable, writable
+
+
+class ContestantChannel(object):
+    """
+    Line-oriented channel to contestants' script, base of transports.
+
+    All file descriptors are non-blocking and driven by `select`, so there is no reader thread and waiting
+    for an answer takes exactly as long as the contestants' script needs (or the time limit). Stderr is drained
+    as well, only its tail is kept for the final report. Transports implement `_serve` (and `_wait_fds`).
+    """
+
+    read_size = 65536
+    stderr_tail_size = 4096  # bytes of stderr kept for the final report
+
+    def __init__(self, process, stderr):
+        """
+        Args:
+            process (Popen): contestants' script
+            stderr: pipe with stderr of the script
+        """
+        self.process = process
+        self.stderr_fd = stderr.fileno()
+        _set_non_blocking(self.stderr_fd)
+        self.pending_output = bytearray()  # bytes sent, but not accepted by the channel yet
+        self.partial_line = b''  # incomplete line received
+        self.lines = deque()  # complete lines received, including `\n`
+        self.stderr = bytearray()  # tail of stderr
+        self.eof = False  # contestants' script closed its end of the channel
+        self.stderr_eof = False
+        self.broken = False  # contestants' script doesn't accept messages anymore
+        self.encoder = None  # CompactEncoder of events for the `compact` wire format (None for JSON lines)
+        self.clock = None  # CpuClock of the script for CPU time limits (None for wall-clock limits, see budget.py)
+
+    def send(self, data):
+        """
+        Queue `data` for contestants' script and pass as much of it as the channel accepts.
+
+        Args:
+            data (str): serialized message including `\n`
+        """
+        if self.broken:
+            return
+        self.pending_output += data
+        self._write()
+
+    def _write(self):
+        raise NotImplementedError
+
+    def _received(self, chunk):
+        """Split received bytes to lines, `chunk` is empty at the end of the channel."""
+        if not chunk:
+            self.eof = True
+            if self.partial_line:
+                self.lines.append(self.partial_line)
+                self.partial_line = b''
+            return
+        lines = (self.partial_line + chunk).split(b'\n')
+        self.partial_line = lines.pop()
+        self.lines.extend(line + b'\n' for line in lines)
+
+    def _read_stderr(self):
+        chunk = _read_chunk(self.stderr_fd, self.read_size)
+        if chunk is None:
+            return
+        if not chunk:
+            self.stderr_eof = True
+            return
+        self.stderr += chunk
+        del self.stderr[:-self.stderr_tail_size]
+
+    def _wait_fds(self):
+        """
+        Returns:
+            (file descriptors to wait for reading, file descriptors to wait for writing) of the channel
+        """
+        raise NotImplementedError
+
+    def _serve(self, readable, writable):
+        """Pass data through the channel, `readable` and `writable` are ready file descriptors."""
+        raise NotImplementedError
+
+    def _wait(self, timeout):
+        """Wait at most `timeout` seconds for the channel or stderr to be ready and serve them."""
+        rlist, wlist = self._wait_fds()
+        if not self.stderr_eof:
+            rlist.append(self.stderr_fd)
+        if not rlist and not wlist:
+            return
+        readable, writable = _select(rlist, wlist, timeout)
+        self._serve(readable, writable)
+        if self.stderr_fd in readable:
+            self._read_stderr()
+
+    def receive(self, deadline):
+        """
+        Wait for the next line written by contestants' script, writing pending input meanwhile.
+
+        Args:
+            deadline (float): `time.time()` after which we stop waiting
+
+        Returns:
+            line including `\n` (None if there is no answer until `deadline` or the channel was closed)
+
+        """
+        while not self.lines and not self.eof:
+            timeout = deadline - time.time()
+            if timeout < 0:
+                return None
+            self._wait(timeout)
+        if self.lines:
+            return self.lines.popleft()
+        return None
+
+    def exited(self):
+        """
+        Returns:
+            True if contestants' script can't answer anymore (it closed the channel or it isn't running)
+        """
+        return self.eof or self.broken or self.process.poll() is not None
+
+    def wait_exit(self, grace_time):
+        """
+        Give contestants' script `grace_time` seconds to finish, kill it afterwards and collect its stderr.
+
+        Returns:
+            exit code of contestants' script
+
+        """
+        deadline = time.time() + grace_time
+        while self.process.poll() is None and time.time() < deadline:
+            self._wait(0.01)
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        while not self.stderr_eof and time.time() < deadline:
+            self._wait(deadline - time.time())
+        return self.process.returncode
+
+    def stderr_tail(self, lines=10):
+        """
+        Returns:
+            list of last `lines` lines written by contestants' script to stderr
+        """
+        return bytes(self.stderr).splitlines()[-lines:]
+
+    def close(self):
+        """Remove files of the channel (after the script exited)."""
+
+
+class ContestantPipe(ContestantChannel):
+    """Channel over stdin/stdout pipes of contestants' script."""
+
+    def __init__(self, process):
+        """
+        Args:
+            process (Popen): contestants' script started with `stdin=PIPE, stdout=PIPE, stderr=PIPE`
+        """
+        ContestantChannel.__init__(self, process, process.stderr)
+        self.stdin_fd = process.stdin.fileno()
+        self.stdout_fd = process.stdout.fileno()
+        for fd in (self.stdin_fd, self.stdout_fd):
+            _set_non_blocking(fd)
+
+    def _write(self):
+        while self.pending_output:
+            try:
+                written = os.write(self.stdin_fd, self.pending_output)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return
+                if e.errno == errno.EPIPE:
+                    self.broken = True
+                    del self.pending_output[:]
+                    return
+                raise
+            del self.pending_output[:written]
+
+    def _wait_fds(self):
+        return [] if self.eof else [self.stdout_fd], [self.stdin_fd] if self.pending_output else []
+
+    def _serve(self, readable, writable):
+        if writable:
+            self._write()
+        if self.stdout_fd in readable:
+            chunk = _read_chunk(self.stdout_fd, self.read_size)
+            if chunk is not None:
+                self._received(chunk)
+
+
+class ContestantSocket(ContestantChannel):
+    """Channel over a Unix domain socket with length-prefixed frames, the script connects to `path`."""
+
+    def __init__(self, process, listener, path):
+        """
+        Args:
+            process (Popen): contestants' script started with `stdout=PIPE, stderr=STDOUT`
+            listener (socket.socket): listening socket at `path`
+            path: path of the socket in its own temporary directory
+
+        """
+        ContestantChannel.__init__(self, process, process.stdout)
+        self.listener = listener
+        self.path = path
+        self.connection = None
+        self.received = bytearray()  # bytes of incomplete frames
+
+    def send(self, data):
+        ContestantChannel.send(self, FRAME_LENGTH.pack(len(data)) + data)
+
+    def _write(self):
+        if self.connection is None:
+            return
+        while self.pending_output:
+            try:
+                written = self.connection.send(self.pending_output)
+            except socket.error as e:
+                if e.errno == errno.EAGAIN:
+                    return
+                if e.errno in (errno.EPIPE, errno.ECONNRESET):
+                    self.broken = True
+                    del self.pending_output[:]
+                    return
+                raise
+            del self.pending_output[:written]
+
+    def _read(self):
+        try:
+            chunk = self.connection.recv(self.read_size)
+        except socket.error as e:
+            if e.errno == errno.EAGAIN:
+                return
+            if e.errno != errno.ECONNRESET:
+                raise
+            chunk = b''
+        if not chunk:
+            self._received(b'')
+            return
+        received = self.received
+        received += chunk
+        start = 0
+        while len(received) - start >= FRAME_LENGTH.size:
+            length = FRAME_LENGTH.unpack_from(received, start)[0]
+            end = start + FRAME_LENGTH.size + length
+            if end > len(received):
+                break
+            self._received(bytes(received[start + FRAME_LENGTH.size:end]))
+            start = end
+        del received[:start]
+
+    def _wait_fds(self):
+        if self.connection is None:
+            if self.process.poll() is not None:
+                # the script exited without connecting
+                self.eof = True
+                return [], []
+            return [self.listener.fileno()], []
+        fd = self.connection.fileno()
+        return [] if self.eof else [fd], [fd] if self.pending_output else []
+
+    def _serve(self, readable, writable):
+        if self.connection is None:
+            if self.listener.fileno() in readable:
+                self.connection, _ = self.listener.accept()
+                self.connection.setblocking(False)
+                self.listener.close()
+                self._write()
+            return
+        if writable:
+            self._write()
+        if self.connection.fileno() in readable:
+            self._read()
+
+    def close(self):
+        for sock in (self.listener, self.connection):
+            if sock is not None:
+                sock.close()
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+
+class RingBuffer(object):
+    """One direction of the ring file (see the module documentation), a byte stream of lines."""
+
+    def __init__(self, data, number, capacity):
+        self.data = data
+        self.capacity = capacity
+        self.counters = 64 * (number + 1)
+        self.start = RING_DATA_OFFSET + number * capacity
+
+    def _counter(self, offset):
+        return COUNTER.unpack_from(self.data, self.counters + offset)[0]
+
+    def _flag(self, offset):
+        return FLAG.unpack_from(self.data, self.counters + offset)[0]
+
+    def _set_flag(self, offset, value):
+        FLAG.pack_into(self.data, self.counters + offset, value)
+
+    @property
+    def reader_waiting(self):
+        return self._flag(16)
+
+    @reader_waiting.setter
+    def reader_waiting(self, value):
+        self._set_flag(16, value)
+
+    @property
+    def writer_waiting(self):
+        return self._flag(20)
+
+    @writer_waiting.setter
+    def writer_waiting(self, value):
+        self._set_flag(20, value)
+
+    def available(self):
+        return self._counter(0) - self._counter(8)
+
+    def write(self, data):
+        """
+        Returns:
+            number of bytes of `data` written (the ring may be full)
+        """
+        head = self._counter(0)
+        size = min(len(data), self.capacity - (head - self._counter(8)))
+        if size <= 0:
+            return 0
+        position = head % self.capacity
+        first = min(size, self.capacity - position)
+        self.data[self.start + position:self.start + position + first] = bytes(data[:first])
+        if first < size:
+            self.data[self.start:self.start + size - first] = bytes(data[first:size])
+        # the data is in place before the reader can see the new head
+        COUNTER.pack_into(self.data, self.counters, head + size)
+        return size
+
+    def read(self):
+        """
+        Returns:
+            all bytes written and not read yet
+        """
+        head, tail = self._counter(0), self._counter(8)
+        if head == tail:
+            return b''
+        position = tail % self.capacity
+        first = min(head - tail, self.capacity - position)
+        chunk = self.data[self.start + position:self.start + position + first]
+        if first < head - tail:
+            chunk += self.data[self.start:self.start + head - tail - first]
+        COUNTER.pack_into(self.data, self.counters + 8, head)
+        return chunk
+
+
+def _open_ring(path):
+    """
+    Returns:
+        (mmap of the ring file at `path`, its capacity)
+    """
+    with open(path, 'r+b') as f:
+        data = mmap.mmap(f.fileno(), 0)
+    if data[:len(RING_MAGIC)] != RING_MAGIC:
+        raise ValueError('%s is not a ring file' % path)
+    return data, COUNTER.unpack_from(data, len(RING_MAGIC))[0]
+
+
+class ContestantRing(ContestantChannel):
+    """
+    Channel over ring buffers in shared memory. A side which finds nothing to read (or no space to write)
+    announces it in the ring and sleeps on its wake-up pipe, the other side wakes it up after writing
+    (or reading). Wake-ups which cross the announcement are caught by sleeping at most `max_sleep` seconds.
+    """
+
+    max_sleep = 0.01
+    # seconds of polling the ring before sleeping (only with several cores, the script can't run meanwhile otherwise)
+    spin_time = 0.00005 if multiprocessing.cpu_count() > 1 else 0.0
+
+    def __init__(self, process, path):
+        """
+        Args:
+            process (Popen): contestants' script started with `stdin=PIPE, stdout=PIPE, stderr=PIPE`
+            path: path of the ring file in its own temporary directory
+
+        """
+        ContestantChannel.__init__(self, process, process.stderr)
+        self.path = path
+        self.data, capacity = _open_ring(path)
+        self.outgoing = RingBuffer(self.data, 0, capacity)
+        self.incoming = RingBuffer(self.data, 1, capacity)
+        self.wake_up_fd = process.stdin.fileno()  # wakes up the script
+        self.woken_fd = process.stdout.fileno()  # the script wakes us up
+        for fd in (self.wake_up_fd, self.woken_fd):
+            _set_non_blocking(fd)
+
+    def _wake_up_script(self):
+        if not _wake_up(self.wake_up_fd):
+            self.broken = True
+            del self.pending_output[:]
+
+    def _write(self):
+        if not self.pending_output:
+            return
+        written = self.outgoing.write(self.pending_output)
+        del self.pending_output[:written]
+        if self.pending_output:
+            # wait for space, the script wakes us up after reading
+            self.outgoing.writer_waiting = 1
+        if written and self.outgoing.reader_waiting:
+            self._wake_up_script()
+
+    def _read(self):
+        chunk = self.incoming.read()
+        if chunk:
+            if self.incoming.writer_waiting:
+                self.incoming.writer_waiting = 0
+                self._wake_up_script()
+            self._received(chunk)
+
+    def _wait(self, timeout):
+        self._read()
+        self._write()
+        if self.lines or self.eof:
+            return
+        deadline = time.time() + min(timeout, self.spin_time)
+        while time.time() < deadline:
+            if self.incoming.available():
+                self._read()
+                return
+        self.incoming.reader_waiting = 1
+        if not self.incoming.available():
+            rlist = [self.woken_fd]
+            if not self.stderr_eof:
+                rlist.append(self.stderr_fd)
+            readable, _ = _select(rlist, [], min(timeout, self.max_sleep))
+            if self.stderr_fd in readable:
+                self._read_stderr()
+            if self.woken_fd in readable:
+                chunk = _read_chunk(self.woken_fd, self.read_size)
+                if chunk == b'':
+                    # the script closed its stdout, read what is left in the ring
+                    self.incoming.reader_waiting = 0
+                    self._read()
+                    self._received(b'')
+                    return
+        self.incoming.reader_waiting = 0
+        self._read()
+        self._write()
+
+    def close(self):
+        self.data.close()
+        shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+
+
+def _create_ring(directory, capacity=RING_CAPACITY):
+    path = os.path.join(directory, 'ring')
+    with open(path, 'wb') as f:
+        f.write(RING_MAGIC + COUNTER.pack(capacity))
+        f.truncate(RING_DATA_OFFSET + 2 * capacity)
+    return path
+
+
+def _shared_memory_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def start_contestant(command, transport='pipe', preexec_fn=None):
+    """
+    Start contestants' script connected by `transport`.
+
+    Args:
+        command (list): contestants' script with its parameters
+        transport (str): one of TRANSPORTS
+        preexec_fn: called in the process of the script before it starts (see `budget.ContestantLimits`)
+
+    Returns:
+        ContestantChannel of the running script
+
+    """
+    close_fds = 'posix' in sys.builtin_module_names
+    env = dict(os.environ)
+    env[TRANSPORT_ENV] = transport
+    if transport == 'pipe':
+        process = Popen(
+            command, stdin=PIPE, stdout=PIPE, stderr=PIPE, bufsize=1, close_fds=close_fds, env=env,
+            preexec_fn=preexec_fn)
+        return ContestantPipe(process)
+    if transport == 'socket':
+        path = os.path.join(tempfile.mkdtemp(prefix='rarebot-'), 'socket')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        env[SOCKET_ENV] = path
+        with open(os.devnull) as devnull:
+            process = Popen(
+                command, stdin=devnull, stdout=PIPE, stderr=STDOUT, close_fds=close_fds, env=env,
+                preexec_fn=preexec_fn)
+        return ContestantSocket(process, listener, path)
+    if transport == 'ring':
+        path = _create_ring(tempfile.mkdtemp(prefix='rarebot-', dir=_shared_memory_dir()))
+        env[RING_ENV] = path
+        process = Popen(
+            command, stdin=PIPE, stdout=PIPE, stderr=PIPE, close_fds=close_fds, env=env, preexec_fn=preexec_fn)
+        return ContestantRing(process, path)
+    raise ValueError('unknown transport %s' % transport)
+
+
+class PipeClient(object):
+    """Script side of the `pipe` transport: stdin and stdout."""
+
+    def __init__(self):
+        self.readline = sys.stdin.readline
+        self.write = sys.stdout.write
+        self.flush = sys.stdout.flush
+
+
+class SocketClient(object):
+    """Script side of the `socket` transport."""
+
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.lines = deque()
+        self.received = b''
+        self.output = []
+
+    def readline(self):
+        while not self.lines:
+            while len(self.received) < FRAME_LENGTH.size or \
+                    len(self.received) < FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(self.received)[0]:
+                chunk = self.socket.recv(65536)
+                if not chunk:
+                    return ''
+                self.received += chunk
+            end = FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(self.received)[0]
+            self.lines.extend(self.received[FRAME_LENGTH.size:end].splitlines(True))
+            self.received = self.received[end:]
+        return self.lines.popleft()
+
+    def write(self, data):
+        self.output.append(data)
+
+    def flush(self):
+        if self.output:
+            data = ''.join(self.output)
+            self.output = []
+            self.socket.sendall(FRAME_LENGTH.pack(len(data)) + data)
+
+
+class RingClient(object):
+    """Script side of the `ring` transport, see `ContestantRing`."""
+
+    max_sleep = ContestantRing.max_sleep
+    spin_time = ContestantRing.spin_time
+
+    def __init__(self, path):
+        self.data, capacity = _open_ring(path)
+        self.incoming = RingBuffer(self.data, 0, capacity)
+        self.outgoing = RingBuffer(self.data, 1, capacity)
+        self.woken_fd = sys.stdin.fileno()
+        self.wake_up_fd = sys.stdout.fileno()
+        self.lines = deque()
+        self.partial_line = b''
+        self.output = []
+
+    def _sleep(self, ring, available):
+        """Sleep until woken up or `available()`, announced in `ring`. Returns False if the evaluator is gone."""
+        deadline = time.time() + self.spin_time
+        while time.time() < deadline:
+            if available():
+                return True
+        ring.reader_waiting = 1
+        try:
+            if available():
+                return True
+            readable, _ = _select([self.woken_fd], [], self.max_sleep)
+            if readable:
+                return os.read(self.woken_fd, 65536) != b''
+            return True
+        finally:
+            ring.reader_waiting = 0
+
+    def readline(self):
+        while not self.lines:
+            chunk = self.incoming.read()
+            if chunk:
+                if self.incoming.writer_waiting:
+                    self.incoming.writer_waiting = 0
+                    _wake_up(self.wake_up_fd)
+                lines = (self.partial_line + chunk).split(b'\n')
+                self.partial_line = lines.pop()
+                self.lines.extend(line + b'\n' for line in lines)
+            elif not self._sleep(self.incoming, self.incoming.available):
+                return ''
+        return self.lines.popleft()
+
+    def write(self, data):
+        self.output.append(data)
+
+    def flush(self):
+        data = ''.join(self.output)
+        self.output = []
+        while data:
+            written = self.outgoing.write(data)
+            data = data[written:]
+            if written and self.outgoing.reader_waiting:
+                _wake_up(self.wake_up_fd)
+            if data:
+                # the ring is full, the evaluator wakes us up after reading
+                self.outgoing.writer_waiting = 1
+                readable, _ = _select([self.woken_fd], [], self.max_sleep)
+                if readable and os.read(self.woken_fd, 65536) == b'':
+                    return
+
+
+def connect():
+    """
+    Open the script side of the transport chosen by the evaluator ($RAREBOT_TRANSPORT).
+
+    Returns:
+        channel with `readline()`, `write(data)` and `flush()`, like stdin and stdout
+    """
+    transport = os.environ.get(TRANSPORT_ENV, 'pipe')
+    if transport == 'socket':
+        return SocketClient(os.environ[SOCKET_ENV])
+    if transport == 'ring':
+        return RingClient(os.environ[RING_ENV])
+    return PipeClient()
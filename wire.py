@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2015 RaRe Technologies s.r.o.
+# All Rights Reserved
+
+"""
+Wire formats of events sent to contestants' scripts. `json` (default) is one JSON object per line.
+
+`compact` (./evaluator.py --wire compact) sends repeated values only once. The first line declares the format
+and the order of fields of events:
+
+    #wire compact 1 user category behaviour connection safe_connection
+
+A value of a field is defined by a line `=FIELD<TAB>VALUE` (VALUE serialized as JSON) before the first event
+with this value, the codes of values of each field are 0, 1, 2, ... in the order of definitions:
+
+    =user<TAB>"Renetta"
+    =category<TAB>"gamma"
+
+An event is a line of tab-separated integers: its id, unix timestamp and codes of the declared fields:
+
+    2887<TAB>1452991151<TAB>0<TAB>0<TAB>3<TAB>17<TAB>1
+
+Only event lines are acknowledged. Events with other fields than the declared ones are sent as JSON lines,
+`exit` and `reset` lines are the same as with the `json` format. Codes are kept for the whole run of the script,
+also across `reset` lines.
+
+`CompactDecoder` decodes both formats to the same dicts:
+
+    decoder = CompactDecoder()
+    for line in sys.stdin:
+        if line.strip() in ('exit', 'reset'):
+            ...
+        activity_log = decoder.decode(line)
+        if activity_log is None:
+            continue  # a definition, not an event
+        ...
+"""
+
+import json
+
+
+WIRE_FORMATS = ('json', 'compact')
+COMPACT_VERSION = 1
+COMPACT_FIELDS = ('user', 'category', 'behaviour', 'connection', 'safe_connection')
+EVENT_FIELDS = frozenset(('id', 'unix_timestamp') + COMPACT_FIELDS)
+
+
+class CompactEncoder(object):
+    """Encoding of events serialized as JSON to the `compact` format, with codes of all values sent so far."""
+
+    max_combinations = 1 << 16  # number of remembered combinations of values of events
+
+    def __init__(self):
+        # values are keyed with their type, to distinguish values equal in Python, but different in JSON (1 and true)
+        self.codes = [{} for _ in COMPACT_FIELDS]  # dict (type, value)=>code for each field
+        self.combinations = {}  # dict tuple of keys of values of COMPACT_FIELDS=>their codes as a part of event lines
+
+    def header(self):
+        return '#wire compact %i %s\n' % (COMPACT_VERSION, ' '.join(COMPACT_FIELDS))
+
+    def encode(self, event_string):
+        """
+        Args:
+            event_string (str): event serialized as JSON
+
+        Returns:
+            lines to send for the event (definitions of new values and the event), including newlines
+
+        """
+        data = json.loads(event_string)
+        if len(data) != len(EVENT_FIELDS) or not EVENT_FIELDS.issuperset(data):
+            # fields not known to the decoder
+            return event_string + '\n'
+        values = tuple(map(data.get, COMPACT_FIELDS))
+        keys = tuple((type(value), value) for value in values)
+        try:
+            codes = self.combinations.get(keys)
+        except TypeError:
+            # lists and objects are not encoded
+            return event_string + '\n'
+        line = '%i\t%i\t' % (data['id'], data['unix_timestamp'])
+        if codes is not None:
+            return line + codes
+        lines = []
+        parts = []
+        for field, field_codes, key, value in zip(COMPACT_FIELDS, self.codes, keys, values):
+            code = field_codes.get(key)
+            if code is None:
+                code = field_codes[key] = len(field_codes)
+                lines.append('=%s\t%s\n' % (field, json.dumps(value)))
+            parts.append(str(code))
+        if len(self.combinations) >= self.max_combinations:
+            self.combinations.clear()
+        codes = self.combinations[keys] = '\t'.join(parts) + '\n'
+        lines.append(line + codes)
+        return ''.join(lines)
+
+
+class CompactDecoder(object):
+    """Decoding of lines of events in `json` or `compact` format (see the module documentation)."""
+
+    max_combinations = 1 << 16  # number of remembered combinations of codes of events
+
+    def __init__(self):
+        self.fields = None
+        self.values = {}  # dict field=>list of values, index is the code
+        self.columns = []  # lists of values of `fields`, in the order of fields of events
+        self.combinations = {}  # dict codes of an event line=>dict of their values
+
+    def decode(self, line):
+        """
+        Args:
+            line (str): line read from stdin (not `exit` or `reset`)
+
+        Returns:
+            event as dict (the same as `json.loads` of the `json` format), None for lines which are not events
+
+        """
+        first = line[:1]
+        if first.isdigit():
+            event_id, timestamp, codes = line.split('\t', 2)
+            values = self.combinations.get(codes)
+            if values is None:
+                if len(self.combinations) >= self.max_combinations:
+                    self.combinations.clear()
+                values = self.combinations[codes] = dict(zip(self.fields, [
+                    column[int(code)] for column, code in zip(self.columns, codes.split('\t'))]))
+            activity_log = values.copy()
+            activity_log['id'] = int(event_id)
+            activity_log['unix_timestamp'] = int(timestamp)
+            return activity_log
+        if first == '{':
+            return json.loads(line)
+        if first == '=':
+            field, value = line[1:].rstrip('\n').split('\t', 1)
+            self.values[field].append(json.loads(value))
+            return None
+        if first == '#':
+            parts = line.split()
+            if parts[:2] != ['#wire', 'compact'] or int(parts[2]) != COMPACT_VERSION:
+                raise ValueError('unsupported wire format: %s' % line.strip())
+            self.fields = parts[3:]
+            self.values = dict((field, []) for field in self.fields)
+            self.columns = [self.values[field] for field in self.fields]
+            self.combinations = {}
+            return None
+        raise ValueError('unexpected line: %s' % line.strip())